@@ -0,0 +1,49 @@
+"""
+共享转换缓存的测试：多个连接（线程、进程）打开同一缓存文件
+"""
+
+import sqlite3
+import threading
+
+from wechat_format.cache import ConversionCache
+
+
+def total_size(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT SUM(size) FROM entries').fetchone()[0] or 0
+
+
+def test_second_connection_reads_entries(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    assert ConversionCache(path).put('a', {'inline': '<p>a</p>'})
+
+    # 另一个实例（另一个进程）和另一个线程各自打开新的连接
+    other = ConversionCache(path)
+    assert other.get('a') == {'inline': '<p>a</p>'}
+    results = []
+    thread = threading.Thread(target=lambda: results.append(other.get('a')))
+    thread.start()
+    thread.join()
+    assert results == [{'inline': '<p>a</p>'}]
+
+
+def test_total_size_is_tracked_across_connections(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = ConversionCache(path), ConversionCache(path)
+    first.put('a', {'inline': 'a' * 100})
+    second.put('b', {'inline': 'b' * 200})
+    first.put('a', {'inline': 'c' * 300})
+    assert ConversionCache(path).stats()['bytes'] == total_size(path)
+    assert second.stats()['entries'] == 2
+
+
+def test_old_cache_file_is_summed_once(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            'CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'size INTEGER NOT NULL, accessed REAL NOT NULL)'
+        )
+        conn.execute("INSERT INTO entries VALUES ('old', x'00', 123, 0)")
+    assert ConversionCache(path).stats()['bytes'] == 123
+    assert ConversionCache(path).stats()['bytes'] == 123
@@ -0,0 +1,71 @@
+"""
+CF_HTML 剪切板数据的测试：头部的偏移量必须是 UTF-8 字节偏移
+"""
+
+import re
+
+import pytest
+
+from wechat_format.clipboard import build_cf_html
+
+
+HEADER_RE = re.compile(
+    rb'Version:0\.9\n'
+    rb'StartHTML:(\d{10})\n'
+    rb'EndHTML:(\d{10})\n'
+    rb'StartFragment:(\d{10})\n'
+    rb'EndFragment:(\d{10})\n'
+)
+
+
+def parse(payload: bytes):
+    """解析头部，返回 (头部长度, StartHTML, EndHTML, StartFragment, EndFragment)"""
+    match = HEADER_RE.match(payload)
+    assert match is not None, payload[:120]
+    return (match.end(),) + tuple(int(value) for value in match.groups())
+
+
+FRAGMENTS = [
+    '<p>hello</p>',
+    '<p style="color:#333">微信公众号排版：中文、標點。</p>',
+    '<p>表情 😀👍🏽 和组合符 👨‍👩‍👧</p>',
+    '<section><h1>日本語のテキスト</h1><p>한국어 문장</p></section>',
+    '',
+]
+
+
+@pytest.mark.parametrize('fragment', FRAGMENTS)
+def test_offsets_are_byte_offsets(fragment):
+    payload = build_cf_html(fragment)
+    header_size, start_html, end_html, start_fragment, end_fragment = parse(payload)
+
+    assert start_html == header_size
+    assert payload[start_html:].startswith(b'<!DOCTYPE html>')
+    assert end_html == len(payload)
+    assert payload[:start_fragment].endswith(b'<!--StartFragment-->')
+    assert payload[end_fragment:].startswith(b'<!--EndFragment-->')
+    assert payload[start_fragment:end_fragment] == fragment.encode('utf-8')
+    assert payload[start_fragment:end_fragment].decode('utf-8') == fragment
+
+
+def test_offsets_differ_from_character_offsets():
+    fragment = '<p>中文😀</p>'
+    _, _, _, start_fragment, end_fragment = parse(build_cf_html(fragment))
+    assert end_fragment - start_fragment == len(fragment.encode('utf-8')) != len(fragment)
+
+
+def test_header_length_is_fixed():
+    sizes = {parse(build_cf_html(fragment))[0] for fragment in FRAGMENTS + ['x' * 5_000_000]}
+    assert len(sizes) == 1
+
+
+@pytest.mark.parametrize('fragment, expected', [
+    ('<p>a</p>\n<p>b</p>\n', '<p>a</p><p>b</p>'),
+    ('<p>a</p>\r\n<p>中文</p>\r\n', '<p>a</p><p>中文</p>'),
+    ('<p>行一\r行二</p>', '<p>行一行二</p>'),
+])
+def test_newlines_are_removed_from_fragment(fragment, expected):
+    payload = build_cf_html(fragment)
+    _, _, end_html, start_fragment, end_fragment = parse(payload)
+    assert payload[start_fragment:end_fragment] == expected.encode('utf-8')
+    assert end_html == len(payload)
@@ -0,0 +1,284 @@
+"""
+紧凑输出的视觉等价测试
+
+按 CSS 的空白处理规则（块级元素两侧的空白不显示、连续空白折叠为一个空格、
+保留空白的元素内原样显示）计算 HTML 呈现的文本，比较压缩前后是否一致。
+"""
+
+import os
+import re
+from html.parser import HTMLParser
+
+import pytest
+
+from wechat_format.compact import compact_html, compact_style, size_report
+from wechat_format.converter import ENGINES, WeChatFormatter
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BLOCK_TAGS = {
+    'html', 'head', 'body', 'div', 'section', 'article', 'header', 'footer', 'p', 'blockquote',
+    'pre', 'hr', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'dl', 'dt', 'dd',
+    'table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td', 'caption',
+}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+HIDDEN_TAGS = {'head', 'script', 'style', 'title'}
+PRESERVE_STYLE_RE = re.compile(r'white-space\s*:\s*(pre|pre-wrap|pre-line|break-spaces)\b', re.I)
+SPACE_RE = re.compile(r'[ \t\n\r\f]+')
+
+
+class _Renderer(HTMLParser):
+    """把 HTML 拆成 (类型, 文本) 片段：break 为块级边界，pre 为原样显示的文本，text 为会折叠空白的文本"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self.tags = []
+        # 每层元素：(是否保留空白, 是否隐藏)
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.append(tag)
+        preserve, hidden = self.stack[-1] if self.stack else (False, False)
+        style = dict(attrs).get('style') or ''
+        preserve = preserve or tag in ('pre', 'textarea') or bool(PRESERVE_STYLE_RE.search(style))
+        if tag in BLOCK_TAGS:
+            self.pieces.append(('break', ''))
+        if tag not in VOID_TAGS:
+            self.stack.append((preserve, hidden or tag in HIDDEN_TAGS))
+        elif tag == 'img':
+            # 图片是行内内容，参与空白的判断
+            self.pieces.append(('pre', '[img]'))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        if tag not in VOID_TAGS and self.stack:
+            self.stack.pop()
+        if tag in BLOCK_TAGS:
+            self.pieces.append(('break', ''))
+
+    def handle_data(self, data):
+        preserve, hidden = self.stack[-1] if self.stack else (False, False)
+        if not hidden:
+            self.pieces.append(('pre' if preserve else 'text', data))
+
+
+def rendered(html: str):
+    """HTML 呈现的文本和标签序列"""
+    renderer = _Renderer()
+    renderer.feed(html)
+    renderer.close()
+
+    out = []
+    pending_space = False
+    line_start = True
+
+    def emit(text):
+        nonlocal pending_space, line_start
+        if pending_space and not line_start:
+            out.append(' ')
+        out.append(text)
+        pending_space = False
+        line_start = False
+
+    for kind, text in renderer.pieces:
+        if kind == 'break':
+            if not line_start:
+                out.append('\n')
+            pending_space = False
+            line_start = True
+        elif kind == 'pre':
+            if text:
+                emit(text)
+        else:
+            # split 的各段之间是一段空白
+            for index, piece in enumerate(SPACE_RE.split(text)):
+                if index:
+                    pending_space = True
+                if piece:
+                    emit(piece)
+    return ''.join(out), renderer.tags
+
+
+def assert_visually_equal(before: str):
+    after = compact_html(before)
+    assert rendered(after) == rendered(before), after
+    return after
+
+
+@pytest.mark.parametrize('html, expected', [
+    ('<pre>   a\n  b  \n</pre>', '<pre>   a\n  b  \n</pre>'),
+    ('<pre><code>x</code>\n\n</pre>', '<pre><code>x</code>\n\n</pre>'),
+    ('<p style="white-space:pre">a    b</p>', '<p style="white-space:pre">a    b</p>'),
+    ('<section style="white-space: pre-wrap"><span>  x  </span>\n</section>',
+     '<section style="white-space:pre-wrap"><span>  x  </span>\n</section>'),
+    ('<textarea>  a\n</textarea>', '<textarea>  a\n</textarea>'),
+])
+def test_preserved_whitespace_is_unchanged(html, expected):
+    assert assert_visually_equal(html) == expected
+
+
+@pytest.mark.parametrize('html', [
+    '<div>  <p>  a   b  </p>  </div>',
+    '<p>a <strong>b</strong> c</p>\n\n<p>d</p>',
+    '<p>a<span> </span>b</p>',
+    '<ul>\n  <li>one</li>\n  <li>two <em>2</em></li>\n</ul>',
+    '<p>x</p>\n<pre>  code\n</pre>\n<p> y </p>',
+    '<div style="white-space:pre-line"><p>a\n  b</p></div><p>c   d</p>',
+    '<blockquote>\n<p>quote <img src="a.png"> text</p>\n</blockquote>',
+])
+def test_collapsed_whitespace_is_visually_equal(html):
+    after = assert_visually_equal(html)
+    assert len(after) <= len(html)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('inline_style', [True, False])
+def test_converted_demo_is_visually_equal(engine, inline_style):
+    with open(os.path.join(ROOT, 'wechat_demo.md'), encoding='utf-8') as f:
+        markdown_text = f.read()
+    html = WeChatFormatter(engine=engine).convert(markdown_text, inline_style=inline_style)
+    after = assert_visually_equal(html)
+    assert size_report(html, after)['after'] < len(html.encode('utf-8'))
+
+
+def test_colour_names_inside_quotes_are_kept():
+    style = 'font-family: "Black Ops One", white; color: black'
+    assert compact_style(style) == 'font-family:"Black Ops One",white;color:#000'
+
+
+def test_quoted_strings_are_not_normalised():
+    assert compact_style('content: "a  ,  0px #FFFFFF"') == 'content:"a  ,  0px #FFFFFF"'
+    assert compact_style("font-family: 'My  Font' , serif") == "font-family:'My  Font',serif"
+
+
+def test_colours_are_shortened_in_colour_properties():
+    style = ('color: #FFFFFF; background-color: White; border: 1px solid #AABBCC; '
+             'border-left-color: black; box-shadow: 0px 0px 2px #000000')
+    assert compact_style(style) == (
+        'color:#fff;background-color:#fff;border:1px solid #abc;'
+        'border-left-color:#000;box-shadow:0 0 2px #000'
+    )
+
+
+def test_other_properties_keep_colour_words():
+    assert compact_style('font-family: White Rabbit') == 'font-family:White Rabbit'
+    assert compact_style('list-style-type: black') == 'list-style-type:black'
+
+
+INHERITED_PROPS = ('color', 'font-size', 'font-weight', 'font-style', 'line-height', 'letter-spacing')
+# 浏览器默认样式给这些标签设置的可继承属性
+UA_DEFAULTS = {'a': {'color'}, 'b': {'font-weight'}, 'strong': {'font-weight'}, 'em': {'font-style'},
+               'i': {'font-style'}, 'small': {'font-size'}, 'big': {'font-size'}}
+ABSOLUTE_TOKEN_RE = re.compile(r'-?(?:\d+|\d*\.\d+)(?:px|pt)?|#[0-9a-f]{3,8}|[a-z-]+', re.I)
+KEYWORDS_RELATIVE_TO_PARENT = {'smaller', 'larger', 'bolder', 'lighter'}
+
+
+def _resolve(parent, value):
+    """继承链上的计算值：绝对值与父元素无关，其余（em、%、smaller 等）都按依赖父元素处理"""
+    tokens = re.split(r'[\s,]+', value.strip())
+    if all(ABSOLUTE_TOKEN_RE.fullmatch(token) and token.lower() not in KEYWORDS_RELATIVE_TO_PARENT
+           for token in tokens):
+        return value
+    return (parent, value)
+
+
+class _StyleTracker(HTMLParser):
+    """计算每个元素处可继承属性的值"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = [{}]
+        self.computed = []
+
+    def handle_starttag(self, tag, attrs):
+        parent = self.stack[-1]
+        declared = {}
+        for declaration in (dict(attrs).get('style') or '').split(';'):
+            prop, _, value = declaration.partition(':')
+            if value.strip():
+                # 用 compact_style 统一写法（如 #FFFFFF 与 #fff）后再比较；inherit 会被它删掉，原样保留
+                normalised = compact_style(f'{prop}:{value}').partition(':')[2]
+                declared[prop.strip().lower()] = normalised or value.strip().lower()
+        current = {}
+        for prop in INHERITED_PROPS:
+            if prop in declared and declared[prop] != 'inherit':
+                current[prop] = _resolve(parent.get(prop), declared[prop])
+            elif prop in UA_DEFAULTS.get(tag, ()) and prop not in declared:
+                current[prop] = ('ua', tag)
+            else:
+                current[prop] = parent.get(prop)
+        self.computed.append((tag, current))
+        if tag not in VOID_TAGS:
+            self.stack.append(current)
+
+    def handle_endtag(self, tag):
+        if tag not in VOID_TAGS and len(self.stack) > 1:
+            self.stack.pop()
+
+
+def computed_styles(html: str):
+    tracker = _StyleTracker()
+    tracker.feed(html)
+    tracker.close()
+    return tracker.computed
+
+
+def assert_styles_equal(before: str):
+    """压缩后每个元素的可继承属性与压缩前相同，即删掉的声明确实是多余的"""
+    after = compact_html(before)
+    assert computed_styles(after) == computed_styles(before), after
+    return after
+
+
+@pytest.mark.parametrize('value', [
+    'smaller', 'larger', 'SMALLER', '1.2em', '1.2EM', '90%', '2ex', '3ch', '1.5lh',
+])
+def test_relative_font_size_is_kept(value):
+    html = f'<div style="font-size:{value}"><span style="font-size:{value}">x</span></div>'
+    after = assert_styles_equal(html)
+    assert after.count('font-size') == 2
+
+
+@pytest.mark.parametrize('prop, value', [
+    ('font-weight', 'bolder'),
+    ('font-weight', 'lighter'),
+    ('letter-spacing', '0.1em'),
+    ('line-height', '150%'),
+    ('font-size', 'calc(1em + 2px)'),
+])
+def test_relative_values_are_kept(prop, value):
+    html = f'<section style="{prop}:{value}"><p style="{prop}:{value}">x</p></section>'
+    after = assert_styles_equal(html)
+    assert after.count(prop) == 2
+
+
+@pytest.mark.parametrize('html, removed', [
+    ('<div style="font-size:16px"><span style="font-size:16px">x</span></div>', 1),
+    ('<div style="color:#FFFFFF"><p style="color:white">x</p></div>', 1),
+    ('<div style="line-height:1.6"><p style="line-height:1.6">x</p></div>', 1),
+    ('<p style="color:#333"><a style="color:#333">x</a></p>', 0),
+    ('<p style="font-weight:700"><strong style="font-weight:bold">x</strong></p>', 0),
+    ('<p style="color:red"><span style="color:inherit">x</span></p>', 1),
+])
+def test_removed_declarations_are_redundant(html, removed):
+    after = assert_styles_equal(html)
+    assert after.count('style="') == html.count('style="') - removed
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_converted_demo_keeps_styles(engine):
+    with open(os.path.join(ROOT, 'wechat_demo.md'), encoding='utf-8') as f:
+        markdown_text = f.read()
+    assert_styles_equal(WeChatFormatter(engine=engine).convert(markdown_text, inline_style=True))
+
+
+def test_hex_colours_are_lowercased():
+    assert compact_style('color: #AbCdEf') == 'color:#abcdef'
+    assert compact_style('border-color: #ABCDEF80') == 'border-color:#abcdef80'
+    assert compact_style('background-color: #aBc') == 'background-color:#abc'
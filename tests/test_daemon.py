@@ -0,0 +1,76 @@
+"""
+常驻服务的测试：convert_file 请求可以是 Markdown 文件，也可以是 zip 或 tar 归档
+"""
+
+import struct
+import tarfile
+import zipfile
+import zlib
+
+import pytest
+
+from wechat_format.daemon import ConversionService
+
+
+def png(width, height):
+    """最小的灰度 PNG"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + b'\x00' * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+ARTICLE = '# 归档中的文章\n\n正文 ![图](images/a.png)\n'
+
+
+@pytest.fixture(scope='module')
+def service():
+    return ConversionService()
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_archive_is_read_from_archive(service, tmp_path):
+    path = write_zip(tmp_path / 'bundle.zip', {
+        'posts/article.md': ARTICLE.encode('utf-8'), 'posts/images/a.png': png(3, 2),
+    })
+    response = service.handle({'op': 'convert_file', 'path': path, 'inline': True})
+    assert '归档中的文章' in response['html']
+    assert 'width="3"' in response['html'] and 'height="2"' in response['html']
+
+    response = service.handle({'op': 'convert_file', 'path': path, 'inline': True, 'embed_images': True})
+    assert 'src="data:image/png;base64,' in response['html']
+
+
+def test_tar_archive(service, tmp_path):
+    source = tmp_path / 'article.md'
+    source.write_text(ARTICLE, encoding='utf-8')
+    path = str(tmp_path / 'bundle.tar.gz')
+    with tarfile.open(path, 'w:gz') as archive:
+        archive.add(str(source), 'article.md')
+    response = service.handle({'op': 'convert_file', 'path': path})
+    assert '归档中的文章' in response['html']
+
+
+def test_archive_with_several_articles_needs_member(service, tmp_path):
+    path = write_zip(tmp_path / 'bundle.zip', {'a.md': '# 甲\n', 'b.md': '# 乙\n'})
+    with pytest.raises(ValueError):
+        service.handle({'op': 'convert_file', 'path': path})
+    response = service.handle({'op': 'convert_file', 'path': path, 'member': 'b.md'})
+    assert '乙' in response['html']
+
+
+def test_markdown_file(service, tmp_path):
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'images' / 'a.png').write_bytes(png(5, 4))
+    source = tmp_path / 'article.md'
+    source.write_text(ARTICLE, encoding='utf-8')
+    response = service.handle({'op': 'convert_file', 'path': str(source), 'inline': True})
+    assert 'width="5"' in response['html'] and 'height="4"' in response['html']
@@ -0,0 +1,155 @@
+"""
+数学公式的测试：公式只在正文中渲染，代码、链接地址、HTML 标签和图片说明中的 $ 保持原文
+"""
+
+import html
+
+import pytest
+
+from wechat_format import converter
+from wechat_format.converter import ENGINES, WeChatFormatter
+from wechat_format.document import Document
+
+
+class _FakeRenderer:
+    """不依赖 matplotlib 的公式渲染器：公式渲染为带原文的 <svg>"""
+
+    def render_all(self, formulas):
+        return {
+            (latex, display): f'<svg class="math">{html.escape(latex)}</svg>'
+            for latex, display in formulas
+        }
+
+
+def make_formatter(engine, **kwargs):
+    formatter = WeChatFormatter(engine=engine, **kwargs)
+    formatter.formula_renderer = _FakeRenderer()
+    return formatter
+
+
+def convert(engine, markdown_text, **kwargs):
+    return make_formatter(engine).convert_outputs(markdown_text, ('inline', 'text'), math=True, **kwargs)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_formula_in_text_is_rendered(engine):
+    results = convert(engine, '正文 $x^2$ 和 *强调 $e$*\n\n$$\\sum_i a_i$$\n')
+    assert '<svg class="math">x^2</svg>' in results['inline']
+    assert '<svg class="math">e</svg></em>' in results['inline']
+    assert '<svg class="math">\\sum_i a_i</svg>' in results['inline']
+    # 纯文本中显示公式原文
+    assert '$x^2$' in results['text'] and '$$\\sum_i a_i$$' in results['text']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_math_is_off_by_default(engine):
+    html_text = make_formatter(engine).convert('正文 $x^2$', inline_style=True)
+    assert '<svg' not in html_text
+    assert '$x^2$' in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text, expected', [
+    # 缩进代码块
+    ('引言\n\n    $y$ = 1\n', '$y$ = 1'),
+    # 行内代码和围栏代码块
+    ('引言 `$c$`', '$c$'),
+    ('```\n$f$\n```\n', '$f$'),
+    # 原始 HTML 中的代码
+    ('<pre>$p$</pre>\n', '<pre>$p$</pre>'),
+    ('引言 <code>$q$</code> 结束', '>$q$</code>'),
+])
+def test_code_keeps_source(engine, markdown_text, expected):
+    results = convert(engine, markdown_text)
+    assert expected in results['inline']
+    assert '<svg' not in results['inline'] and '\x02' not in results['inline']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text, url', [
+    ('引言\n\n前 [link](https://a.com/$a$b) 后', 'https://a.com/$a$b'),
+    ('引言\n\n前 <https://a.com/$a$b> 后', 'https://a.com/$a$b'),
+    ('引言\n\n[r]: https://a.com/$a$b\n\n前 [y][r] 后', 'https://a.com/$a$b'),
+])
+def test_link_destination_keeps_source(engine, markdown_text, url):
+    results = convert(engine, markdown_text)
+    assert f': {url}</div>' in results['inline']
+    assert '<svg' not in results['inline'] and '\x02' not in results['inline']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_link_text_is_rendered(engine):
+    results = convert(engine, '引言\n\n前 [链接 $t$](https://a.com/x) 后')
+    assert '链接 <svg class="math">t</svg>[1]' in results['inline']
+    assert '[1] 链接 $t$: https://a.com/x' in results['text']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text, expected', [
+    ('<a title="$z$">t</a>\n', 'title="$z$"'),
+    ('引言 <span title="$z$" data-x=\'$w$\'>t</span>', 'title="$z$"'),
+    ('![图 $w$](a.png)', 'alt="图 $w$"'),
+])
+def test_attributes_keep_source(engine, markdown_text, expected):
+    results = convert(engine, markdown_text)
+    assert expected in results['inline']
+    assert '<svg' not in results['inline'] and '\x02' not in results['inline']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_comparison_signs_are_not_tags(engine):
+    results = convert(engine, '比较 $a<b$ 和 $c>d$')
+    assert '<svg class="math">a&lt;b</svg>' in results['inline']
+    assert '<svg class="math">c&gt;d</svg>' in results['inline']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_sanitized_output_keeps_formulas(engine):
+    markdown_text = '引言\n\n正文 $x$ <a href="javascript:alert(1)" title="$z$">t</a>'
+    results = convert(engine, markdown_text, sanitize=True)
+    assert '<svg class="math">x</svg>' in results['inline']
+    assert 'title="$z$"' in results['inline']
+    assert 'javascript:' not in results['inline']
+
+
+def test_parsed_document_keeps_formulas():
+    formatter = make_formatter('direct')
+    document = formatter.parse('正文 $x$\n\n    $y$\n', math=True)
+    restored = Document.from_json(document.to_json())
+    html_text = formatter.render(restored, 'inline')
+    assert '<svg class="math">x</svg>' in html_text and '$y$' in html_text
+    assert formatter.render(restored, 'text').startswith('正文 $x$')
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_parts_contain_formulas(engine):
+    markdown_text = '# 一\n\n正文 $x$\n\n# 二\n\n[链接 $t$](https://a.com/$a$b)\n'
+    parts = make_formatter(engine).convert_parts(markdown_text, 10 ** 6, math=True)
+    assert len(parts) == 1
+    assert '<svg class="math">x</svg>' in parts[0]
+    assert '链接 $t$: https://a.com/$a$b' in parts[0]
+    assert '\x02' not in parts[0]
+
+
+def test_cache_key_depends_on_math_and_renderer(monkeypatch):
+    formatter = WeChatFormatter()
+    markdown_text = '正文 $x$'
+    plain = formatter.cache_key(markdown_text)
+    monkeypatch.setattr(converter, 'formula_available', lambda: False)
+    fallback = formatter.cache_key(markdown_text, math=True)
+    monkeypatch.setattr(converter, 'formula_available', lambda: True)
+    rendered = formatter.cache_key(markdown_text, math=True)
+    assert len({plain, fallback, rendered}) == 3
+
+
+def test_fallback_results_are_not_reused_after_install(monkeypatch, tmp_path):
+    formatter = make_formatter('markdown2', cache=str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(converter, 'formula_available', lambda: False)
+    formatter.formula_renderer.render_all = lambda formulas: {
+        formula: '<span class="fallback">x</span>' for formula in formulas
+    }
+    assert 'fallback' in formatter.convert('正文 $x$', inline_style=True, math=True)
+
+    monkeypatch.setattr(converter, 'formula_available', lambda: True)
+    formatter.formula_renderer = _FakeRenderer()
+    assert '<svg class="math">x</svg>' in formatter.convert('正文 $x$', inline_style=True, math=True)
@@ -0,0 +1,113 @@
+"""
+输入文件读取的测试：编码识别（BOM、UTF-8、GB18030）和带类型的读取错误
+"""
+
+import codecs
+
+import pytest
+
+from wechat_format.ingest import (
+    MMAP_THRESHOLD,
+    InputEncodingError,
+    InputError,
+    InputNotFoundError,
+    decode,
+    read_many,
+    read_text,
+)
+
+
+TEXT = '# 标题\n\n中文正文，English text。\n'
+TRADITIONAL = '# 標題\n\n繁體中文的正文。\n'
+
+
+@pytest.mark.parametrize('bom, encoding', [
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+])
+def test_bom(bom, encoding):
+    assert decode(bom + TEXT.encode(encoding)) == (TEXT, encoding)
+
+
+def test_utf8_without_bom():
+    assert decode(TEXT.encode('utf-8')) == (TEXT, 'utf-8')
+
+
+@pytest.mark.parametrize('encoding', ['gbk', 'gb2312', 'gb18030'])
+def test_gb_encodings(encoding):
+    assert decode(TEXT.encode(encoding)) == (TEXT, 'gb18030')
+
+
+def test_big5_needs_explicit_encoding():
+    data = TRADITIONAL.encode('big5')
+    # GB18030 能"成功"解码 Big5 字节，只是结果是乱码，所以不自动识别 Big5
+    text, encoding = decode(data)
+    assert encoding == 'gb18030' and text != TRADITIONAL
+    assert decode(data, 'big5') == (TRADITIONAL, 'big5')
+
+
+def test_explicit_encoding_keeps_foreign_bom():
+    data = codecs.BOM_UTF8 + TEXT.encode('utf-8')
+    assert decode(data, 'utf-8-sig')[0] == TEXT
+    assert decode(data, 'utf-8')[0] == TEXT
+    assert decode(data, 'latin-1')[0].startswith('\xef\xbb\xbf')
+
+
+def test_newlines_are_normalised():
+    assert decode('a\r\nb\rc\n'.encode('gbk'))[0] == 'a\nb\nc\n'
+
+
+def test_undecodable_input():
+    # 单独的 0x80、0xFF 在 UTF-8 和 GB18030 中都不合法
+    with pytest.raises(InputEncodingError) as info:
+        decode(b'abc \x80\xff', path='a.md')
+    assert isinstance(info.value, ValueError)
+    assert info.value.path == 'a.md' and 'encoding' in str(info.value)
+
+
+def test_unknown_encoding():
+    with pytest.raises(InputEncodingError):
+        decode(b'abc', 'no-such-encoding')
+
+
+def test_wrong_explicit_encoding():
+    with pytest.raises(InputEncodingError):
+        decode(TEXT.encode('gbk'), 'utf-8')
+
+
+@pytest.mark.parametrize('size', [10, MMAP_THRESHOLD * 2])
+def test_read_text(tmp_path, size):
+    text = TEXT * (size // len(TEXT.encode('gbk')) + 1)
+    path = tmp_path / 'article.md'
+    path.write_bytes(text.encode('gbk'))
+    assert read_text(str(path)) == text
+
+
+def test_missing_file(tmp_path):
+    path = str(tmp_path / 'missing.md')
+    with pytest.raises(InputNotFoundError) as info:
+        read_text(path)
+    assert isinstance(info.value, FileNotFoundError) and info.value.path == path
+
+
+def test_directory(tmp_path):
+    with pytest.raises(InputError) as info:
+        read_text(str(tmp_path))
+    assert not isinstance(info.value, InputNotFoundError)
+    assert info.value.path == str(tmp_path)
+
+
+def test_read_many_reports_errors_in_order(tmp_path):
+    good = tmp_path / 'good.md'
+    good.write_text(TEXT, encoding='utf-8')
+    bad = tmp_path / 'bad.md'
+    bad.write_bytes(b'\x80\xff')
+    paths = [str(good), str(tmp_path / 'missing.md'), str(bad), str(good)]
+    results = list(read_many(paths, readahead=2, workers=2))
+    assert [path for path, _, _ in results] == paths
+    assert results[0][1] == results[3][1] == TEXT
+    assert isinstance(results[1][2], InputNotFoundError)
+    assert isinstance(results[2][2], InputEncodingError)
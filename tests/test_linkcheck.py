@@ -0,0 +1,152 @@
+"""
+外部链接检查的测试：链接指向本地的 ThreadingHTTPServer
+"""
+
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wechat_format.linkcheck import LinkCache, LinkChecker
+
+
+TIMEOUT = 0.5
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, headers=()):
+        self.server.hits[self.path] += 1
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _route(self):
+        path = self.path
+        if path == '/ok':
+            return self._reply(200)
+        if path == '/slow':
+            time.sleep(TIMEOUT * 4)
+            return self._reply(200)
+        if path == '/get-only':
+            return self._reply(405 if self.command == 'HEAD' else 200)
+        if path.startswith('/redirect/'):
+            remaining = int(path.rsplit('/', 1)[1])
+            target = '/ok' if remaining == 0 else f'/redirect/{remaining - 1}'
+            return self._reply(302, [('Location', target)])
+        return self._reply(404)
+
+    do_HEAD = _route
+    do_GET = _route
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.hits = Counter()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server, path):
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+def check(cache_path, urls, **kwargs):
+    return {result['url']: result for result in
+            LinkChecker(cache=LinkCache(str(cache_path)), timeout=TIMEOUT, **kwargs).check(urls)}
+
+
+def test_ok(server, tmp_path):
+    result = check(tmp_path / 'links.json', [url(server, '/ok')])[url(server, '/ok')]
+    assert result['state'] == 'ok'
+    assert result['status'] == 200
+    assert result['redirects'] == 0
+    assert not result['cached']
+
+
+def test_not_found(server, tmp_path):
+    result = check(tmp_path / 'links.json', [url(server, '/missing')])[url(server, '/missing')]
+    assert result['state'] == 'broken'
+    assert result['status'] == 404
+
+
+def test_head_not_allowed_falls_back_to_get(server, tmp_path):
+    result = check(tmp_path / 'links.json', [url(server, '/get-only')])[url(server, '/get-only')]
+    assert result['state'] == 'ok'
+    assert result['status'] == 200
+
+
+def test_redirect_chain(server, tmp_path):
+    result = check(tmp_path / 'links.json', [url(server, '/redirect/3')])[url(server, '/redirect/3')]
+    assert result['state'] == 'ok'
+    assert result['redirects'] == 4
+    assert result['final_url'] == url(server, '/ok')
+
+
+def test_too_many_redirects(server, tmp_path):
+    link = url(server, '/redirect/10')
+    result = check(tmp_path / 'links.json', [link], max_redirects=3)[link]
+    assert result['state'] == 'error'
+    assert result['redirects'] == 3
+    assert '重定向' in result['error']
+
+
+def test_timeout(server, tmp_path):
+    started = time.monotonic()
+    result = check(tmp_path / 'links.json', [url(server, '/slow')])[url(server, '/slow')]
+    assert result['state'] == 'error'
+    assert '超时' in result['error']
+    assert time.monotonic() - started < TIMEOUT * 3
+
+
+def test_unreachable_host(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    link = f'http://127.0.0.1:{port}/'
+    result = check(tmp_path / 'links.json', [link])[link]
+    assert result['state'] == 'error'
+    assert result['status'] is None
+
+
+def test_second_run_is_served_from_cache(server, tmp_path):
+    cache_path = tmp_path / 'links.json'
+    links = [url(server, path) for path in ('/ok', '/missing', '/redirect/2', '/slow')]
+    # 重复的链接只检查一次
+    first = check(cache_path, links + links[:2])
+    assert sorted(first) == sorted(links)
+    assert not any(result['cached'] for result in first.values())
+    assert cache_path.exists()
+
+    hits = server.hits.copy()
+    second = check(cache_path, links)
+    assert server.hits == hits
+    assert all(result['cached'] for result in second.values())
+    for link in links:
+        for field in ('state', 'status', 'final_url', 'redirects', 'error'):
+            assert second[link][field] == first[link][field]
+
+
+def test_expired_results_are_checked_again(server, tmp_path):
+    cache_path = tmp_path / 'links.json'
+    link = url(server, '/ok')
+    check(cache_path, [link])
+    hits = server.hits['/ok']
+    checker = LinkChecker(cache=LinkCache(str(cache_path), ttl=0), timeout=TIMEOUT)
+    result = checker.check([link])[0]
+    assert not result['cached']
+    assert server.hits['/ok'] > hits
@@ -0,0 +1,76 @@
+"""
+转换沙箱的测试：恶意输入（bench.hostile_corpus）会触发限制，之后正常文章仍能转换
+"""
+
+import time
+
+import pytest
+
+from wechat_format.bench import hostile_corpus
+from wechat_format.sandbox import SandboxError, SandboxPool
+
+
+WALL_TIME = 1.0
+MAX_RSS = 256 * 1024 * 1024
+
+# 超限时除墙钟时间外允许的额外耗时（终止工作进程、传输输入）
+SLACK = 2.0
+
+LIMIT_REASONS = {SandboxError.TIMEOUT, SandboxError.CPU, SandboxError.MEMORY, SandboxError.CRASHED}
+
+HOSTILE = {name: text for name, text in hostile_corpus().items() if name != 'plain'}
+
+PROBE = '# 标题\n\n正常的文章，包含 **加粗** 和 `代码`。\n'
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = SandboxPool(workers=1, wall_time=WALL_TIME, cpu_time=1, max_rss=MAX_RSS, acquire_timeout=30)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def assert_probe_converts(pool):
+    html = pool.call('convert', PROBE, inline_style=True)
+    assert '<strong' in html and '正常的文章' in html
+
+
+@pytest.mark.parametrize('name', sorted(HOSTILE))
+def test_hostile_input_is_bounded(pool, name):
+    started = time.monotonic()
+    try:
+        pool.call('convert', HOSTILE[name], inline_style=True)
+    except SandboxError as e:
+        assert e.reason in LIMIT_REASONS
+    except Exception:
+        # 转换本身报错（如嵌套过深）也可以接受，只要没有占住工作进程
+        pass
+    assert time.monotonic() - started < WALL_TIME + SLACK
+    assert_probe_converts(pool)
+
+
+@pytest.mark.parametrize('name', ['link-flood', 'deep-list'])
+def test_limit_is_enforced(pool, name):
+    with pytest.raises(SandboxError) as info:
+        pool.call('convert', HOSTILE[name], inline_style=True)
+    assert info.value.reason in LIMIT_REASONS - {SandboxError.CRASHED}
+    assert pool.recycled > 0
+    assert_probe_converts(pool)
+
+
+def test_slot_is_kept_when_spawn_fails(monkeypatch):
+    pool = SandboxPool(workers=1)
+    # 模拟上一次补位失败后留下的空位
+    pool._started = True
+    pool._idle.put(None)
+
+    def spawn():
+        raise SandboxError(SandboxError.CRASHED, '沙箱进程启动失败')
+
+    monkeypatch.setattr(pool, '_spawn', spawn)
+    for _ in range(2):
+        with pytest.raises(SandboxError) as info:
+            pool.call('convert', PROBE)
+        assert info.value.reason == SandboxError.CRASHED
+    assert pool._idle.qsize() == 1
@@ -0,0 +1,227 @@
+"""
+HTML 白名单过滤的测试：两种引擎的输出中都不能出现脚本、事件属性和危险地址
+"""
+
+import re
+from html.parser import HTMLParser
+
+import pytest
+
+from wechat_format.converter import ENGINES, WeChatFormatter
+from wechat_format.sanitize import ALLOWED_TAGS
+
+
+# 浏览器解析地址时忽略的字符（与 sanitize._URL_IGNORED_RE 一致）
+URL_IGNORED_RE = re.compile(r'[\x00-\x20\x7f]+')
+UNSAFE_CSS_RE = re.compile(r'url\s*\(|expression|behavior|-moz-binding|javascript:', re.I)
+
+
+class _Collector(HTMLParser):
+    """收集 HTML 中的 (标签, 属性) 和文字"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags = []
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.append((tag, dict(attrs)))
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+
+def parse(html_text):
+    collector = _Collector()
+    collector.feed(html_text)
+    collector.close()
+    return collector.tags, ''.join(collector.text)
+
+
+def assert_safe(html_text):
+    tags, _ = parse(html_text)
+    for tag, attrs in tags:
+        assert tag in ALLOWED_TAGS, (tag, html_text)
+        for name, value in attrs.items():
+            assert not name.startswith('on'), (tag, name, html_text)
+            if name in ('href', 'src', 'cite') and value is not None:
+                url = URL_IGNORED_RE.sub('', value).lower()
+                assert not url.startswith(('javascript:', 'vbscript:', 'data:text', 'data:image/svg')), \
+                    (tag, name, value)
+                if url.startswith('data:'):
+                    assert tag == 'img', (tag, name, value)
+            if name == 'style' and value is not None:
+                assert not UNSAFE_CSS_RE.search(value), (tag, value)
+
+
+def convert(engine, markdown_text):
+    # 第一行不写冒号：markdown2 的 metadata 扩展会把 "键: 值" 形式的首行当作元数据
+    html_text = WeChatFormatter(engine=engine).convert(
+        '引言\n\n' + markdown_text, inline_style=True, sanitize=True
+    )
+    assert_safe(html_text)
+    return html_text
+
+
+HOSTILE_LINKS = [
+    '[x](javascript:alert(1))',
+    '[x](JavaScript:alert(1))',
+    '[x](vbscript:msgbox(1))',
+    '[x](data:text/html;base64,PHNjcmlwdD5hbGVydCgxKTwvc2NyaXB0Pg==)',
+    # 实体编码
+    '[x](&#106;avascript:alert(1))',
+    '[x](&#x6A;&#x61;vascript:alert(1))',
+    '<a href="&#106;&#97;&#118;&#97;&#115;&#99;&#114;&#105;&#112;&#116;&#58;alert(1)">x</a>',
+    '<a href="javascript&colon;alert(1)">x</a>',
+    # 被空白、控制字符拆开
+    '<a href="java\tscript:alert(1)">x</a>',
+    '<a href="java&#9;script:alert(1)">x</a>',
+    '<a href="java&#10;script:alert(1)">x</a>',
+    '<a href=" &#14; javascript:alert(1)">x</a>',
+    '<a href="jav&#x0A;ascript:alert(1)">x</a>',
+    # 引用式链接
+    '[x][evil]\n\n[evil]: javascript:alert(1)',
+    '[x]\n\n[x]: javascript:alert(1) "标题"',
+    '[x][evil]\n\n[evil]: &#106;avascript:alert(1)',
+]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text', HOSTILE_LINKS)
+def test_unsafe_link_keeps_text(engine, markdown_text):
+    html_text = convert(engine, markdown_text)
+    assert 'x' in parse(html_text)[1]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text', [
+    '![x](javascript:alert(1))',
+    '![x](data:text/html,<script>alert(1)</script>)',
+    '![x](data:image/svg+xml;base64,PHN2Zz48L3N2Zz4=)',
+    '<img src="java\tscript:alert(1)">',
+    '<img src="&#106;avascript:alert(1)">',
+])
+def test_unsafe_image_src(engine, markdown_text):
+    convert(engine, markdown_text)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_safe_urls_are_kept(engine):
+    html_text = convert(
+        engine,
+        '[站内](/posts/1) [锚点](#a) <a href="mailto:a@b.c">邮件</a>\n\n'
+        '![图](data:image/png;base64,iVBORw0KGgo=)'
+    )
+    assert 'href="/posts/1"' in html_text and 'href="#a"' in html_text
+    assert 'href="mailto:a@b.c"' in html_text
+    assert 'src="data:image/png;base64,iVBORw0KGgo="' in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text', [
+    '<img src="a.png" onerror="alert(1)">',
+    '<p onclick="alert(1)" ONMOUSEOVER="alert(2)">x</p>',
+    '<a href="/a" onfocus=alert(1) autofocus>x</a>',
+    '<details open ontoggle="alert(1)"><summary>x</summary></details>',
+    '<body onload="alert(1)">x</body>',
+    '正文 <span onpointerenter="alert(1)">x</span> 结束',
+])
+def test_event_attributes_are_removed(engine, markdown_text):
+    html_text = convert(engine, markdown_text)
+    assert 'alert' not in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text', [
+    '<script>alert(1)</script>',
+    '<SCRIPT SRC="//evil/x.js"></SCRIPT>',
+    '<iframe src="javascript:alert(1)"></iframe>',
+    '<style>*{background:url(javascript:alert(1))}</style>',
+    '<object data="javascript:alert(1)"></object>',
+    '<math><mi xlink:href="javascript:alert(1)">x</mi></math>',
+    '<template><img src=x onerror=alert(1)></template>',
+    '正文 <script>alert(1)</script> 结束',
+    '<noscript><p title="</noscript><img src=x onerror=alert(1)>"></noscript>',
+])
+def test_script_elements_are_dropped(engine, markdown_text):
+    html_text = convert(engine, markdown_text)
+    assert 'alert' not in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text', [
+    '<svg onload="alert(1)"><path d="M0 0"/></svg>',
+    '<svg><script>alert(1)</script></svg>',
+    '<svg><a href="javascript:alert(1)"><text>x</text></a></svg>',
+    '<svg><a xlink:href="javascript:alert(1)">x</a></svg>',
+    '<svg><animate attributeName="href" to="javascript:alert(1)"/></svg>',
+    '<svg><set attributeName="onmouseover" to="alert(1)"/></svg>',
+    '<svg><foreignObject><iframe src="javascript:alert(1)"></iframe></foreignObject></svg>',
+    '<svg><use href="data:image/svg+xml;base64,PHN2Zz48L3N2Zz4=#x"/></svg>',
+    '<svg><path d="M0 0" style="fill:url(javascript:alert(1))" onclick="alert(1)"/></svg>',
+    '<svg><image href="javascript:alert(1)"/></svg>',
+])
+def test_svg_children(engine, markdown_text):
+    html_text = convert(engine, markdown_text)
+    assert 'alert' not in html_text and 'data:' not in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('style', [
+    'background: url(javascript:alert(1))',
+    'background-image: URL ( "https://evil/x.png" )',
+    'width: expression(alert(1))',
+    'width: EXPRESSION(alert(1))',
+    'behavior: url(x.htc)',
+    '-moz-binding: url(http://evil/x.xml#xss)',
+    'background: \\75 rl(javascript:alert(1))',
+    'color: red; /* */ background: url(x)',
+    '@import "http://evil/x.css"',
+    'background: image-set("x.png" 1x)',
+])
+def test_unsafe_css_is_removed(engine, style):
+    html_text = convert(engine, f'<p style="{style}">x</p>')
+    assert 'style="' + style not in html_text
+    assert parse(html_text)[1].count('x') >= 1
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_safe_css_is_kept(engine):
+    html_text = convert(engine, '<p style="color: red; font-weight: bold">x</p>')
+    assert 'color: red; font-weight: bold' in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('markdown_text', [
+    # 注音格式中的读音原样放进 <rt>
+    '世界【<img src=x onerror=alert(1)>】',
+    '世界{<script>alert(1)</script>}',
+    '上海【</rt></ruby><img src=x onerror=alert(1)>】',
+    '世界【<a href="javascript:alert(1)">せかい</a>】',
+    '<ruby>字<rt onclick="alert(1)">zì</rt></ruby>',
+])
+def test_ruby_injection(engine, markdown_text):
+    html_text = convert(engine, markdown_text)
+    assert 'alert' not in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_ruby_is_kept(engine):
+    html_text = convert(engine, '世界【せかい】')
+    tags = [tag for tag, _ in parse(html_text)[0]]
+    assert 'ruby' in tags and 'rt' in tags
+    assert 'せかい' in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_comments_and_declarations_are_removed(engine):
+    html_text = convert(engine, '正文 <!-- <img src=x onerror=alert(1)> --> 结束\n\n<![CDATA[x]]>')
+    assert 'alert' not in html_text and '<!--' not in html_text
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_only_checkbox_inputs_are_kept(engine):
+    html_text = convert(engine, '- [x] 完成\n- [ ] 未完成\n\n<input type="text" value="x">')
+    inputs = [attrs for tag, attrs in parse(html_text)[0] if tag == 'input']
+    assert all(attrs.get('type') == 'checkbox' for attrs in inputs)
+    assert '完成' in html_text and '未完成' in html_text
@@ -0,0 +1,46 @@
+"""
+Web 服务的测试：启动预热预先转换的文章，之后的请求命中共享缓存
+"""
+
+import time
+
+import pytest
+
+from wechat_format.web import create_app
+
+
+ARTICLE = '# 预热\n\n正文，包含 **加粗** 和本地图片 ![图](images/a.png)。\n'
+
+
+@pytest.fixture
+def client(tmp_path):
+    articles = tmp_path / 'articles'
+    articles.mkdir()
+    (articles / 'post.md').write_text(ARTICLE, encoding='utf-8')
+    app = create_app({
+        'IMAGE_ROOT': str(tmp_path),
+        'CACHE_PATH': str(tmp_path / 'cache.db'),
+        'WARMUP_DIR': str(articles),
+        'SANDBOX': False,
+    })
+    client = app.test_client()
+    deadline = time.monotonic() + 30
+    while client.get('/api/ready').status_code != 200:
+        assert time.monotonic() < deadline, '启动预热超时'
+        time.sleep(0.05)
+    return client
+
+
+def test_warmed_article_is_served_from_cache(client):
+    ready = client.get('/api/ready').get_json()
+    assert ready['articles'] == 1 and not ready['errors']
+
+    response = client.post('/api/render', json={'markdown': ARTICLE})
+    assert response.get_json()['success']
+    assert 'cache;desc="hit"' in response.headers['Server-Timing']
+
+
+def test_other_article_misses_cache(client):
+    response = client.post('/api/render', json={'markdown': ARTICLE + '\n新的段落\n'})
+    assert response.get_json()['success']
+    assert 'cache;desc="miss"' in response.headers['Server-Timing']
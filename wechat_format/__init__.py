@@ -9,6 +9,12 @@ __version__ = "0.1.0"
 __author__ = "Your Name"
 __email__ = "your.email@example.com"
 
-from .converter import WeChatFormatter
+__all__ = ["WeChatFormatter"]
 
-__all__ = ["WeChatFormatter"]
\ No newline at end of file
+
+def __getattr__(name):
+    # 延迟导入转换器，使命令行连接常驻服务时无需加载 markdown2 / bs4
+    if name == "WeChatFormatter":
+        from .converter import WeChatFormatter
+        return WeChatFormatter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,346 @@
+"""
+归档输入
+
+作者常把文章打包为 zip（Markdown 加图片）发来。转换时直接从归档中读取，不解压到磁盘：
+
+- Markdown 成员以流的方式读取，按 BOM、UTF-8 和 GB18030 识别编码（见 ingest.py）；
+- 图片相对 Markdown 成员在归档内的位置解析（以 / 开头的地址相对归档根目录），
+  只读取文件头获取宽高，内嵌图片时读取整个成员；
+- 转换时以 ArchiveDir 作为 base_dir，它是形如 `bundle.zip!/posts` 的字符串，
+  可以作为缓存键、传给工作进程，各进程按需打开归档，因此可以用 batch.convert_many 并行转换。
+
+支持 .zip 和 tar（.tar、.tar.gz/.tgz、.tar.bz2、.tar.xz）。压缩的 tar 只能顺序解压，
+同一篇文章的图片按它们在归档中的顺序读取。
+"""
+
+import os
+import posixpath
+import tarfile
+import threading
+import zipfile
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .images import image_data_uri, probe_image_stream
+from .ingest import decode
+
+
+# 支持的归档扩展名
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# 视为 Markdown 文章的成员扩展名（与 index.MARKDOWN_SUFFIXES 一致）
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+
+# 归档路径与归档内目录之间的分隔符
+SEPARATOR = '!/'
+
+# 每个进程保持打开的归档数量
+OPEN_ARCHIVES = 8
+
+
+class ArchiveError(Exception):
+    """无法读取归档或其中的成员"""
+    pass
+
+
+def is_archive(path: str) -> bool:
+    """是否为支持的归档文件（按扩展名判断）"""
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _normalize(name: str) -> Optional[str]:
+    """规范化成员名称；指向归档之外（..）的名称返回 None"""
+    name = posixpath.normpath(name.replace('\\', '/').lstrip('/'))
+    if name == '.' or name == '..' or name.startswith('../'):
+        return None
+    return name
+
+
+class Archive:
+    """只读的 zip 或 tar 归档，成员以流的方式读取，可在多线程间共享"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 归档文件路径
+
+        Raises:
+            ArchiveError: 文件不是有效的 zip 或 tar 归档
+        """
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        # 成员名称到 (ZipInfo 或 TarInfo, 在归档中的顺序)
+        self._members: Dict[str, Tuple[object, int]] = {}
+        try:
+            if zipfile.is_zipfile(self.path):
+                self._zip = zipfile.ZipFile(self.path)
+                self._tar = None
+                infos = [(info.filename, info) for info in self._zip.infolist() if not info.is_dir()]
+            else:
+                self._zip = None
+                self._tar = tarfile.open(self.path, 'r:*')
+                infos = [(info.name, info) for info in self._tar.getmembers() if info.isfile()]
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            raise ArchiveError(f'无法打开归档 {path}: {e}')
+        for order, (name, info) in enumerate(infos):
+            name = _normalize(name)
+            if name is not None:
+                self._members.setdefault(name, (info, order))
+        stat = os.stat(self.path)
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """关闭归档文件"""
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+            if self._tar is not None:
+                self._tar.close()
+
+    def __contains__(self, member: str) -> bool:
+        return member in self._members
+
+    def markdown_members(self) -> List[str]:
+        """
+        归档中的 Markdown 成员（跳过以 . 开头的目录和文件，以及 macOS 打包时附带的 __MACOSX）
+
+        Returns:
+            成员名称列表，按名称排序
+        """
+        members = []
+        for name in self._members:
+            parts = name.split('/')
+            if parts[0] == '__MACOSX' or any(part.startswith('.') for part in parts):
+                continue
+            if name.lower().endswith(MARKDOWN_SUFFIXES):
+                members.append(name)
+        return sorted(members)
+
+    def size(self, member: str) -> int:
+        """成员的原始大小（字节）"""
+        info, _ = self._members[member]
+        return info.file_size if self._zip is not None else info.size
+
+    def order(self, members: Iterable[str]) -> List[str]:
+        """按成员在归档中的顺序排列（压缩的 tar 只能顺序读取，按此顺序读取可避免重复解压）"""
+        return sorted(members, key=lambda member: self._members[member][1])
+
+    def _open(self, member: str):
+        info, _ = self._members[member]
+        if self._zip is not None:
+            return self._zip.open(info)
+        stream = self._tar.extractfile(info)
+        if stream is None:
+            raise ArchiveError(f'{member} 不是普通文件')
+        return stream
+
+    def read(self, member: str) -> bytes:
+        """读取成员的全部内容"""
+        with self._lock:
+            try:
+                with self._open(member) as stream:
+                    return stream.read()
+            except (OSError, zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+                raise ArchiveError(f'无法读取 {member}: {e}')
+
+    def read_text(self, member: str, encoding: Optional[str] = None) -> str:
+        """
+        读取并解码文本成员
+
+        Args:
+            member: 成员名称
+            encoding: 编码；为 None 时自动识别（见 ingest.decode）
+
+        Raises:
+            ArchiveError: 无法读取成员
+            ingest.InputEncodingError: 无法识别成员的编码
+        """
+        return decode(self.read(member), encoding, self.path + SEPARATOR + member)[0]
+
+    def probe_image_size(self, member: str) -> Optional[Tuple[int, int]]:
+        """只读取成员开头获取图片宽高；无法识别时返回 None"""
+        with self._lock:
+            try:
+                with self._open(member) as stream:
+                    return probe_image_stream(stream)
+            except (OSError, zipfile.BadZipFile, tarfile.TarError, EOFError, ArchiveError):
+                return None
+
+
+_archives: Dict[str, Archive] = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(path: str) -> Archive:
+    """
+    打开（并在当前进程内缓存）归档；归档文件修改后重新打开
+
+    Args:
+        path: 归档文件路径
+
+    Returns:
+        Archive
+
+    Raises:
+        ArchiveError: 归档不存在或无法读取
+    """
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise ArchiveError(f'无法打开归档 {path}: {e}')
+    with _archives_lock:
+        archive = _archives.pop(path, None)
+        if archive is not None and archive.signature != (stat.st_mtime_ns, stat.st_size):
+            archive.close()
+            archive = None
+        if archive is None:
+            archive = Archive(path)
+        # 最近使用的放在最后，超出数量时关闭最久未使用的
+        _archives[path] = archive
+        while len(_archives) > OPEN_ARCHIVES:
+            _archives.pop(next(iter(_archives))).close()
+    return archive
+
+
+class ArchiveDir(str):
+    """
+    归档内的目录，作为转换时的 base_dir 使用
+
+    字符串值为 `归档路径!/目录`，可以作为缓存键的一部分；只保存路径，
+    可以传给工作进程，使用时按需打开归档。
+    """
+
+    def __new__(cls, archive: str, directory: str = ''):
+        archive = os.path.abspath(archive)
+        directory = (_normalize(directory) or '') if directory else ''
+        value = super().__new__(cls, archive + SEPARATOR + directory)
+        value.archive = archive
+        value.directory = directory
+        return value
+
+    def __reduce__(self):
+        return ArchiveDir, (self.archive, self.directory)
+
+    def resolve(self, src: str) -> Optional[str]:
+        """
+        将 <img> 的 src 解析为归档成员
+
+        Args:
+            src: 图片地址；相对地址相对本目录，以 / 开头的地址相对归档根目录
+
+        Returns:
+            成员名称；远程图片、data URI 或归档中没有该成员时返回 None
+        """
+        if not src:
+            return None
+        parts = urlsplit(src)
+        if parts.scheme or parts.netloc:
+            return None
+        path = unquote(parts.path)
+        if not path.startswith('/'):
+            path = posixpath.join(self.directory, path)
+        member = _normalize(path)
+        if member is None or member not in open_archive(self.archive):
+            return None
+        return member
+
+    def _resolve_all(self, srcs: Iterable[str]) -> Dict[str, str]:
+        resolved = {}
+        for src in dict.fromkeys(srcs):
+            member = self.resolve(src)
+            if member:
+                resolved[src] = member
+        return resolved
+
+    def probe_images(self, srcs: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """
+        探测一组 <img> src 对应的归档内图片的尺寸
+
+        Returns:
+            src 到 (宽, 高) 的映射
+        """
+        archive = open_archive(self.archive)
+        resolved = self._resolve_all(srcs)
+        sizes = {}
+        for member in archive.order(set(resolved.values())):
+            size = archive.probe_image_size(member)
+            if size:
+                sizes[member] = size
+        return {src: sizes[member] for src, member in resolved.items() if member in sizes}
+
+    def embed_images(self, srcs: Iterable[str], max_size: int, budget: int) -> Dict[str, str]:
+        """
+        将一组 <img> src 对应的归档内小图片编码为 data URI（按文档顺序，直到用完总量预算）
+
+        Args:
+            srcs: 图片地址（按文档顺序）
+            max_size: 单张图片原始字节数上限
+            budget: data URI 总字符数上限
+
+        Returns:
+            src 到 data URI 的映射
+        """
+        archive = open_archive(self.archive)
+        resolved = self._resolve_all(srcs)
+        # 先按文档顺序和预算选出要内嵌的成员，再按归档中的顺序读取
+        selected = []
+        used = 0
+        for member in dict.fromkeys(resolved.values()):
+            size = archive.size(member)
+            estimate = (size + 2) // 3 * 4
+            if size > max_size or used + estimate > budget:
+                continue
+            selected.append(member)
+            used += estimate
+        encoded = {}
+        for member in archive.order(selected):
+            try:
+                uri = image_data_uri(archive.read(member))
+            except ArchiveError:
+                continue
+            if uri is not None:
+                encoded[member] = uri
+        # 按实际长度（含 data: 前缀）重新核对预算
+        uris = {}
+        used = 0
+        for member in selected:
+            uri = encoded.get(member)
+            if uri is not None and used + len(uri) <= budget:
+                uris[member] = uri
+                used += len(uri)
+        return {src: uris[member] for src, member in resolved.items() if member in uris}
+
+
+def read_article(path: str, member: Optional[str] = None,
+                 encoding: Optional[str] = None) -> Tuple[str, ArchiveDir]:
+    """
+    读取归档中的一篇文章
+
+    Args:
+        path: 归档文件路径
+        member: 要读取的 Markdown 成员；归档中只有一篇文章时可以省略
+        encoding: 文件编码；为 None 时自动识别
+
+    Returns:
+        (Markdown 文本, 作为 base_dir 的 ArchiveDir)
+
+    Raises:
+        ArchiveError: 无法读取归档或成员
+        ValueError: 未指定 member，而归档中的文章不止一篇（或没有文章）
+    """
+    archive = open_archive(path)
+    if member is None:
+        members = archive.markdown_members()
+        if len(members) != 1:
+            raise ValueError(
+                f'归档中有 {len(members)} 篇 Markdown 文章，请指定 member 或使用 convert_archive()'
+            )
+        member = members[0]
+    return archive.read_text(member, encoding), ArchiveDir(path, posixpath.dirname(member))
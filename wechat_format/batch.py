@@ -0,0 +1,183 @@
+"""
+批量转换
+
+在进程池中并行转换多篇文章：每个工作进程保持一个热格式化器，
+同一时间提交但尚未取回的文章数量有上限，单篇失败只记录错误、不影响其余文章。
+工作进程崩溃（如被 OOM 杀死）时重建进程池，逐篇重新转换当时未完成的文章，
+只有单独转换仍会崩溃的那篇记为失败。
+"""
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, Optional
+
+
+class BatchResult:
+    """单篇文章的转换结果"""
+
+    __slots__ = ('index', 'html', 'error')
+
+    def __init__(self, index: int, html: Optional[str] = None, error: Optional[str] = None):
+        """
+        Args:
+            index: 文章在输入中的序号（从 0 开始）
+            html: 转换后的 HTML；失败时为 None
+            error: 失败原因；成功时为 None
+        """
+        self.index = index
+        self.html = html
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """是否转换成功"""
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'error={self.error!r}'
+        return f'BatchResult(index={self.index}, {status})'
+
+
+# 工作进程内的格式化器，由 _init_worker 初始化
+_formatter = None
+
+
+def _init_worker(engine: str, cache=None):
+    global _formatter
+    from .converter import WeChatFormatter
+
+    _formatter = WeChatFormatter(engine=engine, cache=cache)
+
+
+def _convert_one(index: int, text, options: dict, formatter=None) -> BatchResult:
+    if isinstance(text, tuple):
+        # (文本, 该篇文章的参数)，如各自的 base_dir
+        text, extra = text
+        options = dict(options, **extra)
+    try:
+        html = (formatter or _formatter).convert(text, **options)
+    except Exception as e:
+        return BatchResult(index, error=f'{type(e).__name__}: {e}')
+    return BatchResult(index, html)
+
+
+def _broken(future: Future) -> bool:
+    """任务是否因工作进程崩溃而失败（会等待任务完成）"""
+    return isinstance(future.exception(), BrokenProcessPool)
+
+
+def _recover(pool: ProcessPoolExecutor, pending: deque, make_pool, options: dict) -> ProcessPoolExecutor:
+    """
+    进程池崩溃后重建进程池，并逐篇重新转换因此失败的任务
+
+    崩溃时所有未完成的任务都会失败，无法知道是哪一篇导致的，因此在新的进程池中逐篇
+    单独转换；单独转换仍使进程池崩溃的文章记为失败，其余文章得到正常结果。
+    pending 中的任务原地替换为已完成的任务。
+
+    Returns:
+        新的进程池
+    """
+    pool.shutdown(wait=True)
+    pool = make_pool()
+    for position, future in enumerate(pending):
+        if not _broken(future):
+            # 崩溃前已经完成
+            continue
+        retry = pool.submit(_convert_one, future.index, future.text, options)
+        if _broken(retry):
+            error = retry.exception()
+            pool.shutdown(wait=True)
+            pool = make_pool()
+            retry = Future()
+            retry.set_result(BatchResult(future.index, error=f'{type(error).__name__}: {error}'))
+        retry.index = future.index
+        retry.text = future.text
+        pending[position] = retry
+    return pool
+
+
+def convert_many(texts: Iterable[str], engine: str = 'markdown2', workers: Optional[int] = None,
+                 ordered: bool = True, max_pending: Optional[int] = None, formatter=None,
+                 cache=None, **options) -> Iterator[BatchResult]:
+    """
+    批量转换多篇文章
+
+    Args:
+        texts: Markdown 文本的可迭代对象（可以是生成器，按需读取）；元素也可以是
+            (文本, 参数) 二元组，参数覆盖 **options 中的同名参数（如每篇文章各自的 base_dir）
+        engine: 渲染引擎
+        workers: 进程数，默认为 CPU 核数；为 1 时在当前进程内依次转换
+        ordered: 为 True 时按输入顺序产出结果，否则按完成顺序产出
+        max_pending: 已读取但尚未产出的文章数量上限，默认为进程数的 2 倍
+        formatter: 当前进程内转换时使用的格式化器（workers 为 1 时）
+        cache: 转换缓存（cache.ConversionCache 或缓存文件路径），各工作进程共用
+        **options: 传给 WeChatFormatter.convert() 的参数，如 inline_style、compact
+
+    Yields:
+        每篇文章的 BatchResult
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        if formatter is None:
+            from .converter import WeChatFormatter
+            formatter = WeChatFormatter(engine=engine, cache=cache)
+        for index, text in enumerate(texts):
+            yield _convert_one(index, text, options, formatter)
+        return
+
+    max_pending = max(1, max_pending or workers * 2)
+    items = enumerate(texts)
+
+    def make_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine, cache))
+
+    pool = make_pool()
+    pending = deque()
+    try:
+        exhausted = False
+        while True:
+            # 补充任务，直到达到上限或输入读完
+            while not exhausted and len(pending) < max_pending:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                index, text = item
+                future = pool.submit(_convert_one, index, text, options)
+                future.index = index
+                future.text = text
+                pending.append(future)
+            if not pending:
+                break
+
+            if ordered:
+                done = [pending[0]]
+                wait(done)
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            if any(_broken(future) for future in done):
+                # 工作进程崩溃：重建进程池，重新转换受影响的文章后再取结果
+                pool = _recover(pool, pending, make_pool, options)
+                continue
+
+            if ordered:
+                pending.popleft()
+            else:
+                done = sorted(done, key=lambda future: future.index)
+                for future in done:
+                    pending.remove(future)
+
+            for future in done:
+                error = future.exception()
+                if error is not None:
+                    # 参数无法序列化等无法在工作进程内捕获的错误
+                    yield BatchResult(future.index, error=f'{type(error).__name__}: {error}')
+                else:
+                    yield future.result()
+    finally:
+        # 调用方提前停止迭代时，取消尚未开始的任务
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
@@ -0,0 +1,416 @@
+"""
+性能基准测试
+
+生成基准语料，并测量各转换路径的耗时，供 `wechat-format bench` 命令使用。
+"""
+
+import time
+from statistics import median
+from typing import Callable, Dict, List
+
+from .converter import WeChatFormatter
+
+
+_SECTION = """## 第 {n} 节：性能与排版
+
+这是一段用于基准测试的**中文正文**，包含 *强调*、`行内代码`、==高亮文本== 以及
+[外部链接](https://example.com/article/{n}) 和 [站内链接](/posts/{n})。世界【せかい】
+
+- 列表项一：Markdown 转 HTML
+- 列表项二：一键复制到剪切板
+- [x] 已完成的任务
+
+1. 第一步
+2. 第二步
+
+| 功能 | 本工具 | 其他工具 |
+|------|--------|----------|
+| Python 支持 | ✅ | ❌ |
+| 命令行工具 | ✅ | 部分 |
+| 一键复制 | ✅ | 部分 |
+
+```python
+def hello(name):
+    return f"Hello, {{name}}!"
+```
+
+> 引用块：使用本工具，让你的微信公众号文章更加专业和美观。
+
+:::tip
+这是一个提示框，用于重要信息提醒。
+:::
+
+---
+
+"""
+
+
+def build_corpus() -> Dict[str, str]:
+    """
+    生成基准语料
+
+    Returns:
+        名称到 Markdown 文本的映射
+    """
+    return {
+        'small': _article(2),
+        'medium': _article(20),
+        'large': _article(200),
+    }
+
+
+def _article(sections: int) -> str:
+    parts = ['# 基准测试文章\n\n']
+    parts.extend(_SECTION.format(n=n) for n in range(1, sections + 1))
+    return ''.join(parts)
+
+
+def time_call(func: Callable[[], object], repeat: int = 5) -> float:
+    """
+    多次调用函数并返回耗时中位数（秒）
+
+    Args:
+        func: 无参数的待测函数
+        repeat: 重复次数
+
+    Returns:
+        耗时中位数（秒）
+    """
+    func()  # 预热
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return median(samples)
+
+
+def bench_engines(repeat: int = 5) -> List[dict]:
+    """
+    比较 markdown2 与 direct 引擎的内联样式转换耗时
+
+    Args:
+        repeat: 每个样本的重复次数
+
+    Returns:
+        每篇语料一行的结果列表
+    """
+    formatters = {engine: WeChatFormatter(engine=engine) for engine in ('markdown2', 'direct')}
+    rows = []
+    for name, text in build_corpus().items():
+        row = {'name': name, 'size': len(text.encode('utf-8'))}
+        for engine, formatter in formatters.items():
+            row[engine] = time_call(lambda: formatter.convert(text, inline_style=True), repeat)
+        row['speedup'] = row['markdown2'] / row['direct']
+        rows.append(row)
+    return rows
+
+
+def _theme_variants(count: int) -> List[Dict[str, str]]:
+    from .styles import WECHAT_INLINE_STYLE
+
+    colors = ['#333', '#2c3e50', '#3498db', '#e74c3c', '#27ae60', '#8e44ad', '#d35400', '#16a085']
+    return [
+        {tag: style.replace('#333', colors[i % len(colors)]) for tag, style in WECHAT_INLINE_STYLE.items()}
+        for i in range(count)
+    ]
+
+
+def bench_themes(repeat: int = 5, themes: int = 8) -> List[dict]:
+    """
+    比较多主题预览时逐个转换与“解析一次、渲染多次”的耗时
+
+    - convert: 每个主题都调用一次 convert()（markdown2 引擎）
+    - parse: parse() 一次的耗时
+    - render: 对解析结果用各主题 render() 的总耗时
+
+    Args:
+        repeat: 每个样本的重复次数
+        themes: 主题数量
+
+    Returns:
+        每篇语料一行的结果列表
+    """
+    formatter = WeChatFormatter()
+    direct = WeChatFormatter(engine='direct')
+    variants = _theme_variants(themes)
+    rows = []
+    for name, text in build_corpus().items():
+        row = {'name': name, 'themes': themes}
+        row['convert'] = time_call(
+            lambda: [formatter.convert(text, inline_style=True) for _ in variants], repeat
+        )
+        row['parse'] = time_call(lambda: direct.parse(text), repeat)
+        document = direct.parse(text)
+        row['render'] = time_call(
+            lambda: [direct.render(document, styles=styles) for styles in variants], repeat
+        )
+        row['speedup'] = row['convert'] / (row['parse'] + row['render'])
+        rows.append(row)
+    return rows
+
+
+def bench_parallel(repeat: int = 3, sections: int = 2000,
+                   workers: List[int] = None) -> List[dict]:
+    """
+    测量单篇大文档多进程转换随进程数的扩展情况
+
+    Args:
+        repeat: 每项的重复次数
+        sections: 文档的节数（每节约 1KB）
+        workers: 要测量的进程数，默认为 1、2、4 ... 直到 CPU 核数
+
+    Returns:
+        每个进程数一行的结果列表；进程数 1 为顺序转换 convert()
+    """
+    import os
+
+    if workers is None:
+        cores = os.cpu_count() or 1
+        workers = [1]
+        while workers[-1] * 2 <= cores:
+            workers.append(workers[-1] * 2)
+        if workers[-1] != cores:
+            workers.append(cores)
+
+    text = _article(sections)
+    formatter = WeChatFormatter(engine='direct')
+    expected = formatter.convert(text, inline_style=True)
+    rows = []
+    for count in workers:
+        if count == 1:
+            func = lambda: formatter.convert(text, inline_style=True)
+        else:
+            func = lambda: formatter.convert_parallel(text, inline_style=True, workers=count)
+            if func() != expected:
+                raise RuntimeError(f'{count} 个进程的输出与顺序转换不一致')
+        rows.append({'workers': count, 'size': len(text.encode('utf-8')), 'seconds': time_call(func, repeat)})
+    for row in rows:
+        row['speedup'] = rows[0]['seconds'] / row['seconds']
+    return rows
+
+
+def bench_cache(repeat: int = 5) -> List[dict]:
+    """
+    比较共享转换缓存命中与重新转换的耗时
+
+    缓存文件建在临时目录中；未命中的耗时包括转换和写入缓存，
+    每次使用不同的文本（末尾追加序号）以保证未命中。
+
+    Args:
+        repeat: 每个样本的重复次数
+
+    Returns:
+        每篇语料一行的结果列表
+    """
+    import itertools
+    import os
+    import tempfile
+
+    from .cache import ConversionCache
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ConversionCache(os.path.join(tmp, 'cache.sqlite3'))
+        plain = WeChatFormatter()
+        cached = WeChatFormatter(cache=cache)
+        counter = itertools.count()
+        for name, text in build_corpus().items():
+            row = {'name': name, 'size': len(text.encode('utf-8'))}
+            row['convert'] = time_call(lambda: plain.convert(text, inline_style=True), repeat)
+            row['miss'] = time_call(
+                lambda: cached.convert(f'{text}\n{next(counter)}\n', inline_style=True), repeat
+            )
+            row['hit'] = time_call(lambda: cached.convert(text, inline_style=True), repeat)
+            row['speedup'] = row['convert'] / row['hit']
+            rows.append(row)
+        cache.close()
+    return rows
+
+
+# 含原始 HTML 的段落（白名单过滤的基准语料）
+_RAW_HTML = """<div class="wechat-box" onclick="alert(1)">原始 HTML <span style="color: red;">提示</span>
+<script>alert(document.cookie)</script></div>
+
+正文中的 <a href="javascript:alert(1)">链接</a> 和 <img src="x.png" onerror="alert(1)"/>，
+<font color="blue">蓝色文字</font>。
+
+"""
+
+
+def bench_sanitize(repeat: int = 5) -> List[dict]:
+    """
+    测量原始 HTML 白名单过滤的额外耗时
+
+    语料为基准文章每节追加一段含原始 HTML 的段落。
+
+    Args:
+        repeat: 每个样本的重复次数
+
+    Returns:
+        每篇语料、每个引擎一行的结果列表
+    """
+    formatters = {engine: WeChatFormatter(engine=engine) for engine in ('markdown2', 'direct')}
+    rows = []
+    for name, text in build_corpus().items():
+        text = text.replace('---\n\n', '---\n\n' + _RAW_HTML)
+        for engine, formatter in formatters.items():
+            row = {'name': name, 'engine': engine}
+            row['plain'] = time_call(lambda: formatter.convert(text, inline_style=True), repeat)
+            row['sanitized'] = time_call(
+                lambda: formatter.convert(text, inline_style=True, sanitize=True), repeat
+            )
+            row['overhead'] = (row['sanitized'] / row['plain'] - 1) * 100
+            rows.append(row)
+    return rows
+
+
+def bench_formulas(count: int = 200) -> dict:
+    """
+    测量公式渲染的耗时：冷缓存时顺序渲染、并行渲染，以及再次转换（命中缓存）
+
+    Args:
+        count: 文章中不同公式的数量
+
+    Returns:
+        各项耗时（秒）；未安装 matplotlib 时返回 None
+    """
+    import os
+    import tempfile
+
+    from .formula import FormulaCache, FormulaRenderer, is_available
+
+    if not is_available():
+        return None
+    lines = ['# 公式基准测试\n']
+    for n in range(count):
+        lines.append(f'第 {n} 个公式 $\\frac{{x_{{{n}}}^2}}{{\\sqrt{{{n} + y}}}}$，独立公式：\n')
+        lines.append(f'$$\\sum_{{i=1}}^{{{n}}} \\alpha_i x^{{i}} = {n}$$\n')
+    text = '\n'.join(lines)
+
+    result = {'formulas': count * 2}
+    formatter = WeChatFormatter()
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, workers in (('sequential', 1), ('parallel', None)):
+            formatter.formula_renderer = FormulaRenderer(FormulaCache(os.path.join(tmp, name)), workers)
+            start = time.perf_counter()
+            formatter.convert(text, inline_style=True, math=True)
+            result[name] = time.perf_counter() - start
+        # 新的渲染器（空的内存层）读取磁盘缓存，相当于另一个进程再次转换
+        formatter.formula_renderer = FormulaRenderer(FormulaCache(os.path.join(tmp, 'parallel')))
+        start = time.perf_counter()
+        formatter.convert(text, inline_style=True, math=True)
+        result['disk_cache'] = time.perf_counter() - start
+        result['memory_cache'] = time_call(lambda: formatter.convert(text, inline_style=True, math=True), 3)
+    return result
+
+
+def hostile_corpus() -> Dict[str, str]:
+    """
+    生成用于检验转换沙箱的恶意输入
+
+    Returns:
+        名称到 Markdown 文本的映射
+    """
+    return {
+        'furigana-backtrack': 'a【' * 5000,
+        'brace-backtrack': 'x{' * 5000,
+        'deep-list': ''.join('  ' * depth + '- x\n' for depth in range(3000)),
+        'deep-quote': '>' * 5000 + ' x\n',
+        'link-flood': '[a](http://b) ' * 300000,
+        'emphasis-flood': '*a' * 50000,
+        'table-flood': '|a' * 20000 + '|\n' + '|-' * 20000 + '|\n' + ('|x' * 20000 + '|\n') * 20,
+        'plain': _article(2),
+    }
+
+
+def bench_sandbox(wall_time: float = 2.0, max_rss: int = 256 * 1024 * 1024) -> List[dict]:
+    """
+    检验沙箱在恶意输入下能否保持可用
+
+    每篇恶意输入之后立即转换一篇正常文章，记录恶意输入的结果和正常文章的响应耗时。
+
+    Args:
+        wall_time: 单次转换的墙钟时间上限（秒）
+        max_rss: 工作进程的 RSS 上限（字节）
+
+    Returns:
+        每篇输入一行的结果列表
+    """
+    from .sandbox import SandboxError, SandboxPool
+
+    pool = SandboxPool(workers=1, wall_time=wall_time, cpu_time=max(1, int(wall_time)),
+                       max_rss=max_rss, acquire_timeout=30)
+    probe = _article(2)
+    rows = []
+    try:
+        pool.call('convert', probe, inline_style=True)
+        for name, text in hostile_corpus().items():
+            row = {'name': name, 'size': len(text.encode('utf-8'))}
+            start = time.perf_counter()
+            try:
+                pool.call('convert', text, inline_style=True)
+                row['outcome'] = 'ok'
+            except SandboxError as e:
+                row['outcome'] = e.reason
+            except Exception as e:
+                row['outcome'] = 'error'
+            row['seconds'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            pool.call('convert', probe, inline_style=True)
+            row['probe'] = time.perf_counter() - start
+            rows.append(row)
+    finally:
+        pool.close()
+    return rows
+
+
+def bench_daemon(repeat: int = 5) -> Dict[str, float]:
+    """
+    比较命令行冷启动与常驻服务的耗时
+
+    启动一个使用临时 socket 的常驻服务，分别测量：
+    - cold: 命令行以 --no-daemon 在进程内转换
+    - cli_daemon: 命令行通过常驻服务转换
+    - round_trip: 客户端到常驻服务的单次请求往返
+
+    Args:
+        repeat: 每项的重复次数
+
+    Returns:
+        各项耗时中位数（秒）
+    """
+    import os
+    import subprocess
+    import sys
+    import tempfile
+
+    from . import daemon
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, 'bench.sock')
+        article = os.path.join(tmp, 'article.md')
+        output = os.path.join(tmp, 'article.html')
+        with open(article, 'w', encoding='utf-8') as f:
+            f.write(build_corpus()['medium'])
+
+        env = dict(os.environ, **{daemon.SOCKET_ENV: socket_path})
+        env.pop(daemon.DISABLE_ENV, None)
+        command = [sys.executable, '-m', 'wechat_format.cli', 'convert', article, '--inline', '-o', output]
+
+        def run_cli(*extra):
+            subprocess.run(command + list(extra), env=env, check=True, stdout=subprocess.DEVNULL)
+
+        result = {'cold': time_call(lambda: run_cli('--no-daemon'), repeat)}
+        if not daemon.start(socket_path):
+            raise RuntimeError('常驻服务启动失败')
+        try:
+            result['cli_daemon'] = time_call(run_cli, repeat)
+            result['round_trip'] = time_call(
+                lambda: daemon.request('convert_file', socket_path, path=article, inline=True),
+                repeat
+            )
+        finally:
+            daemon.stop(socket_path)
+    return result
@@ -0,0 +1,275 @@
+"""
+跨进程共享的转换缓存
+
+以 SQLite（WAL 模式）文件保存转换结果，同一台机器上的多个进程（多进程部署的 Web 服务、
+命令行、常驻服务、批量转换的工作进程）共用同一份缓存，同一篇文章只需转换一次。
+
+- 缓存键是文章内容和转换选项的 SHA-256，由 WeChatFormatter.cache_key() 生成。
+- 总大小超过上限时按最近访问时间淘汰（LRU）；访问时间按 ACCESS_GRANULARITY 粒度更新，
+  命中时大多只需一次读查询。总大小由触发器维护在 totals 表中，写入时不必汇总全表。
+- 每个线程使用独立的连接，写入在事务中进行；WAL 模式下读写互不阻塞。
+- 缓存出错（磁盘已满、文件损坏、锁等待超时等）时视为未命中，不影响转换。
+
+设置环境变量 WECHAT_FORMAT_CACHE 为缓存文件路径后，命令行、常驻服务和 Web 服务默认启用缓存。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+
+# 通过环境变量指定缓存文件路径
+CACHE_ENV = 'WECHAT_FORMAT_CACHE'
+
+# 缓存总大小上限（字节，按压缩后的大小计算）
+MAX_BYTES = 256 * 1024 * 1024
+
+# 单个条目的大小上限占总大小的比例，避免一篇超大文章挤掉其余缓存
+MAX_ENTRY_RATIO = 0.125
+
+# 淘汰时清理到总大小上限的比例，避免每次写入都触发淘汰
+EVICT_TARGET = 0.9
+
+# 命中时更新访问时间的最小间隔（秒）
+ACCESS_GRANULARITY = 60.0
+
+# 等待其他进程释放写锁的时间（秒）
+BUSY_TIMEOUT = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET size = size + new.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET size = size - old.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET size = size + new.size - old.size WHERE id = 0;
+END;
+-- 先建触发器再初始化，初始化之前其他进程写入的条目也会计入；只有旧版本的缓存文件需要汇总一次
+-- （外层不是聚合查询，已初始化时不产生行；同时初始化的连接由 OR IGNORE 忽略）
+INSERT OR IGNORE INTO totals (id, size)
+    SELECT 0, (SELECT COALESCE(SUM(size), 0) FROM entries) WHERE NOT EXISTS (SELECT 1 FROM totals);
+"""
+
+
+class ConversionCache:
+    """跨进程共享的转换结果缓存，可在多线程间共享，也可传给其他进程（按路径重新打开）"""
+
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES):
+        """
+        Args:
+            path: SQLite 缓存文件路径，所在目录不存在时自动创建
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {'path': self.path, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['max_bytes'])
+
+    def __repr__(self):
+        return f'ConversionCache({self.path!r})'
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接不能跨线程使用，也不能在 fork 出的子进程中继续使用
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的转换结果；未命中或读取失败时返回 None
+        """
+        try:
+            conn = self._connection()
+            row = conn.execute('SELECT value, accessed FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            value, accessed = row
+            now = time.time()
+            if now - accessed > ACCESS_GRANULARITY:
+                conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            return json.loads(zlib.decompress(value))
+        except (sqlite3.Error, OSError, ValueError, zlib.error):
+            return None
+
+    def put(self, key: str, value: dict) -> bool:
+        """
+        写入缓存，总大小超过上限时淘汰最久未访问的条目
+
+        Args:
+            key: 缓存键
+            value: 转换结果（可 JSON 序列化）
+
+        Returns:
+            是否写入成功（条目过大或写入失败时返回 False）
+        """
+        data = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'), 1)
+        if len(data) > self.max_bytes * MAX_ENTRY_RATIO:
+            return False
+        try:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 用 UPSERT 而不是 INSERT OR REPLACE：REPLACE 删除旧行时不触发删除触发器
+                conn.execute(
+                    'INSERT INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (key) DO UPDATE SET '
+                    'value = excluded.value, size = excluded.size, accessed = excluded.accessed',
+                    (key, data, len(data), time.time())
+                )
+                self._evict(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            return True
+        except (sqlite3.Error, OSError):
+            return False
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET
+        cursor = conn.execute('SELECT key, size FROM entries ORDER BY accessed')
+        evicted = []
+        for key, size in cursor:
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        cursor.close()
+        conn.executemany('DELETE FROM entries WHERE key = ?', evicted)
+
+    def stats(self) -> dict:
+        """
+        缓存统计
+
+        Returns:
+            包括条目数 entries、总大小 bytes（压缩后）、上限 max_bytes 和文件路径 path
+        """
+        conn = self._connection()
+        entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        size = conn.execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+        return {'path': self.path, 'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
+
+    def snapshot(self, path: str) -> int:
+        """
+        将缓存保存为快照文件（SQLite 在线备份，不阻塞其他进程读写缓存）
+
+        快照可在部署新版本时用 restore() 恢复到新的缓存文件，避免工作进程冷启动；
+        样式修改后缓存键随之变化，旧快照中的条目不会被误用。
+
+        Args:
+            path: 快照文件路径（已存在时覆盖）
+
+        Returns:
+            快照中的条目数
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f'{path}.tmp'
+        target = sqlite3.connect(tmp, isolation_level=None)
+        try:
+            self._connection().backup(target)
+            # 快照是单个文件，不带 -wal
+            target.execute('PRAGMA journal_mode=DELETE')
+            entries = target.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        finally:
+            target.close()
+        os.replace(tmp, path)
+        return entries
+
+    def restore(self, path: str) -> int:
+        """
+        从快照文件导入缓存条目（已有的条目保留），总大小超过上限时照常淘汰
+
+        Args:
+            path: snapshot() 保存的快照文件
+
+        Returns:
+            导入的条目数
+
+        Raises:
+            FileNotFoundError: 快照文件不存在
+            sqlite3.DatabaseError: 快照文件不是有效的缓存快照
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f'快照文件不存在: {path}')
+        conn = self._connection()
+        conn.execute('ATTACH DATABASE ? AS snapshot', (path,))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                imported = conn.execute(
+                    'INSERT OR IGNORE INTO entries (key, value, size, accessed) '
+                    'SELECT key, value, size, accessed FROM snapshot.entries WHERE size <= ?',
+                    (self.max_bytes * MAX_ENTRY_RATIO,)
+                ).rowcount
+                self._evict(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.execute('DETACH DATABASE snapshot')
+        return imported
+
+    def clear(self):
+        """清空缓存"""
+        conn = self._connection()
+        conn.execute('DELETE FROM entries')
+        conn.execute('VACUUM')
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def default_cache() -> Optional[ConversionCache]:
+    """环境变量 WECHAT_FORMAT_CACHE 指定的缓存；未设置时返回 None"""
+    path = os.environ.get(CACHE_ENV)
+    return ConversionCache(path) if path else None
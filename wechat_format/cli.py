@@ -8,7 +8,42 @@ import os
 import sys
 import click
 from pathlib import Path
-from .converter import WeChatFormatter
+
+
+# 与 converter.ENGINES 保持一致；此处不导入 converter，以免拖慢常驻服务的快速路径
+engine_option = click.option(
+    '--engine', type=click.Choice(['markdown2', 'direct']), default='markdown2', show_default=True,
+    help='渲染引擎（direct 单遍直出，速度更快）'
+)
+
+no_daemon_option = click.option(
+    '--no-daemon', is_flag=True, help='不使用常驻服务，始终在当前进程内转换'
+)
+
+
+compact_option = click.option(
+    '--compact', is_flag=True, help='输出紧凑 HTML（折叠空白、压缩样式），加快粘贴速度'
+)
+
+typography_option = click.option(
+    '--typography', is_flag=True,
+    help='按中文排版规范整理正文（中西文间加空格、中文语境用全角标点、标点不出现在行首）'
+)
+
+math_option = click.option(
+    '--math', is_flag=True, help='将 $...$ 和 $$...$$ 渲染为公式图片（SVG，需要安装 matplotlib）'
+)
+
+
+def embed_options(func):
+    """本地图片内嵌相关选项"""
+    func = click.option('--embed-budget', default=2048, show_default=True,
+                        help='内嵌图片的总量上限（KB），避免剪切板内容过大导致粘贴卡顿')(func)
+    func = click.option('--embed-max-size', default=200, show_default=True,
+                        help='可内嵌的单张图片大小上限（KB）')(func)
+    func = click.option('--embed-images', is_flag=True,
+                        help='将本地小图片内嵌为 base64（粘贴到微信后台时无需手动上传）')(func)
+    return func
 
 
 @click.group()
@@ -24,25 +59,85 @@ def cli():
 
 @cli.command()
 @click.argument('input_file', type=click.Path(exists=True))
-@click.option('-o', '--output', type=click.Path(), help='输出文件路径（可选）')
+@click.option('-o', '--output', type=click.Path(), help='输出文件路径（可选；转换目录或归档时为输出目录）')
 @click.option('-c', '--copy', is_flag=True, help='转换后复制到剪切板')
 @click.option('--inline', is_flag=True, help='使用内联样式（适合复制到微信后台）')
 @click.option('--preview', is_flag=True, help='在浏览器中预览结果')
-def convert(input_file, output, copy, inline, preview):
-    """转换 Markdown 文件为微信公众号格式
+@click.option('-j', '--jobs', default=1, show_default=True,
+              help='并行转换的进程数，用于超大文档（需 --engine direct）或整个目录，0 表示 CPU 核数')
+@click.option('--no-index', is_flag=True, help='转换目录时不更新检索索引')
+@click.option('--check-links', is_flag=True, help='转换后并发检查文章中的外部链接（结果缓存在磁盘上）')
+@engine_option
+@embed_options
+@compact_option
+@typography_option
+@math_option
+@no_daemon_option
+def convert(input_file, output, copy, inline, preview, jobs, no_index, check_links, engine,
+            embed_images, embed_max_size, embed_budget, compact, typography, math, no_daemon):
+    """转换 Markdown 文件（或目录、zip/tar 归档中的所有 Markdown 文件）为微信公众号格式
+    
+    转换目录时，每篇文章输出为同名的 .html 文件，并增量更新目录下的检索索引
+    （供 wechat-format search 使用）。转换归档时直接从归档中读取文章和图片，不解压，
+    输出到 -o 指定的目录（默认为归档旁与归档同名的目录）。
     
     示例:
         wechat-format convert article.md
         wechat-format convert article.md -o output.html
         wechat-format convert article.md --copy
         wechat-format convert article.md --copy --inline
+        wechat-format convert article.md --copy --engine direct
+        wechat-format convert article.md --copy --embed-images
+        wechat-format convert article.md --copy --typography
+        wechat-format convert article.md --copy --math
+        wechat-format convert report.md -o report.html --engine direct -j 8
+        wechat-format convert articles/ -o dist/ -j 0
+        wechat-format convert articles/ -o dist/ --check-links
+        wechat-format convert bundle.zip -o dist/ -j 0
     """
+    from .archive import is_archive
+    
     try:
-        formatter = WeChatFormatter()
+        if is_archive(input_file) and os.path.isfile(input_file):
+            if copy or preview or check_links:
+                raise ValueError('转换归档时不支持 --copy、--preview 和 --check-links')
+            _convert_archive(
+                input_file, output, inline_style=inline, engine=engine, jobs=jobs,
+                embed=(embed_max_size * 1024, embed_budget * 1024) if embed_images else None,
+                compact=compact, typography=typography, math=math
+            )
+            return
+        
+        if os.path.isdir(input_file):
+            if copy or preview:
+                raise ValueError('转换目录时不支持 --copy 和 --preview')
+            _convert_directory(
+                input_file, output, inline_style=inline, engine=engine, jobs=jobs,
+                embed=(embed_max_size * 1024, embed_budget * 1024) if embed_images else None,
+                compact=compact, typography=typography, math=math, update_index=not no_index
+            )
+            if check_links:
+                from .index import find_markdown_files
+                
+                _echo_link_report(_audit_links(find_markdown_files(input_file)))
+            return
+        
+        if jobs != 1:
+            if engine != 'direct':
+                raise ValueError('并行转换（-j）需要 --engine direct')
+            if embed_images:
+                raise ValueError('并行转换（-j）不支持 --embed-images')
         
         # 转换文件
         click.echo(f"正在转换文件: {input_file}")
-        html = formatter.convert_file(input_file, inline_style=inline or copy)
+        html, success, stats = _convert_file(
+            input_file, inline_style=inline or copy, engine=engine,
+            copy=copy, use_daemon=not no_daemon,
+            embed=(embed_max_size * 1024, embed_budget * 1024) if embed_images else None,
+            compact=compact, typography=typography, math=math, jobs=jobs
+        )
+        if stats:
+            _echo_compact_stats(stats)
         
         # 保存到文件
         if output:
@@ -52,7 +147,6 @@ def convert(input_file, output, copy, inline, preview):
         
         # 复制到剪切板
         if copy:
-            success = formatter.copy_to_clipboard(html)
             if success:
                 click.echo("✅ 已复制到剪切板，可直接粘贴到微信公众号后台")
             else:
@@ -67,6 +161,10 @@ def convert(input_file, output, copy, inline, preview):
         # 如果没有指定输出选项，显示帮助信息
         if not output and not copy and not preview:
             click.echo("💡 提示: 使用 --copy 复制到剪切板，或 -o 保存到文件")
+        
+        # 检查外部链接
+        if check_links:
+            _echo_link_report(_audit_links([input_file]))
             
     except Exception as e:
         click.echo(f"❌ 转换失败: {e}", err=True)
@@ -75,19 +173,33 @@ def convert(input_file, output, copy, inline, preview):
 
 @cli.command()
 @click.argument('input_file', type=click.Path(exists=True))
-def copy(input_file):
+@engine_option
+@embed_options
+@compact_option
+@typography_option
+@math_option
+@no_daemon_option
+def copy(input_file, engine, embed_images, embed_max_size, embed_budget, compact, typography,
+         math, no_daemon):
     """快速转换并复制到剪切板
     
     这是 'convert --copy --inline' 的快捷方式
     
     示例:
         wechat-format copy article.md
+        wechat-format copy article.md --embed-images
+        wechat-format copy article.md --typography
     """
     try:
-        formatter = WeChatFormatter()
-        
         click.echo(f"正在转换文件: {input_file}")
-        html, success = formatter.convert_file_and_copy(input_file)
+        html, success, stats = _convert_file(
+            input_file, inline_style=True, engine=engine,
+            copy=True, use_daemon=not no_daemon,
+            embed=(embed_max_size * 1024, embed_budget * 1024) if embed_images else None,
+            compact=compact, typography=typography, math=math
+        )
+        if stats:
+            _echo_compact_stats(stats)
         
         if success:
             click.echo("✅ 转换完成并已复制到剪切板")
@@ -100,22 +212,112 @@ def copy(input_file):
         sys.exit(1)
 
 
+@cli.command()
+@click.argument('input_file', type=click.Path(exists=True))
+@click.option('-m', '--max-size', type=int, required=True, help='每一部分的大小上限')
+@click.option('--unit', type=click.Choice(['chars', 'bytes']), default='chars', show_default=True,
+              help='大小的计量单位：字符数或 UTF-8 字节数')
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False), help='输出目录（默认与输入文件相同）')
+@engine_option
+@typography_option
+@math_option
+def split(input_file, max_size, unit, output_dir, engine, typography, math):
+    """按大小拆分长文章
+    
+    将超出微信后台单篇限制的文章，在标题或段落处拆分为多篇内联样式 HTML，
+    每篇的链接脚注单独编号，依次保存为 <文件名>.part1.html、<文件名>.part2.html ...
+    
+    示例:
+        wechat-format split article.md -m 20000
+        wechat-format split article.md -m 60000 --unit bytes -o parts/
+    """
+    try:
+        from .converter import WeChatFormatter
+        from .ingest import read_text
+        
+        formatter = WeChatFormatter(engine=engine)
+        
+        click.echo(f"正在拆分文件: {input_file}")
+        markdown_text = read_text(input_file)
+        base_dir = os.path.dirname(os.path.abspath(input_file))
+        parts = formatter.convert_parts(
+            markdown_text, max_size, unit=unit, base_dir=base_dir, typography=typography,
+            math=math
+        )
+        
+        input_path = Path(input_file)
+        target_dir = Path(output_dir) if output_dir else input_path.parent
+        target_dir.mkdir(parents=True, exist_ok=True)
+        
+        measure = len if unit == 'chars' else (lambda text: len(text.encode('utf-8')))
+        for number, html in enumerate(parts, 1):
+            part_file = target_dir / f"{input_path.stem}.part{number}.html"
+            with open(part_file, 'w', encoding='utf-8') as f:
+                f.write(html)
+            size = measure(html)
+            mark = '✅' if size <= max_size else '⚠️ 单个段落超出上限'
+            click.echo(f"{mark} 第 {number}/{len(parts)} 部分（{size} {unit}）: {part_file}")
+        
+    except Exception as e:
+        click.echo(f"❌ 拆分失败: {e}", err=True)
+        sys.exit(1)
+
+
 @cli.command()
 @click.option('-p', '--port', default=5000, help='Web 服务器端口 (默认: 5000)')
 @click.option('--debug', is_flag=True, help='启用调试模式')
-def serve(port, debug):
+@click.option('--slow-log', type=click.Path(dir_okay=False), help='慢请求记录文件（NDJSON，按大小轮转）')
+@click.option('--slow-threshold', default=1.0, show_default=True, help='慢请求阈值（秒）')
+@click.option('--capture-input', is_flag=True, help='慢请求记录中保存输入原文，便于 wechat-format slow replay')
+@click.option('--no-sanitize', is_flag=True, help='不过滤 Markdown 中的原始 HTML（仅限本机可信使用）')
+@click.option('--warm-dir', type=click.Path(exists=True, file_okay=False),
+              help='启动时预先转换该目录中最近修改的文章，写入共享缓存')
+@click.option('--warm-limit', default=50, show_default=True, help='预先转换的文章数量')
+@click.option('--cache-snapshot', type=click.Path(exists=True, dir_okay=False),
+              help='启动时从快照恢复共享缓存（wechat-format cache snapshot 保存）')
+@click.option('--no-warmup', is_flag=True, help='不做启动预热')
+@math_option
+def serve(port, debug, slow_log, slow_threshold, capture_input, no_sanitize, warm_dir, warm_limit,
+          cache_snapshot, no_warmup, math):
     """启动 Web 界面服务器
     
-    提供实时预览和转换功能的 Web 界面
+    提供实时预览和转换功能的 Web 界面。转换请求的响应带 Server-Timing 头，
+    可在浏览器开发者工具中查看各阶段耗时。Markdown 中的原始 HTML 默认按白名单过滤。
+    
+    启动后在后台预热（加载组件、启动沙箱进程，可选恢复缓存快照、预先转换最近的文章），
+    完成前 /api/ready 返回 503，可用作负载均衡器的就绪检查。
     
     示例:
         wechat-format serve
         wechat-format serve -p 8080
+        wechat-format serve --slow-log slow.ndjson --slow-threshold 0.5 --capture-input
+        wechat-format serve --warm-dir articles/ --cache-snapshot cache.snapshot
     """
     try:
+        from .cache import CACHE_ENV
         from .web import create_app
         
-        app = create_app()
+        config = {
+            'WARMUP': not no_warmup,
+            'WARMUP_DIR': warm_dir,
+            'WARMUP_LIMIT': warm_limit,
+            'CACHE_SNAPSHOT': cache_snapshot,
+            'MATH': math,
+        }
+        if no_sanitize:
+            config['SANITIZE'] = False
+            click.echo("⚠️ 未过滤原始 HTML，请勿对外提供服务")
+        if slow_log:
+            config.update(
+                SLOW_REQUEST_LOG=slow_log,
+                SLOW_REQUEST_THRESHOLD=slow_threshold,
+                SLOW_REQUEST_CAPTURE_INPUT=capture_input,
+            )
+            click.echo(f"🐢 慢请求（≥ {slow_threshold:g} 秒）记录到: {slow_log}")
+        if (warm_dir or cache_snapshot) and not os.environ.get(CACHE_ENV):
+            click.echo(f"⚠️ 未启用共享缓存（{CACHE_ENV}），--warm-dir 和 --cache-snapshot 不生效")
+        
+        app = create_app(config)
         
         click.echo(f"🚀 启动 Web 服务器...")
         click.echo(f"📱 访问地址: http://localhost:{port}")
@@ -134,17 +336,22 @@ def serve(port, debug):
 
 @cli.command()
 @click.argument('input_file', type=click.Path(exists=True))
-def preview(input_file):
+@engine_option
+@typography_option
+@math_option
+@no_daemon_option
+def preview(input_file, engine, typography, math, no_daemon):
     """在浏览器中预览转换结果
     
     示例:
         wechat-format preview article.md
     """
     try:
-        formatter = WeChatFormatter()
-        
         click.echo(f"正在生成预览: {input_file}")
-        html = formatter.convert_file(input_file, inline_style=False)
+        html, _, _ = _convert_file(
+            input_file, inline_style=False, engine=engine, use_daemon=not no_daemon,
+            typography=typography, math=math
+        )
         
         preview_file = _create_preview_file(html, input_file)
         click.echo(f"📖 预览文件已生成: {preview_file}")
@@ -156,6 +363,561 @@ def preview(input_file):
         sys.exit(1)
 
 
+@cli.group()
+def daemon():
+    """管理常驻转换服务
+    
+    常驻服务保持格式化器和缓存处于热状态，运行后 convert / copy / preview
+    会自动通过它转换，省去冷启动开销；服务未运行时自动回退到进程内转换。
+    """
+    pass
+
+
+@daemon.command('start')
+@click.option('--foreground', is_flag=True, help='在前台运行（不转入后台）')
+def daemon_start(foreground):
+    """启动常驻服务
+    
+    示例:
+        wechat-format daemon start
+    """
+    from . import daemon as daemon_mod
+    
+    if not daemon_mod.is_supported():
+        click.echo("❌ 当前平台不支持 Unix domain socket，无法启动常驻服务", err=True)
+        sys.exit(1)
+    
+    socket_path = daemon_mod.default_socket_path()
+    if foreground:
+        click.echo(f"🚀 常驻服务运行中: {socket_path}")
+        daemon_mod.serve(socket_path)
+    elif daemon_mod.start(socket_path):
+        click.echo(f"✅ 常驻服务已启动: {socket_path}")
+    else:
+        click.echo("❌ 常驻服务启动失败", err=True)
+        sys.exit(1)
+
+
+@daemon.command('stop')
+def daemon_stop():
+    """停止常驻服务"""
+    from . import daemon as daemon_mod
+    
+    if daemon_mod.stop():
+        click.echo("✅ 常驻服务已停止")
+    else:
+        click.echo("💡 常驻服务未运行")
+
+
+@daemon.command('status')
+def daemon_status():
+    """查看常驻服务状态"""
+    from . import daemon as daemon_mod
+    
+    socket_path = daemon_mod.default_socket_path()
+    if daemon_mod.is_running(socket_path):
+        click.echo(f"✅ 常驻服务运行中: {socket_path}")
+    else:
+        click.echo("💡 常驻服务未运行")
+
+
+@cli.group()
+def cache():
+    """管理共享转换缓存
+    
+    缓存文件由环境变量 WECHAT_FORMAT_CACHE 指定，设置后命令行、常驻服务、
+    Web 服务和批量转换共用同一份缓存
+    """
+    pass
+
+
+def _open_cache():
+    from .cache import CACHE_ENV, default_cache
+    
+    conversion_cache = default_cache()
+    if conversion_cache is None:
+        click.echo(f"💡 未启用共享缓存，请设置环境变量 {CACHE_ENV}")
+        sys.exit(1)
+    return conversion_cache
+
+
+@cache.command('stats')
+def cache_stats():
+    """查看缓存条目数和大小"""
+    stats = _open_cache().stats()
+    click.echo(f"📦 缓存文件: {stats['path']}")
+    click.echo(f"条目数: {stats['entries']}")
+    click.echo(f"大小: {stats['bytes'] / 1024 / 1024:.1f}MB / {stats['max_bytes'] / 1024 / 1024:.0f}MB")
+
+
+@cache.command('clear')
+def cache_clear():
+    """清空缓存"""
+    _open_cache().clear()
+    click.echo("✅ 缓存已清空")
+
+
+@cache.command('snapshot')
+@click.argument('snapshot_file', type=click.Path(dir_okay=False))
+def cache_snapshot(snapshot_file):
+    """将缓存保存为快照文件
+    
+    部署新版本时用 wechat-format cache restore 或 serve --cache-snapshot 恢复，
+    最常用的文章无需重新转换。
+    
+    示例:
+        wechat-format cache snapshot cache.snapshot
+    """
+    try:
+        entries = _open_cache().snapshot(snapshot_file)
+    except Exception as e:
+        click.echo(f"❌ 保存快照失败: {e}", err=True)
+        sys.exit(1)
+    click.echo(f"✅ 已保存 {entries} 个条目到: {snapshot_file}")
+
+
+@cache.command('restore')
+@click.argument('snapshot_file', type=click.Path(exists=True, dir_okay=False))
+def cache_restore(snapshot_file):
+    """从快照文件导入缓存条目（保留已有条目）"""
+    try:
+        imported = _open_cache().restore(snapshot_file)
+    except Exception as e:
+        click.echo(f"❌ 恢复快照失败: {e}", err=True)
+        sys.exit(1)
+    click.echo(f"✅ 已导入 {imported} 个条目")
+
+
+@cli.group()
+def slow():
+    """查看和重放 Web 服务记录的慢请求
+    
+    慢请求记录由 wechat-format serve --slow-log 写入
+    """
+    pass
+
+
+@slow.command('list')
+@click.argument('capture_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('-n', '--limit', default=20, show_default=True, help='显示最近的记录数')
+def slow_list(capture_file, limit):
+    """列出慢请求及其各阶段耗时"""
+    import time
+    
+    from .tracing import read_captures
+    
+    records = list(read_captures(capture_file))
+    for record in records[-limit:]:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.get('t', 0)))
+        stages = ' '.join(
+            f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in (record.get('timings') or {}).items()
+        )
+        captured = '📄' if 'markdown' in record else '  '
+        click.echo(
+            f"{when}  {captured} {record.get('path', '')}  {record.get('duration', 0) * 1000:.0f}ms  "
+            f"{str(record.get('sha256', ''))[:12]}  {record.get('chars', 0)} 字符  {stages}"
+        )
+    click.echo(f"共 {len(records)} 条慢请求记录（📄 表示保存了输入，可重放）")
+
+
+@slow.command('replay')
+@click.argument('capture_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--sha', 'sha_prefix', help='只重放输入哈希以此开头的记录')
+@click.option('--engine', type=click.Choice(['markdown2', 'direct']), help='覆盖记录中的渲染引擎')
+@click.option('-r', '--repeat', default=1, show_default=True, help='每条记录重复执行的次数')
+@click.option('--sort', default='cumulative', show_default=True,
+              type=click.Choice(['cumulative', 'tottime', 'calls']), help='性能分析报告的排序方式')
+@click.option('-n', '--limit', default=30, show_default=True, help='性能分析报告显示的函数数量')
+def slow_replay(capture_file, sha_prefix, engine, repeat, sort, limit):
+    """在 cProfile 下重新执行保存了输入的慢请求
+    
+    示例:
+        wechat-format slow replay slow.ndjson
+        wechat-format slow replay slow.ndjson --sha 3f2a --sort tottime
+    """
+    from .tracing import read_captures, replay as replay_captures
+    
+    records = [
+        record for record in read_captures(capture_file)
+        if not sha_prefix or str(record.get('sha256', '')).startswith(sha_prefix)
+    ]
+    replayable = [record for record in records if 'markdown' in record]
+    if not replayable:
+        click.echo(f"💡 没有可重放的记录（共 {len(records)} 条，均未保存输入，"
+                   f"请用 serve --capture-input 记录）", err=True)
+        sys.exit(1)
+    
+    click.echo(f"🔁 重放 {len(replayable)} 条慢请求（跳过 {len(records) - len(replayable)} 条未保存输入的记录）")
+    rows, report = replay_captures(replayable, engine=engine, repeat=repeat, sort=sort, limit=limit)
+    for row in rows:
+        label = f"{row['sha256'][:12]}  {row['path']}"
+        if 'error' in row:
+            click.echo(f"❌ {label}: {row['error']}")
+            continue
+        recorded = f"{row['recorded'] * 1000:.0f}ms" if row['recorded'] is not None else '-'
+        stages = ' '.join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in row['timings'].items())
+        click.echo(f"{label}  记录 {recorded} → 重放 {row['replayed'] * 1000:.0f}ms  {stages}")
+    if report:
+        click.echo()
+        click.echo(report.rstrip())
+
+
+@cli.command()
+@click.argument('query', required=False, default='')
+@click.option('-d', '--directory', type=click.Path(exists=True, file_okay=False), default='.',
+              show_default=True, help='被索引的目录')
+@click.option('-f', '--field', 'fields', multiple=True, metavar='KEY=VALUE',
+              help='按 front-matter 字段过滤，可重复（列表字段包含该值即可）')
+@click.option('-n', '--limit', default=20, show_default=True, help='最多显示的文章数')
+@click.option('-u', '--update', is_flag=True, help='检索前先增量更新索引')
+@click.option('--json', 'as_json', is_flag=True, help='以 JSON 输出结果')
+def search(query, directory, fields, limit, update, as_json):
+    """检索已转换目录中的文章
+    
+    在标题、各级标题、front-matter 和正文中检索，文章需包含所有检索词；
+    带空格的短语用双引号括起。索引在转换目录时建立，也可以用 -u 更新。
+    
+    示例:
+        wechat-format search 性能优化
+        wechat-format search "缓存 并行" -d articles/
+        wechat-format search -f tags=python -f author=张三
+        wechat-format search 排版 -u --json
+    """
+    import json
+    import time
+    
+    from .index import INDEX_FILENAME, CorpusIndex, CorpusIndexError
+    
+    filters = {}
+    for field in fields:
+        key, sep, value = field.partition('=')
+        if not sep or not key:
+            click.echo(f"❌ 字段过滤应为 KEY=VALUE: {field}", err=True)
+            sys.exit(1)
+        filters[key] = value
+    
+    corpus_index = CorpusIndex(directory)
+    if not update and not os.path.exists(corpus_index.path):
+        click.echo(f"💡 {directory} 下没有索引（{INDEX_FILENAME}），"
+                   f"请先运行 wechat-format convert {directory}，或加上 -u 建立索引", err=True)
+        sys.exit(1)
+    try:
+        if update:
+            _echo_index_update(corpus_index.update(), err=as_json)
+        started = time.perf_counter()
+        results = corpus_index.search(query, filters, limit)
+        elapsed = time.perf_counter() - started
+    except CorpusIndexError as e:
+        click.echo(f"❌ {e}", err=True)
+        sys.exit(1)
+    finally:
+        corpus_index.close()
+    
+    if as_json:
+        click.echo(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    
+    from .index import split_query
+    
+    terms = split_query(query)
+    for result in results:
+        click.echo(click.style(result['title'] or result['path'], bold=True)
+                   + f"  {result['path']}  ({result['words']} 字)")
+        if result['snippet']:
+            click.echo('    ' + _highlight(result['snippet'], terms))
+    click.echo(f"🔎 找到 {len(results)} 篇文章（{elapsed * 1000:.1f}ms）")
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('-r', '--report', type=click.Path(dir_okay=False), help='将检查报告（JSON）写入文件')
+@click.option('--json', 'as_json', is_flag=True, help='以 JSON 输出检查报告')
+@click.option('--timeout', default=10.0, show_default=True, help='单个请求的超时（秒）')
+@click.option('-c', '--concurrency', default=32, show_default=True, help='总并发请求数')
+@click.option('--host-concurrency', default=4, show_default=True, help='每个主机的并发请求数')
+@click.option('--ttl', default=24.0, show_default=True, help='检查结果的缓存有效期（小时）')
+@click.option('--no-cache', is_flag=True, help='不读取也不写入检查结果缓存')
+@click.option('--insecure', is_flag=True, help='不校验 HTTPS 证书')
+def links(paths, report, as_json, timeout, concurrency, host_concurrency, ttl, no_cache, insecure):
+    """检查文章（或目录下所有文章）中的外部链接
+    
+    所有文章中的链接去重后并发检查，同一主机复用连接并限制并发数；
+    检查结果缓存在 ~/.cache/wechat-format/links.json（环境变量 WECHAT_FORMAT_LINK_CACHE），
+    有效期内不再重复检查。存在失效链接（4xx）时退出码为 1。
+    
+    示例:
+        wechat-format links article.md
+        wechat-format links articles/ -r links.json
+        wechat-format links articles/ --json --no-cache
+    """
+    import json
+    
+    from .index import find_markdown_files
+    
+    files = []
+    for path in paths:
+        files.extend(find_markdown_files(path) if os.path.isdir(path) else [path])
+    result = _audit_links(files, timeout=timeout, concurrency=concurrency,
+                          host_concurrency=host_concurrency, ttl=ttl * 3600,
+                          use_cache=not no_cache, verify=not insecure)
+    if report:
+        with open(report, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if as_json:
+        click.echo(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        _echo_link_report(result, verbose=True)
+        if report:
+            click.echo(f"📄 检查报告已保存到: {report}")
+    if result['summary']['broken']:
+        sys.exit(1)
+
+
+def _audit_links(files: list, timeout: float = 10.0, concurrency: int = 32, host_concurrency: int = 4,
+                 ttl: float = None, use_cache: bool = True, verify: bool = True) -> dict:
+    """检查文章中的外部链接，返回检查报告"""
+    from .linkcheck import CACHE_TTL, LinkCache, LinkChecker, audit_files
+    
+    cache = LinkCache(ttl=CACHE_TTL if ttl is None else ttl) if use_cache else None
+    checker = LinkChecker(cache=cache, timeout=timeout, concurrency=concurrency,
+                          host_concurrency=host_concurrency, verify=verify)
+    return audit_files(files, checker)
+
+
+def _echo_link_report(report: dict, verbose: bool = False):
+    """输出链接检查的统计和有问题的链接"""
+    summary = report['summary']
+    if not summary['total']:
+        click.echo("🔗 没有外部链接")
+        return
+    for link in report['links']:
+        if link['state'] == 'ok' and not (verbose and link['redirects']):
+            continue
+        if link['state'] == 'ok':
+            click.echo(f"↪️ {link['url']} → {link['final_url']}")
+        else:
+            icon = '❌' if link['state'] == 'broken' else '⚠️'
+            click.echo(f"{icon} {link['url']}: {link['error']}", err=True)
+        for source in link['sources']:
+            click.echo(f"    {source}", err=link['state'] != 'ok')
+    click.echo(f"🔗 检查了 {summary['total']} 个链接（缓存 {summary['cached']} 个，"
+               f"{report['elapsed']:.1f}s）：正常 {summary['ok']}，失效 {summary['broken']}，"
+               f"无法确定 {summary['error']}")
+
+
+def _highlight(text: str, terms: list) -> str:
+    """在终端中高亮检索词"""
+    import re
+    
+    if not terms:
+        return text
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    return pattern.sub(lambda match: click.style(match.group(0), fg='yellow', bold=True), text)
+
+
+@cli.command()
+@click.option('-n', '--repeat', default=5, help='每个样本的重复次数 (默认: 5)')
+@click.option('--daemon', 'daemon_mode', is_flag=True, help='比较常驻服务往返耗时与冷启动耗时')
+@click.option('--themes', 'themes_mode', is_flag=True, help='比较多主题预览时逐个转换与解析一次、渲染多次的耗时')
+@click.option('--parallel', 'parallel_mode', is_flag=True, help='测量单篇大文档多进程转换随进程数的扩展情况')
+@click.option('--sandbox', 'sandbox_mode', is_flag=True, help='用恶意输入检验转换沙箱能否保持可用')
+@click.option('--cache', 'cache_mode', is_flag=True, help='比较共享转换缓存命中与重新转换的耗时')
+@click.option('--formulas', 'formulas_mode', is_flag=True, help='测量数学公式渲染及其缓存的耗时')
+@click.option('--sanitize', 'sanitize_mode', is_flag=True, help='测量原始 HTML 白名单过滤的额外耗时')
+def bench(repeat, daemon_mode, themes_mode, parallel_mode, sandbox_mode, cache_mode, formulas_mode,
+          sanitize_mode):
+    """运行性能基准测试
+    
+    比较 markdown2 与 direct 引擎在内联样式转换上的耗时
+    
+    示例:
+        wechat-format bench
+        wechat-format bench -n 10
+        wechat-format bench --daemon
+        wechat-format bench --themes
+        wechat-format bench --parallel
+        wechat-format bench --sandbox
+        wechat-format bench --cache
+        wechat-format bench --formulas
+        wechat-format bench --sanitize
+    """
+    if sanitize_mode:
+        from .bench import bench_sanitize
+        
+        click.echo(f"{'语料':<8}{'引擎':<12}{'不过滤':>12}{'过滤':>12}{'额外耗时':>10}")
+        for row in bench_sanitize(repeat):
+            click.echo(
+                f"{row['name']:<8}{row['engine']:<12}{row['plain'] * 1000:>12.2f}ms"
+                f"{row['sanitized'] * 1000:>10.2f}ms{row['overhead']:>+9.1f}%"
+            )
+        return
+    
+    if formulas_mode:
+        from .bench import bench_formulas
+        
+        result = bench_formulas()
+        if result is None:
+            click.echo("❌ 公式渲染需要安装 matplotlib")
+            click.echo("💡 运行: pip install matplotlib")
+            sys.exit(1)
+        click.echo(f"公式数量: {result['formulas']}")
+        click.echo(f"冷缓存，顺序渲染: {result['sequential'] * 1000:.0f}ms")
+        click.echo(f"冷缓存，并行渲染: {result['parallel'] * 1000:.0f}ms")
+        click.echo(f"磁盘缓存命中:     {result['disk_cache'] * 1000:.0f}ms")
+        click.echo(f"内存缓存命中:     {result['memory_cache'] * 1000:.0f}ms")
+        return
+    
+    if cache_mode:
+        from .bench import bench_cache
+        
+        click.echo(f"{'语料':<8}{'大小':>10}{'重新转换':>12}{'未命中':>12}{'命中':>12}{'加速比':>10}")
+        for row in bench_cache(repeat):
+            click.echo(
+                f"{row['name']:<8}{row['size']:>10}"
+                f"{row['convert'] * 1000:>12.2f}ms{row['miss'] * 1000:>10.2f}ms"
+                f"{row['hit'] * 1000:>10.2f}ms{row['speedup']:>9.0f}x"
+            )
+        return
+    
+    if daemon_mode:
+        from .bench import bench_daemon
+        
+        result = bench_daemon(repeat)
+        click.echo(f"冷启动（进程内转换）: {result['cold'] * 1000:.1f}ms")
+        click.echo(f"命令行 + 常驻服务:   {result['cli_daemon'] * 1000:.1f}ms")
+        click.echo(f"客户端往返:          {result['round_trip'] * 1000:.2f}ms")
+        return
+    
+    if sandbox_mode:
+        from .bench import bench_sandbox
+        
+        click.echo(f"{'输入':<20}{'大小':>10}{'结果':>10}{'耗时':>10}{'随后正常转换':>14}")
+        for row in bench_sandbox():
+            click.echo(
+                f"{row['name']:<20}{row['size']:>10}{row['outcome']:>10}"
+                f"{row['seconds']:>9.2f}s{row['probe'] * 1000:>14.0f}ms"
+            )
+        return
+    
+    if parallel_mode:
+        from .bench import bench_parallel
+        
+        rows = bench_parallel(repeat)
+        click.echo(f"文档大小: {rows[0]['size'] / 1024 / 1024:.1f}MB")
+        click.echo(f"{'进程数':<8}{'耗时':>12}{'加速比':>10}")
+        for row in rows:
+            click.echo(f"{row['workers']:<10}{row['seconds'] * 1000:>10.0f}ms{row['speedup']:>9.1f}x")
+        return
+    
+    if themes_mode:
+        from .bench import bench_themes
+        
+        click.echo(f"{'语料':<8}{'逐个转换':>12}{'解析一次':>12}{'渲染全部':>12}{'加速比':>10}")
+        for row in bench_themes(repeat):
+            click.echo(
+                f"{row['name']:<8}{row['convert'] * 1000:>12.2f}ms"
+                f"{row['parse'] * 1000:>10.2f}ms{row['render'] * 1000:>10.2f}ms"
+                f"{row['speedup']:>9.1f}x"
+            )
+        return
+    
+    from .bench import bench_engines
+    
+    click.echo(f"{'语料':<8}{'大小':>10}{'markdown2':>14}{'direct':>12}{'加速比':>10}")
+    for row in bench_engines(repeat):
+        click.echo(
+            f"{row['name']:<8}{row['size']:>10}"
+            f"{row['markdown2'] * 1000:>12.2f}ms{row['direct'] * 1000:>10.2f}ms"
+            f"{row['speedup']:>9.1f}x"
+        )
+
+
+@cli.command()
+@click.option('-e', '--editors', default=10, show_default=True, help='同时写作的模拟作者数')
+@click.option('-d', '--duration', default=30.0, show_default=True, help='模拟写作的持续时间（秒）')
+@click.option('--copy-rate', default=0.05, show_default=True, help='每次预览后点击复制的概率')
+@click.option('--preview-api', type=click.Choice(['convert', 'render']), default='convert', show_default=True,
+              help='预览请求使用的接口')
+@click.option('--replay', 'replay_file', type=click.Path(exists=True, dir_okay=False),
+              help='回放请求日志（Web 服务 REQUEST_LOG 配置写入的 NDJSON），代替模拟作者')
+@click.option('--speed', default=1.0, show_default=True, help='回放速度倍数')
+@click.option('--url', help='压测已启动的服务（默认在本进程内启动 Web 应用）')
+@click.option('--no-sandbox', is_flag=True, help='本进程内启动的应用不使用转换沙箱')
+@click.option('--sandbox-workers', type=int, help='本进程内启动的应用的沙箱进程数')
+@click.option('--seed', default=0, show_default=True, help='随机数种子')
+@click.option('--json', 'as_json', is_flag=True, help='以 JSON 输出结果，便于比较多次压测')
+def loadtest(editors, duration, copy_rate, preview_api, replay_file, speed, url,
+             no_sandbox, sandbox_workers, seed, as_json):
+    """对 Web 服务进行压力测试
+    
+    模拟多位作者在编辑器中写作（停止输入 500ms 后发送预览请求，文档逐渐变长），
+    或回放记录的请求日志，统计各接口的吞吐量、延迟分位数和错误率
+    
+    示例:
+        wechat-format loadtest -e 50 -d 60
+        wechat-format loadtest --no-sandbox
+        wechat-format loadtest --replay requests.ndjson --speed 4
+        wechat-format loadtest --url http://127.0.0.1:8000 --json
+    """
+    import contextlib
+    import json
+    from .loadtest import LoadClient, read_log, replay, serve_app, simulate_editors, summarize
+    
+    try:
+        if url:
+            target = contextlib.nullcontext(url)
+        else:
+            from .web import create_app
+            
+            config = {'SANDBOX': not no_sandbox}
+            if sandbox_workers:
+                config['SANDBOX_WORKERS'] = sandbox_workers
+            target = serve_app(create_app(config))
+        
+        # 应用自身的输出（如服务端复制失败的提示）转到 stderr，不混入报告
+        with target as base_url, contextlib.redirect_stdout(sys.stderr):
+            client = LoadClient(base_url)
+            # 等待启动预热完成，避免冷启动计入延迟
+            if not client.wait_ready():
+                click.echo("⚠️ 服务未就绪，继续压测", err=True)
+            if replay_file:
+                records = list(read_log(replay_file))
+                if not as_json:
+                    click.echo(f"🔁 回放 {len(records)} 个请求 -> {base_url}", err=True)
+                elapsed = replay(client, records, speed=speed)
+            else:
+                if not as_json:
+                    click.echo(f"⌨️  {editors} 位作者写作 {duration:g} 秒 -> {base_url}", err=True)
+                elapsed = simulate_editors(
+                    client, editors=editors, duration=duration, copy_rate=copy_rate,
+                    preview_path=f'/api/{preview_api}', seed=seed
+                )
+        
+        rows = summarize(client.samples, elapsed)
+        if as_json:
+            click.echo(json.dumps({'elapsed': elapsed, 'endpoints': rows}, ensure_ascii=False, indent=2))
+            return
+        
+        click.echo(f"{'接口':<14}{'请求数':>8}{'错误率':>9}{'吞吐量':>11}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for row in rows:
+            click.echo(
+                f"{row['path']:<16}{row['requests']:>8}{row['error_rate'] * 100:>10.1f}%"
+                f"{row['throughput']:>10.1f}/s"
+                f"{row['p50'] * 1000:>8.0f}ms{row['p95'] * 1000:>8.0f}ms{row['p99'] * 1000:>8.0f}ms"
+            )
+        for row in rows:
+            for error, count in row['top_errors']:
+                click.echo(f"⚠️  {row['path']}: {error} × {count}")
+        
+    except ImportError:
+        click.echo("❌ 压力测试需要安装 Flask")
+        click.echo("💡 运行: pip install flask")
+        sys.exit(1)
+    except Exception as e:
+        click.echo(f"❌ 压力测试失败: {e}", err=True)
+        sys.exit(1)
+
+
 @cli.command()
 def demo():
     """生成示例 Markdown 文件
@@ -224,6 +986,177 @@ formatter.copy_to_clipboard(html)
         click.echo(f"❌ 生成示例文件失败: {e}", err=True)
 
 
+def _convert_file(input_file: str, inline_style: bool, engine: str,
+                  copy: bool = False, use_daemon: bool = True,
+                  embed: tuple = None, compact: bool = False, typography: bool = False,
+                  math: bool = False, jobs: int = 1) -> tuple:
+    """
+    转换文件：优先使用常驻服务，服务未运行时在当前进程内转换；
+    jobs 不为 1 时在当前进程内多进程并行转换
+    
+    Returns:
+        (HTML, 是否复制成功, 紧凑输出的大小统计或 None)
+    """
+    embed_kwargs = {}
+    if embed is not None:
+        embed_kwargs = {'embed_images': True, 'embed_max_size': embed[0], 'embed_budget': embed[1]}
+    
+    if use_daemon and jobs == 1:
+        from . import daemon as daemon_mod
+        
+        response = daemon_mod.request(
+            'convert_file', path=os.path.abspath(input_file),
+            inline=inline_style, engine=engine, copy=copy, compact=compact,
+            typography=typography, math=math, **embed_kwargs
+        )
+        if response is not None:
+            return response['html'], response.get('copied', False), response.get('stats')
+    
+    from .cache import default_cache
+    from .converter import WeChatFormatter
+    
+    formatter = WeChatFormatter(engine=engine, cache=default_cache())
+    if jobs == 1:
+        html = formatter.convert_file(
+            input_file, inline_style=inline_style, typography=typography, math=math,
+            **embed_kwargs
+        )
+    else:
+        from .ingest import read_text
+        
+        markdown_text = read_text(input_file)
+        html = formatter.convert_parallel(
+            markdown_text, inline_style=inline_style, workers=jobs or None,
+            base_dir=os.path.dirname(os.path.abspath(input_file)), typography=typography,
+            math=math
+        )
+    stats = None
+    if compact:
+        from .compact import compact_html, size_report
+        
+        compacted = compact_html(html)
+        stats = size_report(html, compacted)
+        html = compacted
+    success = formatter.copy_to_clipboard(html) if copy else False
+    return html, success, stats
+
+
+def _convert_directory(directory: str, output_dir: str, inline_style: bool, engine: str,
+                       jobs: int = 1, embed: tuple = None, compact: bool = False,
+                       typography: bool = False, math: bool = False, update_index: bool = True):
+    """转换目录下的所有 Markdown 文件（保持目录结构），并增量更新检索索引"""
+    from .batch import convert_many
+    from .cache import default_cache
+    from .index import CorpusIndex, CorpusIndexError, find_markdown_files
+    from .ingest import read_many
+    
+    files = find_markdown_files(directory)
+    if not files:
+        raise ValueError(f'{directory} 下没有 Markdown 文件')
+    
+    options = {'inline_style': inline_style, 'compact': compact, 'typography': typography,
+               'math': math}
+    if embed is not None:
+        options.update(embed_images=True, embed_max_size=embed[0], embed_budget=embed[1])
+    
+    unreadable = set()
+    
+    def items():
+        # 在线程池中预读后面的文件
+        for index, (path, text, error) in enumerate(read_many(files)):
+            if error is not None:
+                # 读取失败的文章仍占一个序号，转换结果丢弃
+                unreadable.add(index)
+                text = ''
+                click.echo(f"❌ {error}", err=True)
+            yield text, {'base_dir': os.path.dirname(os.path.abspath(path))}
+    
+    click.echo(f"正在转换 {len(files)} 个文件: {directory}")
+    converted = failed = 0
+    for result in convert_many(items(), engine=engine, workers=jobs or None,
+                               cache=default_cache(), **options):
+        source = files[result.index]
+        if result.index in unreadable:
+            failed += 1
+            continue
+        if not result.ok:
+            failed += 1
+            click.echo(f"❌ {source}: {result.error}", err=True)
+            continue
+        target = os.path.splitext(source)[0] + '.html'
+        if output_dir:
+            target = os.path.join(output_dir, os.path.relpath(target, directory))
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write(result.html)
+        converted += 1
+    click.echo(f"✅ 转换完成: {converted} 篇" + (f"，失败 {failed} 篇" if failed else ""))
+    
+    if update_index:
+        corpus_index = CorpusIndex(directory)
+        try:
+            _echo_index_update(corpus_index.update())
+        except CorpusIndexError as e:
+            click.echo(f"⚠️ {e}", err=True)
+        finally:
+            corpus_index.close()
+
+
+def _convert_archive(archive_path: str, output_dir: str, inline_style: bool, engine: str,
+                     jobs: int = 1, embed: tuple = None, compact: bool = False,
+                     typography: bool = False, math: bool = False):
+    """转换 zip/tar 归档中的所有 Markdown 文件（不解压），输出到目录（保持归档内的目录结构）"""
+    from .archive import ARCHIVE_SUFFIXES
+    from .cache import default_cache
+    from .converter import WeChatFormatter
+    
+    if not output_dir:
+        name = os.path.basename(archive_path)
+        suffix = next(suffix for suffix in ARCHIVE_SUFFIXES if name.lower().endswith(suffix))
+        output_dir = os.path.join(os.path.dirname(archive_path), name[:-len(suffix)])
+    
+    embed_kwargs = {}
+    if embed is not None:
+        embed_kwargs = {'embed_images': True, 'embed_max_size': embed[0], 'embed_budget': embed[1]}
+    
+    formatter = WeChatFormatter(engine=engine, cache=default_cache())
+    click.echo(f"正在转换归档: {archive_path}")
+    converted = failed = 0
+    for member, result in formatter.convert_archive(
+        archive_path, inline_style=inline_style, workers=jobs or None, compact=compact,
+        typography=typography, math=math, **embed_kwargs
+    ):
+        if not result.ok:
+            failed += 1
+            click.echo(f"❌ {member}: {result.error}", err=True)
+            continue
+        target = os.path.join(output_dir, *(os.path.splitext(member)[0] + '.html').split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write(result.html)
+        converted += 1
+    if not converted and not failed:
+        raise ValueError(f'{archive_path} 中没有 Markdown 文件')
+    click.echo(f"✅ 转换完成: {converted} 篇，已保存到: {output_dir}"
+               + (f"，失败 {failed} 篇" if failed else ""))
+
+
+def _echo_index_update(counts: dict, err: bool = False):
+    """输出索引更新的统计"""
+    click.echo(
+        f"🔎 索引已更新: 新增 {counts['added']}，更新 {counts['updated']}，"
+        f"移除 {counts['removed']}，未变化 {counts['unchanged']}", err=err
+    )
+
+
+def _echo_compact_stats(stats: dict):
+    """输出紧凑模式的大小统计"""
+    click.echo(
+        f"📦 紧凑输出: {stats['before'] / 1024:.1f}KB → {stats['after'] / 1024:.1f}KB"
+        f"（减少 {stats['saved_percent']}%）"
+    )
+
+
 def _create_preview_file(html: str, input_file: str) -> str:
     """创建预览文件"""
     input_path = Path(input_file)
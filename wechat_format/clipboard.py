@@ -0,0 +1,64 @@
+"""
+剪切板数据格式
+
+构造 Windows 剪切板的 CF_HTML（"HTML Format"）数据。
+CF_HTML 头部记录的 StartHTML / EndHTML / StartFragment / EndFragment 均为字节偏移，
+因此整个载荷以 UTF-8 字节为单位拼装，中文内容下偏移量同样准确。
+"""
+
+# 头部模板：偏移量固定为 10 位数字，头部长度与具体数值无关
+_HEADER_TEMPLATE = (
+    'Version:0.9\n'
+    'StartHTML:{:010d}\n'
+    'EndHTML:{:010d}\n'
+    'StartFragment:{:010d}\n'
+    'EndFragment:{:010d}\n'
+)
+_HEADER_SIZE = len(_HEADER_TEMPLATE.format(0, 0, 0, 0).encode('ascii'))
+
+_HTML_PREFIX = (
+    '<!DOCTYPE html>\n'
+    '<html>\n'
+    '<head>\n'
+    '<meta charset="utf-8">\n'
+    '<style>\n'
+    'body { margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", '
+    '"PingFang SC", "Hiragino Sans GB", "Microsoft YaHei", "Helvetica Neue", Helvetica, Arial, sans-serif; }\n'
+    '</style>\n'
+    '</head>\n'
+    '<body>\n'
+    '<!--StartFragment-->'
+).encode('utf-8')
+
+_HTML_SUFFIX = (
+    '<!--EndFragment-->\n'
+    '</body>\n'
+    '</html>'
+).encode('utf-8')
+
+
+def build_cf_html(fragment: str) -> bytes:
+    """
+    构造 CF_HTML 剪切板数据
+
+    为了修复微信公众号粘贴格式问题，片段中的换行符会被移除，防止内容被拆分成单独行。
+    片段只编码一次，删除换行在字节上一次完成，最后一次性拼接，
+    不会对大文档产生多余的整串拷贝。
+
+    Args:
+        fragment: 要复制的 HTML 片段
+
+    Returns:
+        可直接传给 SetClipboardData 的 UTF-8 字节串
+    """
+    body = fragment.encode('utf-8')
+    if b'\n' in body or b'\r' in body:
+        body = body.translate(None, b'\r\n')
+
+    start_html = _HEADER_SIZE
+    start_fragment = start_html + len(_HTML_PREFIX)
+    end_fragment = start_fragment + len(body)
+    end_html = end_fragment + len(_HTML_SUFFIX)
+
+    header = _HEADER_TEMPLATE.format(start_html, end_html, start_fragment, end_fragment)
+    return b''.join((header.encode('ascii'), _HTML_PREFIX, body, _HTML_SUFFIX))
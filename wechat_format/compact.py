@@ -0,0 +1,285 @@
+"""
+紧凑输出
+
+压缩内联样式 HTML 以加快粘贴速度：
+- 折叠空白，去掉块级标签两侧的空白（<pre>、<textarea>、<script>、<style> 和
+  white-space 为 pre / pre-wrap / pre-line / break-spaces 的元素内保持原样）
+- 缩短颜色（只在颜色属性中，引号内的字符串不变）和长度取值、合并 margin / padding 简写
+- 去掉重复声明，以及与父元素继承值相同的可继承声明
+"""
+
+import html as html_lib
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+# 内容需原样保留的标签
+_PRESERVE_TAGS = {'pre', 'textarea', 'script', 'style'}
+
+# 两侧空白不影响渲染的块级标签
+_BLOCK_TAGS = {
+    'html', 'head', 'body', 'meta', 'title', 'style', 'link', 'script',
+    'div', 'section', 'article', 'header', 'footer', 'p', 'blockquote', 'pre', 'hr', 'br',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'dl', 'dt', 'dd',
+    'table', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td', 'caption',
+}
+
+_VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'source', 'track', 'wbr',
+}
+
+# 可继承的 CSS 属性
+_INHERITED_PROPS = {
+    'color', 'font-family', 'font-size', 'font-style', 'font-weight',
+    'line-height', 'letter-spacing', 'word-spacing', 'text-align', 'text-indent',
+}
+
+# 浏览器默认样式会覆盖继承值的标签与属性；这些情况下不能删除声明
+_UA_OVERRIDES = {
+    'a': {'color'},
+    'b': {'font-weight'},
+    'strong': {'font-weight'},
+    'em': {'font-style'},
+    'i': {'font-style'},
+    'cite': {'font-style'},
+    'var': {'font-style'},
+    'dfn': {'font-style'},
+    'address': {'font-style'},
+    'mark': {'color'},
+    'small': {'font-size'},
+    'big': {'font-size'},
+    'sub': {'font-size'},
+    'sup': {'font-size'},
+    'rt': {'font-size'},
+    'th': {'font-weight', 'text-align'},
+    'caption': {'text-align'},
+    'h1': {'font-size', 'font-weight'},
+    'h2': {'font-size', 'font-weight'},
+    'h3': {'font-size', 'font-weight'},
+    'h4': {'font-size', 'font-weight'},
+    'h5': {'font-size', 'font-weight'},
+    'h6': {'font-size', 'font-weight'},
+    'code': {'font-family', 'font-size'},
+    'pre': {'font-family', 'font-size'},
+    'kbd': {'font-family', 'font-size'},
+    'samp': {'font-family', 'font-size'},
+    'tt': {'font-family', 'font-size'},
+    'input': _INHERITED_PROPS,
+    'button': _INHERITED_PROPS,
+    'select': _INHERITED_PROPS,
+    'textarea': _INHERITED_PROPS,
+}
+
+_NAMED_COLORS = {'white': '#fff', 'black': '#000'}
+
+# 取值中可以包含颜色的属性（另外还有所有以 -color 结尾的属性）
+_COLOR_PROPS = {
+    'color', 'background', 'border', 'border-top', 'border-right', 'border-bottom', 'border-left',
+    'outline', 'box-shadow', 'text-shadow', 'text-decoration', 'column-rule', 'fill', 'stroke',
+}
+
+_TOKEN_RE = re.compile(r'<!--.*?-->|<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>|[^<]+|<', re.DOTALL)
+_TAG_NAME_RE = re.compile(r'<\s*(/?)\s*([a-zA-Z][a-zA-Z0-9]*)')
+_STYLE_ATTR_RE = re.compile(r'(\sstyle\s*=\s*)(?:"([^"]*)"|\'([^\']*)\')', re.IGNORECASE)
+_DECL_RE = re.compile(r'([\w-]+)\s*:\s*((?:[^;"\'(]|"[^"]*"|\'[^\']*\'|\([^)]*\))+)')
+_SPACE_RE = re.compile(r'[ \t\n\r\f]+')
+_HEX_RE = re.compile(r'#([0-9a-fA-F])\1([0-9a-fA-F])\2([0-9a-fA-F])\3\b')
+_HEX_COLOR_RE = re.compile(r'#[0-9a-f]{3,8}\b', re.IGNORECASE)
+_ZERO_UNIT_RE = re.compile(r'(?<![\w.#-])0+(?:\.0+)?(?:px|em|rem|pt)\b')
+_LEADING_ZERO_RE = re.compile(r'(?<![\w.#])0+\.(\d)')
+_COMMA_RE = re.compile(r'\s*,\s*')
+# 相对父元素（或随字体变化）计算的值：子元素写同样的值结果不同，不能当作重复去掉
+_RELATIVE_RE = re.compile(
+    r'(?:\d(?:r?em|ex|ch|r?lh|cap|ic|vw|vh|vmin|vmax)|\d%|\b(?:smaller|larger|bolder|lighter))(?![\w-])',
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r'[a-zA-Z]+')
+_QUOTED_RE = re.compile(r'("[^"]*"|\'[^\']*\')')
+_WHITE_SPACE_RE = re.compile(r'white-space\s*:\s*(?:pre|pre-wrap|pre-line|break-spaces)\b', re.IGNORECASE)
+
+
+def compact_html(html: str) -> str:
+    """
+    压缩 HTML
+
+    Args:
+        html: convert() 输出的 HTML
+
+    Returns:
+        视觉上等价、体积更小的 HTML
+    """
+    parts: List[str] = []
+    is_block: List[bool] = []
+    # 每个片段是否位于需要保留空白的元素内
+    preserved: List[bool] = []
+    # 每层元素：(标签名, 该元素处的继承值, 是否保留空白)；继承值为 None 表示未知
+    stack: List[Tuple[str, Dict[str, Optional[str]], bool]] = []
+
+    for match in _TOKEN_RE.finditer(html):
+        token = match.group(0)
+        preserve = bool(stack) and stack[-1][2]
+        preserved.append(preserve)
+        if token.startswith('<!--') or not token.startswith('<') or token == '<':
+            if preserve or token.startswith('<'):
+                parts.append(token)
+            else:
+                parts.append(_SPACE_RE.sub(' ', token))
+            is_block.append(False)
+            continue
+
+        name_match = _TAG_NAME_RE.match(token)
+        if name_match is None:
+            # <!DOCTYPE> 等声明
+            parts.append(token)
+            is_block.append(True)
+            continue
+
+        closing, name = name_match.group(1), name_match.group(2).lower()
+        if closing:
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth][0] == name:
+                    del stack[depth:]
+                    break
+        else:
+            inherited = stack[-1][1] if stack else {}
+            # white-space 可继承；保守起见，子元素即使改回 normal 也按保留处理
+            keep = preserve or name in _PRESERVE_TAGS or bool(_WHITE_SPACE_RE.search(token))
+            token, own = _compact_tag(token, name, inherited)
+            if name not in _VOID_TAGS and not token.endswith('/>'):
+                stack.append((name, own, keep))
+        parts.append(token)
+        is_block.append(name in _BLOCK_TAGS)
+
+    # 去掉紧邻块级标签的空白（保留空白的元素内除外）
+    for index, part in enumerate(parts):
+        if part.startswith('<') or not part or preserved[index]:
+            continue
+        if part.isspace() and (_is_block_at(is_block, index - 1) or _is_block_at(is_block, index + 1)):
+            parts[index] = ''
+            continue
+        if _is_block_at(is_block, index - 1) and part[0] == ' ':
+            part = part[1:]
+        if _is_block_at(is_block, index + 1) and part[-1:] == ' ':
+            part = part[:-1]
+        parts[index] = part
+    return ''.join(parts)
+
+
+def _is_block_at(is_block: List[bool], index: int) -> bool:
+    return 0 <= index < len(is_block) and is_block[index]
+
+
+def _compact_tag(token: str, name: str,
+                 inherited: Dict[str, Optional[str]]) -> Tuple[str, Dict[str, Optional[str]]]:
+    own = dict(inherited)
+    for prop in _UA_OVERRIDES.get(name, ()):
+        own[prop] = None
+
+    match = _STYLE_ATTR_RE.search(token)
+    if match is None:
+        return token, own
+
+    raw = match.group(2) if match.group(2) is not None else match.group(3)
+    style = compact_style(html_lib.unescape(raw), name, inherited, own)
+    if not style:
+        replacement = ''
+    elif '"' not in style:
+        replacement = f'{match.group(1)}"{style}"'
+    elif "'" not in style:
+        replacement = f"{match.group(1)}'{style}'"
+    else:
+        replacement = f'{match.group(1)}"{html_lib.escape(style)}"'
+    return token[:match.start()] + replacement + token[match.end():], own
+
+
+def compact_style(style: str, tag: str = '',
+                  inherited: Optional[Dict[str, Optional[str]]] = None,
+                  own: Optional[Dict[str, Optional[str]]] = None) -> str:
+    """
+    压缩单个 style 属性值
+
+    Args:
+        style: style 属性值
+        tag: 所属标签名
+        inherited: 父元素处的可继承属性值
+        own: 用于记录本元素处可继承属性值的字典（会被更新）
+
+    Returns:
+        压缩后的 style 值
+    """
+    inherited = inherited or {}
+    overrides = _UA_OVERRIDES.get(tag, ())
+    declarations: Dict[str, str] = {}
+    for prop, value in _DECL_RE.findall(style):
+        prop = prop.lower()
+        declarations.pop(prop, None)  # 重复声明只保留最后一个
+        declarations[prop] = _shorten_value(prop, value.strip())
+
+    kept = []
+    for prop, value in declarations.items():
+        if prop in _INHERITED_PROPS and prop not in overrides:
+            if value == 'inherit':
+                continue
+            if inherited.get(prop) == value and not _RELATIVE_RE.search(value):
+                continue
+        if own is not None and prop in _INHERITED_PROPS:
+            own[prop] = None if value == 'inherit' or _RELATIVE_RE.search(value) else value
+        kept.append(f'{prop}:{value}')
+    return ';'.join(kept)
+
+
+def _shorten_value(prop: str, value: str) -> str:
+    if 'url(' in value:
+        return value
+    color = prop in _COLOR_PROPS or prop.endswith('-color')
+    # 引号内的字符串（如字体名、content）原样保留，只处理引号之间的部分
+    segments = _QUOTED_RE.split(value)
+    for index in range(0, len(segments), 2):
+        segments[index] = _shorten_segment(segments[index], color)
+    value = ''.join(segments)
+    if prop == 'font-weight' and value == 'bold':
+        value = '700'
+    if prop in ('margin', 'padding'):
+        value = _collapse_box(value)
+    return value
+
+
+def _shorten_segment(value: str, color: bool) -> str:
+    value = _SPACE_RE.sub(' ', value)
+    value = _COMMA_RE.sub(',', value)
+    if color:
+        value = _HEX_RE.sub(r'#\1\2\3', value)
+        value = _HEX_COLOR_RE.sub(lambda m: m.group(0).lower(), value)
+        value = _WORD_RE.sub(lambda m: _NAMED_COLORS.get(m.group(0).lower(), m.group(0)), value)
+    value = _ZERO_UNIT_RE.sub('0', value)
+    value = _LEADING_ZERO_RE.sub(r'.\1', value)
+    return value
+
+
+def _collapse_box(value: str) -> str:
+    parts = value.split(' ')
+    if len(parts) == 4 and parts[3] == parts[1]:
+        parts.pop()
+    if len(parts) == 3 and parts[2] == parts[0]:
+        parts.pop()
+    if len(parts) == 2 and parts[1] == parts[0]:
+        parts.pop()
+    return ' '.join(parts)
+
+
+def size_report(before: str, after: str) -> Dict[str, int]:
+    """
+    统计压缩前后的大小
+
+    Args:
+        before: 压缩前的 HTML
+        after: 压缩后的 HTML
+
+    Returns:
+        包含 before / after（UTF-8 字节数）和 saved_percent 的字典
+    """
+    before_size = len(before.encode('utf-8'))
+    after_size = len(after.encode('utf-8'))
+    saved = round((before_size - after_size) * 100 / before_size) if before_size else 0
+    return {'before': before_size, 'after': after_size, 'saved_percent': saved}
@@ -4,18 +4,100 @@
 核心转换功能，将 Markdown 转换为适合微信公众号的 HTML 格式。
 """
 
+import copy
+import hashlib
+import html as html_lib
+import json
+import os
+import posixpath
 import re
+import time
 import markdown2
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
 import pyperclip
-from .styles import BASE_STYLE, HTML_TEMPLATE, WECHAT_INLINE_STYLE
+from .clipboard import build_cf_html
+from .archive import ArchiveDir, ArchiveError, is_archive, open_archive, read_article
+from .compact import compact_html
+from .document import Document, iter_nodes
+from .ingest import InputError, read_text
+from .formula import (
+    PLACEHOLDER as FORMULA_PLACEHOLDER,
+    FormulaRenderer,
+    find_formulas,
+    insert_formulas,
+    is_available as formula_available,
+    restore_nodes,
+    restore_soup,
+    restore_sources,
+)
+from .split import LINK_PLACEHOLDER, Block, assemble_part, split_blocks
+from .images import (
+    EMBED_BUDGET,
+    EMBED_MAX_SIZE,
+    ImageEmbedder,
+    ImageRoot,
+    ImageSizeCache,
+    embed_local_images,
+    local_image_state,
+    probe_local_images,
+)
+from .styles import (
+    BASE_STYLE,
+    CODE_BLOCK_CODE_STYLE,
+    CODE_BLOCK_PRE_STYLE,
+    FOOTNOTE_SECTION_STYLE,
+    HTML_TEMPLATE,
+    TABLE_STRIPE_STYLE,
+    WECHAT_INLINE_STYLE,
+)
+from .sanitize import sanitize_nodes, sanitize_soup
+from .typography import typeset_nodes, typeset_soup
+
+
+# 可选的渲染引擎
+# - markdown2: markdown2 渲染后再用 BeautifulSoup 解析并后处理
+# - direct: 遍历 mistune AST 一次性输出最终 HTML（见 renderer.py）
+ENGINES = ('markdown2', 'direct')
+
+# convert_outputs() 可生成的输出
+# - inline: 内联样式的 HTML 片段（复制到剪切板）
+# - page: 套用 HTML_TEMPLATE 的完整页面（预览）
+# - text: 纯文本
+OUTPUTS = ('inline', 'page', 'text')
+
+_TEXT_BREAK_RE = re.compile(
+    r'<br\s*/?>|</(?:p|div|h[1-6]|li|blockquote|pre|tr|table|hr)>|<hr\s*/?>', re.IGNORECASE
+)
+_TEXT_CELL_RE = re.compile(r'\s*</t[dh]>\s*(?=<t[dh][\s>])', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]*>')
+
+_BLANK_LINES_RE = re.compile(r'\n[ \t]*(?:\n[ \t]*)+')
 
 
 class WeChatFormatter:
     """微信公众号格式化器"""
     
-    def __init__(self):
-        """初始化格式化器"""
+    def __init__(self, engine: str = 'markdown2', cache=None):
+        """
+        初始化格式化器
+        
+        Args:
+            engine: 渲染引擎，'markdown2'（默认）或 'direct'
+            cache: 转换结果缓存（cache.ConversionCache 或缓存文件路径），
+                为 None 时不缓存
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"不支持的渲染引擎: {engine}，可选: {', '.join(ENGINES)}")
+        self.engine = engine
+        if isinstance(cache, str):
+            from .cache import ConversionCache
+            cache = ConversionCache(cache)
+        self.cache = cache
+        self._renderers = {}
+        self.image_sizes = ImageSizeCache()
+        self.image_embedder = ImageEmbedder()
+        # 公式渲染器，首次遇到公式时创建
+        self.formula_renderer = None
         self.markdown_extras = [
             'fenced-code-blocks',
             'tables',
@@ -27,50 +109,479 @@ class WeChatFormatter:
             'code-friendly'
         ]
     
-    def convert(self, markdown_text: str, inline_style: bool = False) -> str:
+    def convert(self, markdown_text: str, inline_style: bool = False,
+                base_dir: str = None, embed_images: bool = False,
+                embed_max_size: int = EMBED_MAX_SIZE,
+                embed_budget: int = EMBED_BUDGET, compact: bool = False,
+                typography: bool = False, sanitize: bool = False, math: bool = False) -> str:
         """
         转换 Markdown 文本为微信公众号 HTML
         
         Args:
             markdown_text: Markdown 文本
             inline_style: 是否使用内联样式（用于复制到剪切板）
+            base_dir: 本地图片的基准目录；指定后会为本地图片补充宽高属性
+            embed_images: 是否将本地小图片内嵌为 base64 data URI
+            embed_max_size: 可内嵌的单张图片字节数上限
+            embed_budget: 整篇文章内嵌图片的总字符数上限
+            compact: 是否输出紧凑 HTML（折叠空白、压缩样式）
+            typography: 是否按中文排版规范整理正文（中西文间加空格、全角标点、行首标点），见 typography.py
+            sanitize: 是否按白名单过滤原始 HTML 的标签、属性和地址（防止 XSS），见 sanitize.py
+            math: 是否将 $...$ 和 $$...$$ 渲染为公式 SVG（需要 matplotlib，见 formula.py）
             
         Returns:
             转换后的 HTML 文本
         """
+        output = 'inline' if inline_style else 'page'
+        return self.convert_outputs(
+            markdown_text, (output,), base_dir=base_dir, embed_images=embed_images,
+            embed_max_size=embed_max_size, embed_budget=embed_budget, compact=compact,
+            typography=typography, sanitize=sanitize, math=math
+        )[output]
+    
+    def convert_outputs(self, markdown_text: str, outputs=OUTPUTS,
+                        base_dir: str = None, embed_images: bool = False,
+                        embed_max_size: int = EMBED_MAX_SIZE,
+                        embed_budget: int = EMBED_BUDGET, compact: bool = False,
+                        typography: bool = False, sanitize: bool = False, math: bool = False,
+                        timings: dict = None) -> dict:
+        """
+        解析一次 Markdown，同时生成多种输出
+        
+        Markdown 只预处理和解析一次，本地图片只探测（和内嵌）一次，
+        各输出只重复最后的样式处理和序列化。
+        
+        Args:
+            markdown_text: Markdown 文本
+            outputs: 需要的输出，可选 'inline'（内联样式片段，用于复制到剪切板）、
+                'page'（套用 HTML_TEMPLATE 的完整页面，用于预览）、'text'（纯文本）
+            base_dir: 本地图片的基准目录；指定后会为本地图片补充宽高属性
+            embed_images: 是否将本地小图片内嵌为 base64 data URI
+            embed_max_size: 可内嵌的单张图片字节数上限
+            embed_budget: 整篇文章内嵌图片的总字符数上限
+            compact: 是否输出紧凑 HTML（对 inline 和 page 生效）
+            typography: 是否按中文排版规范整理正文（中西文间加空格、全角标点、行首标点），见 typography.py
+            sanitize: 是否按白名单过滤原始 HTML 的标签、属性和地址（防止 XSS），见 sanitize.py
+            math: 是否将 $...$ 和 $$...$$ 渲染为公式 SVG（需要 matplotlib，见 formula.py）
+            timings: 传入字典时，各阶段的耗时（秒）累加到其中：preprocess（预处理）、
+                markdown（解析）、postprocess（后处理和样式）、serialise（生成各输出）
+            
+        Returns:
+            输出名到内容的字典
+        """
+        outputs = tuple(dict.fromkeys(outputs))
+        unknown = [name for name in outputs if name not in OUTPUTS]
+        if unknown:
+            raise ValueError(f"不支持的输出: {', '.join(unknown)}，可选: {', '.join(OUTPUTS)}")
+        
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(
+                markdown_text, outputs, base_dir=base_dir, embed_images=embed_images,
+                embed_max_size=embed_max_size, embed_budget=embed_budget, compact=compact,
+                typography=typography, sanitize=sanitize, math=math
+            )
+            results = self.cache.get(key)
+            if results is not None:
+                return results
+        
+        results = self._convert_outputs(
+            markdown_text, outputs, base_dir, embed_images, embed_max_size, embed_budget, compact,
+            typography, sanitize, math, timings
+        )
+        if key is not None:
+            self.cache.put(key, results)
+        return results
+    
+    def cache_key(self, markdown_text: str, outputs=OUTPUTS,
+                  base_dir: str = None, embed_images: bool = False,
+                  embed_max_size: int = EMBED_MAX_SIZE,
+                  embed_budget: int = EMBED_BUDGET, compact: bool = False,
+                  typography: bool = False, sanitize: bool = False, math: bool = False) -> str:
+        """
+        生成 convert_outputs() 结果的缓存键
+        
+        参数与 convert_outputs() 相同。缓存键包括文章内容、渲染引擎、输出和选项，
+        样式表的指纹以及引用的本地图片的路径、修改时间和大小，样式或图片修改后旧的缓存自然失效。
+        
+        Returns:
+            十六进制的 SHA-256 摘要
+        """
+        if embed_images and base_dir is None:
+            # 与 _convert_outputs() 一致，内嵌图片时默认相对当前目录解析
+            base_dir = os.getcwd()
+        options = {
+            'engine': self.engine,
+            'outputs': list(dict.fromkeys(outputs)),
+            'compact': bool(compact),
+            'typography': bool(typography),
+            'sanitize': bool(sanitize),
+            # 未安装 matplotlib 时公式按原文显示，安装后旧的结果应当失效
+            'math': formula_available() if math else None,
+            # 本地图片相对 base_dir 解析，因此 base_dir 也是缓存键的一部分
+            'base_dir': base_dir,
+            # 受限的图片目录（ImageRoot）与同一路径的普通目录解析结果不同
+            'image_root': isinstance(base_dir, ImageRoot),
+            'embed': [embed_max_size, embed_budget] if embed_images else None,
+            'images': local_image_state(markdown_text, base_dir) if base_dir is not None else None,
+            'styles': _style_fingerprint(),
+        }
+        digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(markdown_text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+    
+    def _convert_outputs(self, markdown_text: str, outputs: tuple, base_dir: str,
+                         embed_images: bool, embed_max_size: int, embed_budget: int,
+                         compact: bool, typography: bool = False, sanitize: bool = False,
+                         math: bool = False, timings: dict = None) -> dict:
+        started = time.perf_counter()
         # 预处理 Markdown 文本
-        processed_text = self._preprocess_markdown(markdown_text)
+        processed_text, formulas = self._preprocess_markdown(markdown_text, math)
+        started = _lap(timings, 'preprocess', started)
         
-        # 转换为 HTML
-        html = markdown2.markdown(processed_text, extras=self.markdown_extras)
+        embed = None
+        if embed_images:
+            embed = (embed_max_size, embed_budget)
+            if base_dir is None:
+                base_dir = os.getcwd()
         
-        # 后处理 HTML
-        html = self._postprocess_html(html, inline_style)
+        # 纯文本取自不带内联样式的片段；只要纯文本时不必渲染内联样式
+        styles = []
+        if 'inline' in outputs:
+            styles.append(True)
+        if 'page' in outputs or 'text' in outputs:
+            styles.append(False)
         
-        if inline_style:
-            return html
+        if self.engine == 'direct':
+            # 遍历 AST 直接输出最终 HTML，每种样式只需再走一遍 AST（与 _render_direct 相同，分开计时）
+            document = self._parse_direct(
+                processed_text, base_dir, embed, typography, sanitize, formulas
+            )
+            started = _lap(timings, 'markdown', started)
+            fragments = {
+                inline_style: self._render_document(document, self._get_renderer(inline_style))
+                for inline_style in styles
+            }
         else:
-            return HTML_TEMPLATE.format(style=BASE_STYLE, content=html)
+            # 转换为 HTML
+            html = markdown2.markdown(processed_text, extras=self.markdown_extras)
+            started = _lap(timings, 'markdown', started)
+            
+            # 后处理 HTML
+            fragments = self._postprocess_html(
+                html, styles, base_dir, embed, typography, sanitize, formulas
+            )
+        started = _lap(timings, 'postprocess', started)
+        
+        results = {}
+        if 'inline' in outputs:
+            results['inline'] = insert_formulas(fragments[True], formulas)
+        if 'page' in outputs:
+            results['page'] = HTML_TEMPLATE.format(
+                style=BASE_STYLE, content=insert_formulas(fragments[False], formulas)
+            )
+        if compact:
+            for name in results:
+                results[name] = compact_html(results[name])
+        if 'text' in outputs:
+            # 纯文本中的公式显示原文
+            results['text'] = html_to_text(insert_formulas(fragments[False], formulas, source=True))
+        _lap(timings, 'serialise', started)
+        
+        return {name: results[name] for name in outputs}
+    
+    def parse(self, markdown_text: str, base_dir: str = None, embed_images: bool = False,
+              embed_max_size: int = EMBED_MAX_SIZE,
+              embed_budget: int = EMBED_BUDGET, typography: bool = False,
+              sanitize: bool = False, math: bool = False) -> Document:
+        """
+        解析 Markdown 为可复用的中间表示
+        
+        返回的 Document 已完成预处理、解析和本地图片探测（及内嵌），可以缓存、
+        用 to_json() 序列化，再交给 render() 以不同样式和输出模式多次渲染。
+        中间表示基于 direct 引擎的文档节点，渲染结果与 direct 引擎一致。
+        
+        Args:
+            markdown_text: Markdown 文本
+            base_dir: 本地图片的基准目录
+            embed_images: 是否将本地小图片内嵌为 base64 data URI
+            embed_max_size: 可内嵌的单张图片字节数上限
+            embed_budget: 整篇文章内嵌图片的总字符数上限
+            typography: 是否按中文排版规范整理正文（中西文间加空格、全角标点、行首标点），见 typography.py
+            sanitize: 是否按白名单过滤原始 HTML 的标签、属性和地址（防止 XSS），见 sanitize.py
+            math: 是否将 $...$ 和 $$...$$ 渲染为公式 SVG（需要 matplotlib，见 formula.py）
+            
+        Returns:
+            解析后的文档
+        """
+        embed = None
+        if embed_images:
+            embed = (embed_max_size, embed_budget)
+            if base_dir is None:
+                base_dir = os.getcwd()
+        text, formulas = self._preprocess_markdown(markdown_text, math)
+        return self._parse_direct(text, base_dir, embed, typography, sanitize, formulas)
+    
+    def render(self, document: Document, output: str = 'inline', styles: dict = None,
+               compact: bool = False) -> str:
+        """
+        渲染 parse() 得到的文档
+        
+        Args:
+            document: 解析后的文档
+            output: 'inline'（内联样式片段）、'page'（完整页面）或 'text'（纯文本）
+            styles: 标签到内联样式的映射（主题）；默认 inline 使用 WECHAT_INLINE_STYLE，
+                page 不写内联样式
+            compact: 是否输出紧凑 HTML（对 inline 和 page 生效）
+            
+        Returns:
+            渲染结果
+        """
+        if output not in OUTPUTS:
+            raise ValueError(f"不支持的输出: {output}，可选: {', '.join(OUTPUTS)}")
+        
+        if output == 'text':
+            return html_to_text(insert_formulas(
+                self._render_document(document, self._get_renderer(False)), document.formulas,
+                source=True
+            ))
+        
+        if styles is None:
+            renderer = self._get_renderer(output == 'inline')
+        else:
+            from .renderer import WeChatRenderer
+            renderer = WeChatRenderer(styles)
+        html = insert_formulas(self._render_document(document, renderer), document.formulas)
+        
+        if output == 'page':
+            html = HTML_TEMPLATE.format(style=BASE_STYLE, content=html)
+        
+        if compact:
+            html = compact_html(html)
+        
+        return html
+    
+    def convert_many(self, texts, inline_style: bool = False, workers: int = None,
+                     ordered: bool = True, max_pending: int = None,
+                     base_dir: str = None, compact: bool = False, typography: bool = False,
+                     sanitize: bool = False, math: bool = False):
+        """
+        批量转换多篇文章
+        
+        文章在进程池中并行转换，每个工作进程复用一个热格式化器（及本格式化器的转换缓存）；
+        同一时间读取但尚未产出的文章不超过 max_pending 篇，因此可以直接传入逐条读取数据库记录的生成器。
+        单篇失败时对应结果的 error 为失败原因，其余文章继续转换。
+        
+        Args:
+            texts: Markdown 文本的可迭代对象
+            inline_style: 是否使用内联样式
+            workers: 进程数，默认为 CPU 核数；为 1 时在当前进程内依次转换
+            ordered: 为 True 时按输入顺序产出结果，否则按完成顺序产出
+            max_pending: 已读取但尚未产出的文章数量上限，默认为进程数的 2 倍
+            base_dir: 本地图片的基准目录
+            compact: 是否输出紧凑 HTML
+            typography: 是否按中文排版规范整理正文
+            sanitize: 是否按白名单过滤原始 HTML
+            math: 是否渲染数学公式
+            
+        Returns:
+            BatchResult 的迭代器（index / html / error）
+        """
+        from .batch import convert_many
+        
+        return convert_many(
+            texts, engine=self.engine, workers=workers, ordered=ordered,
+            max_pending=max_pending, formatter=self, cache=self.cache,
+            inline_style=inline_style, base_dir=base_dir, compact=compact, typography=typography,
+            sanitize=sanitize, math=math
+        )
+    
+    def convert_parallel(self, markdown_text: str, inline_style: bool = False,
+                         workers: int = None, base_dir: str = None,
+                         compact: bool = False, typography: bool = False, sanitize: bool = False,
+                         math: bool = False) -> str:
+        """
+        多进程转换单篇大文档（仅 direct 引擎）
+        
+        文档在顶层标题处切分后由进程池并行解析和渲染，链接定义、脚注和链接脚注编号
+        全局处理，输出与 convert() 逐字节一致。文档太小时直接顺序转换。
+        不支持内嵌图片（内嵌总量预算需要按全文顺序分配），需要时请使用 convert()。
+        
+        Args:
+            markdown_text: Markdown 文本
+            inline_style: 是否使用内联样式
+            workers: 进程数，默认为 CPU 核数
+            base_dir: 本地图片的基准目录；指定后会为本地图片补充宽高属性
+            compact: 是否输出紧凑 HTML
+            typography: 是否按中文排版规范整理正文
+            sanitize: 是否按白名单过滤原始 HTML
+            math: 是否渲染数学公式
+            
+        Returns:
+            转换后的 HTML 文本
+        """
+        if self.engine != 'direct':
+            raise ValueError("并行转换仅支持 direct 引擎")
+        
+        from .parallel import render_parallel
+        
+        processed_text, formulas = self._preprocess_markdown(markdown_text, math)
+        styles = WECHAT_INLINE_STYLE if inline_style else None
+        html = render_parallel(processed_text, styles, workers, base_dir, typography, sanitize, formulas)
+        if html is None:
+            html = self._render_direct(
+                processed_text, (inline_style,), base_dir, typography=typography,
+                sanitize=sanitize, formulas=formulas
+            )[inline_style]
+        html = insert_formulas(html, formulas)
+        
+        if not inline_style:
+            html = HTML_TEMPLATE.format(style=BASE_STYLE, content=html)
+        
+        if compact:
+            html = compact_html(html)
+        
+        return html
+    
+    def convert_parts(self, markdown_text: str, budget: int, unit: str = 'chars',
+                      base_dir: str = None, typography: bool = False, sanitize: bool = False,
+                      math: bool = False) -> list:
+        """
+        按大小预算将文章拆分为多篇内联样式 HTML
+        
+        文档只渲染一次：渲染时按顶层块记录 HTML 和外部链接，再优先在标题处拆分，
+        每一部分的链接脚注从 [1] 重新编号。
+        
+        Args:
+            markdown_text: Markdown 文本
+            budget: 每一部分的大小上限
+            unit: 'chars'（字符数）或 'bytes'（UTF-8 字节数）
+            base_dir: 本地图片的基准目录
+            typography: 是否按中文排版规范整理正文
+            sanitize: 是否按白名单过滤原始 HTML
+            math: 是否渲染数学公式
+            
+        Returns:
+            各部分的 HTML 列表
+        """
+        processed_text, formulas = self._preprocess_markdown(markdown_text, math)
+        
+        if self.engine == 'direct':
+            document = self._parse_direct(
+                processed_text, base_dir, typography=typography, sanitize=sanitize,
+                formulas=formulas
+            )
+            blocks = self._get_renderer(True).render_blocks(
+                document.nodes, image_sizes=document.image_sizes, image_srcs=document.image_srcs
+            )
+        else:
+            html = markdown2.markdown(processed_text, extras=self.markdown_extras)
+            blocks = self._postprocess_blocks(html, base_dir, typography, sanitize, formulas)
+        
+        if formulas:
+            # 按最终大小拆分；脚注中的链接文字是纯文本，公式显示原文
+            for block in blocks:
+                block.html = insert_formulas(block.html, formulas)
+                block.links = [(restore_sources(text, formulas), url) for text, url in block.links]
+        
+        return [assemble_part(part) for part in split_blocks(blocks, budget, unit)]
     
-    def convert_file(self, file_path: str, inline_style: bool = False) -> str:
+    def convert_file(self, file_path: str, inline_style: bool = False,
+                     embed_images: bool = False,
+                     embed_max_size: int = EMBED_MAX_SIZE,
+                     embed_budget: int = EMBED_BUDGET, typography: bool = False,
+                     sanitize: bool = False, member: str = None, encoding: str = None,
+                     math: bool = False) -> str:
         """
         转换 Markdown 文件为微信公众号 HTML
         
         Args:
-            file_path: Markdown 文件路径
+            file_path: Markdown 文件路径，也可以是 zip 或 tar 归档（见 archive.py，不解压到磁盘）
             inline_style: 是否使用内联样式
+            embed_images: 是否将本地小图片内嵌为 base64 data URI
+            embed_max_size: 可内嵌的单张图片字节数上限
+            embed_budget: 整篇文章内嵌图片的总字符数上限
+            typography: 是否按中文排版规范整理正文
+            sanitize: 是否按白名单过滤原始 HTML
+            member: 归档中要转换的 Markdown 成员；归档中只有一篇文章时可以省略
+            encoding: 文件编码；为 None 时按 BOM、UTF-8、GB18030 识别（见 ingest.py），
+                Big5、Shift_JIS 等其他编码需要指定
+            math: 是否渲染数学公式
             
         Returns:
             转换后的 HTML 文本
+            
+        Raises:
+            ingest.InputNotFoundError: 文件不存在（也是 FileNotFoundError）
+            ingest.InputEncodingError: 无法识别文件编码（也是 ValueError）
+            ingest.InputError: 其他读取错误
+            archive.ArchiveError: 无法读取归档
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                markdown_text = f.read()
-            return self.convert(markdown_text, inline_style)
-        except FileNotFoundError:
-            raise FileNotFoundError(f"文件不存在: {file_path}")
-        except Exception as e:
-            raise Exception(f"读取文件失败: {e}")
+        if is_archive(file_path):
+            markdown_text, base_dir = read_article(file_path, member, encoding)
+        else:
+            markdown_text = read_text(file_path, encoding)
+            base_dir = os.path.dirname(os.path.abspath(file_path))
+        return self.convert(
+            markdown_text, inline_style, base_dir=base_dir,
+            embed_images=embed_images, embed_max_size=embed_max_size,
+            embed_budget=embed_budget, typography=typography, sanitize=sanitize, math=math
+        )
+    
+    def convert_archive(self, archive_path: str, inline_style: bool = False, workers: int = 1,
+                        ordered: bool = True, embed_images: bool = False,
+                        embed_max_size: int = EMBED_MAX_SIZE,
+                        embed_budget: int = EMBED_BUDGET, compact: bool = False,
+                        typography: bool = False, sanitize: bool = False, math: bool = False):
+        """
+        转换 zip 或 tar 归档中的所有 Markdown 文章，不解压到磁盘
+        
+        Markdown 成员以流的方式读取，图片相对各成员在归档内的位置解析（见 archive.py）；
+        workers 不为 1 时在进程池中并行转换，各工作进程自行打开归档。
+        
+        Args:
+            archive_path: 归档文件路径
+            inline_style: 是否使用内联样式
+            workers: 进程数，默认在当前进程内依次转换；为 None 时使用 CPU 核数
+            ordered: 为 True 时按成员在归档中的顺序产出结果，否则按完成顺序产出
+            embed_images: 是否将归档内的小图片内嵌为 base64 data URI
+            embed_max_size: 可内嵌的单张图片字节数上限
+            embed_budget: 整篇文章内嵌图片的总字符数上限
+            compact: 是否输出紧凑 HTML
+            typography: 是否按中文排版规范整理正文
+            sanitize: 是否按白名单过滤原始 HTML
+            math: 是否渲染数学公式
+            
+        Yields:
+            (成员名称, BatchResult)；无法读取的成员对应结果的 error 为失败原因
+        """
+        from .batch import BatchResult, convert_many
+        
+        archive = open_archive(archive_path)
+        # 压缩的 tar 只能顺序解压，按归档中的顺序逐篇读取
+        members = archive.order(archive.markdown_members())
+        errors = {}
+        
+        def items():
+            for index, member in enumerate(members):
+                try:
+                    text = archive.read_text(member)
+                except (ArchiveError, InputError) as e:
+                    # 读取失败的文章仍占一个序号，转换结果丢弃
+                    errors[index] = f'{type(e).__name__}: {e}'
+                    text = ''
+                yield text, {'base_dir': ArchiveDir(archive_path, posixpath.dirname(member))}
+        
+        options = {'inline_style': inline_style, 'compact': compact, 'typography': typography,
+                   'sanitize': sanitize, 'math': math}
+        if embed_images:
+            options.update(embed_images=True, embed_max_size=embed_max_size, embed_budget=embed_budget)
+        for result in convert_many(items(), engine=self.engine, workers=workers, ordered=ordered,
+                                   formatter=self, cache=self.cache, **options):
+            if result.index in errors:
+                result = BatchResult(result.index, error=errors[result.index])
+            yield members[result.index], result
     
     def copy_to_clipboard(self, content: str) -> bool:
         """
@@ -105,45 +616,13 @@ class WeChatFormatter:
             # HTML格式的注册格式ID
             CF_HTML = win32clipboard.RegisterClipboardFormat("HTML Format")
             
-            # 准备HTML格式的剪切板数据
-            # 为了修复微信公众号复制格式问题，需要确保HTML结构紧凑
-            # 移除不必要的换行符，防止内容被拆分成单独行
-            cleaned_html = html_content.replace('\n', '').replace('\r', '')
-            
-            html_format = f"""Version:0.9
-StartHTML:0000000000
-EndHTML:0000000000
-StartFragment:0000000000
-EndFragment:0000000000
-<!DOCTYPE html>
-<html>
-<head>
-<meta charset="utf-8">
-<style>
-body {{ margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "PingFang SC", "Hiragino Sans GB", "Microsoft YaHei", "Helvetica Neue", Helvetica, Arial, sans-serif; }}
-</style>
-</head>
-<body>
-<!--StartFragment-->{cleaned_html}<!--EndFragment-->
-</body>
-</html>"""
-            
-            # 计算偏移量
-            start_html = html_format.find('<!DOCTYPE')
-            end_html = len(html_format)
-            start_fragment = html_format.find('<!--StartFragment-->') + len('<!--StartFragment-->')
-            end_fragment = html_format.find('<!--EndFragment-->')
-            
-            # 更新偏移量
-            html_format = html_format.replace('StartHTML:0000000000', f'StartHTML:{start_html:010d}')
-            html_format = html_format.replace('EndHTML:0000000000', f'EndHTML:{end_html:010d}')
-            html_format = html_format.replace('StartFragment:0000000000', f'StartFragment:{start_fragment:010d}')
-            html_format = html_format.replace('EndFragment:0000000000', f'EndFragment:{end_fragment:010d}')
+            # 准备HTML格式的剪切板数据（偏移量按字节计算）
+            payload = build_cf_html(html_content)
             
             # 复制到剪切板
             win32clipboard.OpenClipboard()
             win32clipboard.EmptyClipboard()
-            win32clipboard.SetClipboardData(CF_HTML, html_format.encode('utf-8'))
+            win32clipboard.SetClipboardData(CF_HTML, payload)
             win32clipboard.CloseClipboard()
             
             return True
@@ -156,51 +635,102 @@ body {{ margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, "
             print(f"Windows复制失败: {e}")
             return False
     
-    def convert_and_copy(self, markdown_text: str) -> tuple[str, bool]:
+    def convert_and_copy(self, markdown_text: str, base_dir: str = None,
+                         embed_images: bool = False,
+                         embed_max_size: int = EMBED_MAX_SIZE,
+                         embed_budget: int = EMBED_BUDGET) -> tuple[str, bool]:
         """
         转换 Markdown 并复制到剪切板
         
         Args:
             markdown_text: Markdown 文本
+            base_dir: 本地图片的基准目录
+            embed_images: 是否将本地小图片内嵌为 base64 data URI
+            embed_max_size: 可内嵌的单张图片字节数上限
+            embed_budget: 整篇文章内嵌图片的总字符数上限
             
         Returns:
             (转换后的HTML, 是否复制成功)
         """
-        html = self.convert(markdown_text, inline_style=True)
+        html = self.convert(
+            markdown_text, inline_style=True, base_dir=base_dir,
+            embed_images=embed_images, embed_max_size=embed_max_size,
+            embed_budget=embed_budget
+        )
         success = self.copy_to_clipboard(html)
         return html, success
     
-    def convert_file_and_copy(self, file_path: str) -> tuple[str, bool]:
+    def convert_file_and_copy(self, file_path: str, embed_images: bool = False,
+                              embed_max_size: int = EMBED_MAX_SIZE,
+                              embed_budget: int = EMBED_BUDGET) -> tuple[str, bool]:
         """
         转换 Markdown 文件并复制到剪切板
         
         Args:
             file_path: Markdown 文件路径
+            embed_images: 是否将本地小图片内嵌为 base64 data URI
+            embed_max_size: 可内嵌的单张图片字节数上限
+            embed_budget: 整篇文章内嵌图片的总字符数上限
             
         Returns:
             (转换后的HTML, 是否复制成功)
         """
-        html = self.convert_file(file_path, inline_style=True)
+        html = self.convert_file(
+            file_path, inline_style=True, embed_images=embed_images,
+            embed_max_size=embed_max_size, embed_budget=embed_budget
+        )
         success = self.copy_to_clipboard(html)
         return html, success
     
-    def _preprocess_markdown(self, text: str) -> str:
+    def _preprocess_markdown(self, text: str, math: bool = False) -> tuple:
         """
         预处理 Markdown 文本
         
         Args:
             text: 原始 Markdown 文本
+            math: 是否渲染数学公式
             
         Returns:
-            处理后的 Markdown 文本
+            (处理后的 Markdown 文本, 各公式占位符对应的 (公式原文, 渲染结果)，没有公式时为 None)
         """
+        # 数学公式替换为占位符，避免 \frac{a}{b} 等被当作注音或特殊标记处理；
+        # 解析后代码等位置的占位符还原为原文，正文中的在序列化后替换为 SVG
+        formulas = None
+        if math:
+            text, formulas = self._extract_formulas(text)
+        
         # 处理注音符号（日语假名和汉语拼音）
         text = self._process_furigana(text)
         
         # 处理特殊标记
         text = self._process_special_marks(text)
         
-        return text
+        return text, formulas
+    
+    def _extract_formulas(self, text: str) -> tuple:
+        """
+        渲染 $...$ 和 $$...$$ 公式，并在文本中替换为占位符
+        
+        Returns:
+            (替换后的文本, 各占位符对应的 (公式原文, 渲染结果) 列表)
+        """
+        found = find_formulas(text) if '\x02' not in text else []
+        if not found:
+            return text, None
+        if self.formula_renderer is None:
+            self.formula_renderer = FormulaRenderer()
+        rendered = self.formula_renderer.render_all([(latex, display) for _, _, latex, display in found])
+        
+        parts = []
+        formulas = []
+        pos = 0
+        for start, end, latex, display in found:
+            parts.append(text[pos:start])
+            parts.append(FORMULA_PLACEHOLDER.format(len(formulas)))
+            formulas.append((text[start:end], rendered[(latex, display)]))
+            pos = end
+        parts.append(text[pos:])
+        return ''.join(parts), formulas
     
     def _process_furigana(self, text: str) -> str:
         """
@@ -248,33 +778,197 @@ body {{ margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, "
         
         return text
     
-    def _postprocess_html(self, html: str, inline_style: bool = False) -> str:
+    def _get_renderer(self, inline_style: bool):
+        """获取（并缓存）direct 引擎的渲染器"""
+        renderer = self._renderers.get(inline_style)
+        if renderer is None:
+            from .renderer import WeChatRenderer
+            renderer = WeChatRenderer(WECHAT_INLINE_STYLE if inline_style else None)
+            self._renderers[inline_style] = renderer
+        return renderer
+    
+    def _prepare_images(self, srcs: list, base_dir: str, embed: tuple = None) -> tuple:
+        """
+        探测本地图片尺寸，并按需将小图片编码为 data URI
+        
+        Args:
+            srcs: 文档中的图片地址（按文档顺序）
+            base_dir: 本地图片的基准目录
+            embed: (单张上限, 总量上限)，为 None 时不内嵌
+            
+        Returns:
+            (src 到宽高的映射, src 到 data URI 的映射)
+        """
+        sizes = probe_local_images(srcs, base_dir, self.image_sizes)
+        data_uris = {}
+        if embed is not None:
+            data_uris = embed_local_images(srcs, base_dir, self.image_embedder, *embed)
+        return sizes, data_uris
+    
+    def _render_direct(self, text: str, styles=(False,),
+                       base_dir: str = None, embed: tuple = None, typography: bool = False,
+                       sanitize: bool = False, formulas: list = None) -> dict:
+        """
+        使用 direct 引擎渲染
+        
+        Args:
+            text: 预处理后的 Markdown 文本
+            styles: 需要渲染的样式（True 为内联样式）
+            base_dir: 本地图片的基准目录
+            embed: 图片内嵌限制 (单张上限, 总量上限)
+            typography: 是否按中文排版规范整理文本节点
+            sanitize: 是否按白名单过滤原始 HTML
+            formulas: 公式占位符对应的 (公式原文, 渲染结果)；片段中的占位符由调用方替换
+            
+        Returns:
+            样式到 HTML 片段的字典
+        """
+        document = self._parse_direct(text, base_dir, embed, typography, sanitize, formulas)
+        return {
+            inline_style: self._render_document(document, self._get_renderer(inline_style))
+            for inline_style in styles
+        }
+    
+    def _parse_direct(self, text: str, base_dir: str = None, embed: tuple = None,
+                      typography: bool = False, sanitize: bool = False,
+                      formulas: list = None) -> Document:
+        """
+        解析文档节点并准备本地图片
+        
+        Returns:
+            解析后的文档
+        """
+        from .renderer import parse_markdown
+        nodes = parse_markdown(text)
+        if formulas:
+            restore_nodes(nodes, formulas)
+        if sanitize:
+            sanitize_nodes(nodes)
+        if typography:
+            typeset_nodes(nodes)
+        
+        image_sizes = image_srcs = None
+        if base_dir is not None:
+            srcs = [node.attrs['url'] for node in iter_nodes(nodes, 'image')]
+            image_sizes, image_srcs = self._prepare_images(srcs, base_dir, embed)
+        
+        return Document(nodes, image_sizes, image_srcs, formulas)
+    
+    @staticmethod
+    def _render_document(document: Document, renderer) -> str:
+        return renderer.render(
+            document.nodes, image_sizes=document.image_sizes, image_srcs=document.image_srcs
+        )
+    
+    def _postprocess_html(self, html: str, styles=(False,),
+                          base_dir: str = None, embed: tuple = None,
+                          typography: bool = False, sanitize: bool = False,
+                          formulas: list = None) -> dict:
         """
         后处理 HTML
         
         Args:
             html: 原始 HTML
-            inline_style: 是否使用内联样式
+            styles: 需要生成的样式（True 为内联样式）
+            base_dir: 本地图片的基准目录
+            embed: 图片内嵌限制 (单张上限, 总量上限)
+            typography: 是否按中文排版规范整理文本节点
+            sanitize: 是否按白名单过滤原始 HTML
+            formulas: 公式占位符对应的 (公式原文, 渲染结果)；片段中的占位符由调用方替换
             
         Returns:
-            处理后的 HTML
+            样式到处理后 HTML 的字典
         """
         soup = BeautifulSoup(html, 'html.parser')
+        if formulas:
+            restore_soup(soup, formulas)
         
-        if inline_style:
-            # 添加内联样式
-            self._add_inline_styles(soup)
+        # 各样式共用过滤和排版结果
+        if sanitize:
+            sanitize_soup(soup)
+        if typography:
+            typeset_soup(soup)
         
-        # 处理链接（外部链接转为脚注）
-        self._process_links(soup)
+        # 本地图片只探测一次，各样式共用
+        images = None
+        if base_dir is not None:
+            srcs = [img.get('src', '') for img in soup.find_all('img')]
+            if srcs:
+                images = self._prepare_images(srcs, base_dir, embed)
         
-        # 处理表格
-        self._process_tables(soup)
+        fragments = {}
+        for index, inline_style in enumerate(styles):
+            # 最后一种样式直接修改原文档，其余在副本上处理
+            tree = soup if index == len(styles) - 1 else copy.copy(soup)
+            
+            if inline_style:
+                # 添加内联样式
+                self._add_inline_styles(tree)
+            
+            # 处理链接（外部链接转为脚注）
+            self._process_links(tree)
+            
+            # 处理表格
+            self._process_tables(tree)
+            
+            # 处理代码块
+            self._process_code_blocks(tree)
+            
+            # 处理本地图片
+            if images is not None:
+                self._apply_images(tree, *images)
+            
+            fragments[inline_style] = str(tree)
         
-        # 处理代码块
+        return fragments
+    
+    def _postprocess_blocks(self, html: str, base_dir: str = None, typography: bool = False,
+                            sanitize: bool = False, formulas: list = None) -> list:
+        """
+        以内联样式后处理 HTML，并按顶层块拆分，供按大小拆分文章使用
+        
+        Args:
+            html: 原始 HTML
+            base_dir: 本地图片的基准目录
+            typography: 是否按中文排版规范整理文本节点
+            sanitize: 是否按白名单过滤原始 HTML
+            formulas: 公式占位符对应的 (公式原文, 渲染结果)
+            
+        Returns:
+            各顶层块，外部链接编号为占位符
+        """
+        soup = BeautifulSoup(html, 'html.parser')
+        if formulas:
+            restore_soup(soup, formulas)
+        if sanitize:
+            sanitize_soup(soup)
+        if typography:
+            typeset_soup(soup)
+        self._add_inline_styles(soup)
+        self._process_tables(soup)
         self._process_code_blocks(soup)
+        if base_dir is not None:
+            self._process_images(soup, base_dir)
         
-        return str(soup)
+        blocks = []
+        for node in list(soup.contents):
+            if isinstance(node, NavigableString):
+                text = node.output_ready()
+                if blocks and not node.strip():
+                    blocks[-1].html += text
+                else:
+                    blocks.append(Block(text, []))
+                continue
+            
+            links = []
+            for link in node.find_all('a'):
+                href = link.get('href', '')
+                if href.startswith('http'):
+                    link_text = link.get_text()
+                    links.append((link_text, href))
+                    link.replace_with(link_text + LINK_PLACEHOLDER.format(len(links)))
+            blocks.append(Block(str(node), links, node.name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')))
+        return blocks
     
     def _add_inline_styles(self, soup: BeautifulSoup):
         """添加内联样式"""
@@ -301,7 +995,7 @@ body {{ margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, "
         
         # 添加脚注
         if footnotes:
-            footnote_section = soup.new_tag('div', style='margin-top: 2em; padding-top: 1em; border-top: 1px solid #ddd; font-size: 14px; color: #666;')
+            footnote_section = soup.new_tag('div', style=FOOTNOTE_SECTION_STYLE)
             footnote_section.string = '\n'.join(footnotes)
             soup.append(footnote_section)
     
@@ -312,7 +1006,7 @@ body {{ margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, "
             rows = table.find_all('tr')
             for i, row in enumerate(rows):
                 if i > 0 and i % 2 == 0:  # 跳过表头，偶数行
-                    row['style'] = row.get('style', '') + '; background-color: #f8f9fa;'
+                    row['style'] = row.get('style', '') + '; ' + TABLE_STRIPE_STYLE
     
     def _process_code_blocks(self, soup: BeautifulSoup):
         """处理代码块"""
@@ -320,8 +1014,70 @@ body {{ margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, "
             code = pre.find('code')
             if code:
                 # 添加代码块样式
-                pre['style'] = 'background-color: #2c3e50; color: #ecf0f1; padding: 1em; border-radius: 5px; overflow-x: auto; margin: 1em 0;'
-                code['style'] = 'background-color: transparent; color: inherit; font-family: "SFMono-Regular", Consolas, monospace;'
+                pre['style'] = CODE_BLOCK_PRE_STYLE
+                code['style'] = CODE_BLOCK_CODE_STYLE
+    
+    def _process_images(self, soup: BeautifulSoup, base_dir: str, embed: tuple = None):
+        """为本地图片补充宽高属性，避免预览时布局抖动；按需内嵌小图片"""
+        images = soup.find_all('img')
+        if not images:
+            return
+        srcs = [img.get('src', '') for img in images]
+        sizes, data_uris = self._prepare_images(srcs, base_dir, embed)
+        self._apply_images(soup, sizes, data_uris)
+    
+    def _apply_images(self, soup: BeautifulSoup, sizes: dict, data_uris: dict):
+        """将已探测的图片尺寸和 data URI 写入 <img>"""
+        for img in soup.find_all('img'):
+            src = img.get('src', '')
+            size = sizes.get(src)
+            if size and not img.has_attr('width') and not img.has_attr('height'):
+                img['width'], img['height'] = str(size[0]), str(size[1])
+            if src in data_uris:
+                img['src'] = data_uris[src]
+
+
+def html_to_text(html: str) -> str:
+    """
+    将 HTML 片段转换为纯文本
+    
+    块级元素和 <br> 处换行，其余标签直接去掉。
+    
+    Args:
+        html: HTML 片段
+        
+    Returns:
+        纯文本
+    """
+    text = _TEXT_CELL_RE.sub('\t', html)
+    text = _TEXT_BREAK_RE.sub('\n', text)
+    text = _TAG_RE.sub('', text)
+    text = html_lib.unescape(text)
+    text = _BLANK_LINES_RE.sub('\n\n', text)
+    return text.strip() + '\n' if text.strip() else ''
+
+
+_fingerprint = None
+
+
+def _style_fingerprint() -> str:
+    """样式表和版本号的指纹，用作缓存键的一部分"""
+    global _fingerprint
+    if _fingerprint is None:
+        from . import __version__, styles
+        
+        names = sorted(name for name in vars(styles) if name.isupper())
+        data = repr([__version__] + [(name, getattr(styles, name)) for name in names])
+        _fingerprint = hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+    return _fingerprint
+
+
+def _lap(timings, stage: str, since: float) -> float:
+    """将 since 到现在的耗时累加到 timings[stage]（timings 为 None 时不记录），返回现在的时间"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - since
+    return now
 
 
 # 便捷函数
@@ -0,0 +1,339 @@
+"""
+微信公众号格式化工具 - 常驻转换服务
+
+在后台常驻一个进程，保持格式化器和转换缓存处于热状态，通过 Unix domain socket
+为命令行提供转换服务，从而省去每次调用时导入依赖和初始化的冷启动开销。
+
+本模块的客户端部分只依赖标准库，保证命令行在连接常驻服务时足够轻量。
+"""
+
+import hashlib
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# 通过环境变量指定 socket 路径，或设置 WECHAT_FORMAT_NO_DAEMON=1 禁用常驻服务
+SOCKET_ENV = 'WECHAT_FORMAT_SOCKET'
+DISABLE_ENV = 'WECHAT_FORMAT_NO_DAEMON'
+
+# 缓存的转换结果数量上限
+CACHE_SIZE = 128
+
+# 客户端连接超时（秒）
+CONNECT_TIMEOUT = 0.2
+REQUEST_TIMEOUT = 60
+
+
+class DaemonError(Exception):
+    """常驻服务返回的转换错误"""
+
+
+def is_supported() -> bool:
+    """当前平台是否支持 Unix domain socket"""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def _private_dir() -> str:
+    """默认 socket 所在的目录：$XDG_RUNTIME_DIR，未设置时为临时目录下当前用户私有（0700）的子目录"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+    user = os.getuid() if hasattr(os, 'getuid') else os.getpid()
+    return os.path.join(tempfile.gettempdir(), f'wechat-format-{user}')
+
+
+def default_socket_path() -> str:
+    """获取默认的 socket 路径"""
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    return os.path.join(_private_dir(), 'wechat-format.sock')
+
+
+def _ensure_private_dir(directory: str):
+    """
+    创建（或检查）只有当前用户可以访问的目录，防止其他用户预先创建目录或替换其中的 socket
+
+    Raises:
+        DaemonError: 目录属于其他用户，或其他用户可以访问
+    """
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise DaemonError(f'socket 目录不安全（应为当前用户所有且权限为 0700）: {directory}')
+
+
+def _owned_socket(path: str) -> bool:
+    """path 是否为当前用户创建的 socket（连接前检查，避免连到其他用户伪造的服务）"""
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+
+
+# ---- 客户端 ----
+
+def request(op: str, socket_path: Optional[str] = None, **params) -> Optional[dict]:
+    """
+    向常驻服务发送请求
+
+    Args:
+        op: 操作名（ping / convert_file / convert / shutdown）
+        socket_path: socket 路径，默认使用 default_socket_path()
+        **params: 操作参数
+
+    Returns:
+        服务端响应；服务未运行或被禁用时返回 None
+
+    Raises:
+        DaemonError: 服务端处理请求失败
+    """
+    if not is_supported() or os.environ.get(DISABLE_ENV):
+        return None
+    socket_path = socket_path or default_socket_path()
+    if not _owned_socket(socket_path):
+        # 服务未运行，或 socket 不属于当前用户
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            # socket 文件残留但服务已退出
+            return None
+        sock.settimeout(REQUEST_TIMEOUT)
+        payload = dict(params, op=op)
+        try:
+            sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as f:
+                line = f.readline()
+        except OSError:
+            # 服务正在退出，或请求超时
+            return None
+    finally:
+        sock.close()
+
+    if not line:
+        return None
+    response = json.loads(line)
+    if not response.get('ok'):
+        raise DaemonError(response.get('error', '未知错误'))
+    return response
+
+
+def is_running(socket_path: Optional[str] = None) -> bool:
+    """常驻服务是否正在运行"""
+    try:
+        return request('ping', socket_path) is not None
+    except DaemonError:
+        return False
+
+
+def start(socket_path: Optional[str] = None, wait: float = 5.0) -> bool:
+    """
+    在后台启动常驻服务
+
+    Args:
+        socket_path: socket 路径
+        wait: 等待服务就绪的最长时间（秒）
+
+    Returns:
+        服务是否已就绪
+    """
+    socket_path = socket_path or default_socket_path()
+    if is_running(socket_path):
+        return True
+    subprocess.Popen(
+        [sys.executable, '-m', 'wechat_format.daemon', socket_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if is_running(socket_path):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def stop(socket_path: Optional[str] = None) -> bool:
+    """
+    停止常驻服务
+
+    Returns:
+        是否有正在运行的服务被停止
+    """
+    socket_path = socket_path or default_socket_path()
+    try:
+        stopped = request('shutdown', socket_path) is not None
+    except DaemonError:
+        return False
+    # 等待服务端清理 socket 文件
+    deadline = time.monotonic() + 2.0
+    while stopped and os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return stopped
+
+
+# ---- 服务端 ----
+
+class ConversionService:
+    """常驻服务的转换逻辑：保持热格式化器并缓存转换结果"""
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        from .cache import default_cache
+        from .converter import ENGINES, WeChatFormatter
+
+        # 设置了 WECHAT_FORMAT_CACHE 时，内存缓存未命中再查共享缓存
+        shared_cache = default_cache()
+        self.formatters = {
+            engine: WeChatFormatter(engine=engine, cache=shared_cache) for engine in ENGINES
+        }
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 预热：加载解析器和渲染器
+        for formatter in self.formatters.values():
+            formatter.convert('# warm up', inline_style=True)
+            formatter.convert('# warm up', inline_style=False)
+
+    def handle(self, payload: dict) -> dict:
+        """处理一次请求"""
+        op = payload.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid()}
+        if op == 'convert':
+            return self._convert(payload, payload.get('markdown', ''))
+        if op == 'convert_file':
+            from .archive import is_archive, read_article
+            from .ingest import read_text
+
+            path = payload['path']
+            if is_archive(path):
+                # 归档中的文章和图片直接从归档读取（与 WeChatFormatter.convert_file 一致）
+                markdown_text, base_dir = read_article(path, payload.get('member'))
+            else:
+                markdown_text = read_text(path)
+                base_dir = os.path.dirname(os.path.abspath(path))
+            return self._convert(payload, markdown_text, base_dir)
+        raise ValueError(f'未知操作: {op}')
+
+    def _convert(self, payload: dict, markdown_text: str, base_dir: Optional[str] = None) -> dict:
+        engine = payload.get('engine', 'markdown2')
+        inline_style = bool(payload.get('inline', False))
+        formatter = self.formatters[engine]
+
+        embed_kwargs = {
+            name: payload[name]
+            for name in ('embed_images', 'embed_max_size', 'embed_budget', 'typography', 'math')
+            if name in payload
+        }
+
+        # 本地图片相对 base_dir 解析，因此 base_dir 和内嵌、排版选项也是缓存键的一部分；
+        # 引用的本地图片的路径、修改时间和大小也计入，图片修改后不会返回旧结果
+        image_dir = base_dir
+        if image_dir is None and embed_kwargs.get('embed_images'):
+            image_dir = os.getcwd()
+        images = ()
+        if image_dir is not None:
+            from .images import local_image_state
+
+            images = tuple(tuple(state) for state in local_image_state(markdown_text, image_dir))
+        digest = hashlib.sha256(markdown_text.encode('utf-8')).hexdigest()
+        key = (engine, inline_style, base_dir, tuple(sorted(embed_kwargs.items())), images, digest)
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+        cached = html is not None
+        if not cached:
+            html = formatter.convert(
+                markdown_text, inline_style=inline_style, base_dir=base_dir, **embed_kwargs
+            )
+            with self._lock:
+                self._cache[key] = html
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        response = {'ok': True, 'html': html, 'cached': cached}
+        if payload.get('compact'):
+            from .compact import compact_html, size_report
+
+            compacted = compact_html(html)
+            response['stats'] = size_report(html, compacted)
+            response['html'] = html = compacted
+        if payload.get('copy'):
+            response['copied'] = formatter.copy_to_clipboard(html)
+        return response
+
+
+def serve(socket_path: Optional[str] = None):
+    """
+    在前台运行常驻服务，直到收到 shutdown 请求
+
+    Args:
+        socket_path: socket 路径
+    """
+    import socketserver
+
+    socket_path = socket_path or default_socket_path()
+    service = ConversionService()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                payload = json.loads(line)
+                if payload.get('op') == 'shutdown':
+                    response = {'ok': True}
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                else:
+                    response = service.handle(payload)
+            except Exception as e:
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if directory == os.path.abspath(_private_dir()):
+        _ensure_private_dir(directory)
+    if os.path.lexists(socket_path):
+        os.unlink(socket_path)
+    # 绑定前设置 umask，socket 文件创建时即为 0600，不存在其他用户可以连接的窗口
+    umask = os.umask(0o177)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(umask)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1] if len(sys.argv) > 1 else None)
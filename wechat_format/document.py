@@ -0,0 +1,130 @@
+"""
+文档中间表示
+
+将 mistune AST 转换为紧凑的节点树，连同本地图片的探测结果一起组成 Document。
+Document 可以缓存或序列化为 JSON，之后用不同的样式表和输出模式反复渲染，
+无需再次预处理和解析 Markdown。
+"""
+
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class Node:
+    """文档节点（块级或行内元素）"""
+
+    __slots__ = ('type', 'raw', 'attrs', 'children')
+
+    def __init__(self, type: str, raw: Optional[str] = None, attrs: Optional[dict] = None,
+                 children: Optional[List['Node']] = None):
+        """
+        Args:
+            type: 节点类型，与 mistune token 类型一致（如 'paragraph'、'text'）
+            raw: 文本类节点的原始内容
+            attrs: 节点属性（如标题级别、链接地址）
+            children: 子节点；叶子节点为 None
+        """
+        self.type = type
+        self.raw = raw
+        self.attrs = attrs or {}
+        self.children = children
+
+    @classmethod
+    def from_token(cls, token: dict) -> 'Node':
+        """由 mistune token 构造节点"""
+        children = token.get('children')
+        if children is not None:
+            children = [cls.from_token(child) for child in children]
+        return cls(token['type'], token.get('raw'), token.get('attrs'), children)
+
+    def to_data(self) -> list:
+        """转换为可 JSON 序列化的紧凑列表 [类型, 原文, 属性, 子节点]，省略末尾的空值"""
+        data = [
+            self.type,
+            self.raw,
+            self.attrs or None,
+            None if self.children is None else [child.to_data() for child in self.children],
+        ]
+        while data[-1] is None:
+            data.pop()
+        return data
+
+    @classmethod
+    def from_data(cls, data: list) -> 'Node':
+        """由 to_data() 的结果还原节点"""
+        type, raw, attrs, children = (list(data) + [None, None, None])[:4]
+        if children is not None:
+            children = [cls.from_data(child) for child in children]
+        return cls(type, raw, attrs, children)
+
+
+class Document:
+    """解析后的文档：节点树、本地图片信息和公式"""
+
+    __slots__ = ('nodes', 'image_sizes', 'image_srcs', 'formulas')
+
+    def __init__(self, nodes: List[Node],
+                 image_sizes: Optional[Dict[str, Tuple[int, int]]] = None,
+                 image_srcs: Optional[Dict[str, str]] = None,
+                 formulas: Optional[List[Tuple[str, str]]] = None):
+        """
+        Args:
+            nodes: 顶层节点
+            image_sizes: 图片 src 到 (宽, 高) 的映射
+            image_srcs: 图片 src 的替换地址（如内嵌的 data URI）
+            formulas: 文本中公式占位符对应的 (公式原文, 渲染结果)，见 formula.py
+        """
+        self.nodes = nodes
+        self.image_sizes = image_sizes or {}
+        self.image_srcs = image_srcs or {}
+        self.formulas = formulas or []
+
+    def to_json(self) -> str:
+        """序列化为 JSON 字符串"""
+        return json.dumps({
+            'nodes': [node.to_data() for node in self.nodes],
+            'image_sizes': self.image_sizes,
+            'image_srcs': self.image_srcs,
+            'formulas': self.formulas,
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text: str) -> 'Document':
+        """由 to_json() 的结果还原文档"""
+        data = json.loads(text)
+        return cls(
+            [Node.from_data(node) for node in data['nodes']],
+            {src: tuple(size) for src, size in data.get('image_sizes', {}).items()},
+            data.get('image_srcs'),
+            [tuple(formula) for formula in data.get('formulas', [])],
+        )
+
+
+def build_nodes(tokens: List[dict]) -> List[Node]:
+    """
+    将 mistune AST 转换为节点列表
+
+    Args:
+        tokens: mistune AST token 列表
+
+    Returns:
+        顶层节点列表
+    """
+    return [Node.from_token(token) for token in tokens]
+
+
+def iter_nodes(nodes: List[Node], node_type: str) -> Iterator[Node]:
+    """
+    按文档顺序遍历节点树，产出指定类型的节点
+
+    Args:
+        nodes: 节点列表
+        node_type: 节点类型，如 'image'
+    """
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if node.type == node_type:
+            yield node
+        if node.children:
+            stack.extend(reversed(node.children))
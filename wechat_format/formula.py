@@ -0,0 +1,384 @@
+"""
+数学公式渲染
+
+识别 Markdown 中的 $...$（行内公式）和 $$...$$（独立公式），在本地渲染为内联 SVG，
+粘贴到微信公众号后台后仍然保留，无需手动截图。
+
+- 渲染使用 matplotlib 的 mathtext（可选依赖，不访问网络），支持常用的 LaTeX 数学命令。
+  公式的字形直接输出为一个 <path>，不依赖 <defs>/<use> 和 id（微信会去掉 id 属性）。
+- 渲染结果以公式内容的哈希为键缓存在磁盘上（并在内存中保留最近使用的部分），
+  再次转换同一篇文章时，未修改的公式只需读取缓存。
+- 一篇文章中未命中缓存的公式较多时，在进程池中并行渲染。
+- 未安装 matplotlib 或公式有语法错误时，公式按原文显示。
+
+识别规则与 Pandoc 一致：行内公式的 $ 之后和结尾 $ 之前不能是空白，结尾 $ 之后不能紧跟数字，
+因此 "$5 和 $10" 这样的金额不会被识别为公式；\\$ 表示普通的美元符号。
+
+公式只在正文中渲染：代码块和行内代码、链接地址、自动链接和 HTML 标签中的 $ 在查找时跳过；
+缩进代码块、图片说明等只有解析后才能确定的位置，由 restore_soup() / restore_nodes() 还原为原文，
+其余占位符在序列化后由 insert_formulas() 替换为 SVG。
+"""
+
+import hashlib
+import html
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .document import Node
+
+from .styles import MATH_BLOCK_STYLE, MATH_ERROR_STYLE, MATH_INLINE_STYLE
+
+
+# 通过环境变量指定公式缓存目录
+CACHE_ENV = 'WECHAT_FORMAT_MATH_CACHE'
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'wechat-format', 'formulas')
+
+# 公式字号（pt，约合正文的 16px）
+FONT_SIZE = 12
+
+# 内存中保留的公式数量
+MEMORY_CACHE_SIZE = 1024
+
+# 未命中缓存的公式达到该数量时使用进程池并行渲染
+MIN_PARALLEL_FORMULAS = 32
+
+# 渲染结果格式的版本，修改 SVG 输出时递增以使旧缓存失效
+RENDER_VERSION = 1
+
+# 不是正文的部分（其中的 $ 不是公式）：代码块和行内代码、HTML 注释和标签（包括自动链接）、
+# 行内链接和图片的地址及标题、链接定义
+_SKIP_RE = re.compile(
+    r'^(?P<fence>[ \t]*(?:`{3,}|~{3,}))[^\n]*\n.*?(?:^(?P=fence)[ \t]*$|\Z)'
+    r'|(?P<ticks>`+)(?!`).+?(?<!`)(?P=ticks)(?!`)'
+    r'|<!--.*?-->'
+    r'|<[A-Za-z][A-Za-z0-9+.-]{1,31}:[^<>\s]*>'
+    r'|</?[A-Za-z][A-Za-z0-9-]*'
+    r'(?:\s+[A-Za-z_:][\w.:-]*(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+))?)*\s*/?>'
+    r'|\]\((?:[^()\n]|\([^()\n]*\))*\)'
+    r'|^[ ]{0,3}\[[^\]\n]+\]:[^\n]*$',
+    re.MULTILINE | re.DOTALL
+)
+
+# $$...$$ 和 $...$
+_FORMULA_RE = re.compile(
+    r'(?<!\\)\$\$(?P<block>.+?)\$\$'
+    r'|(?<![\\$])\$(?![\s$])(?P<inline>(?:[^$\\\n]|\\.)+?)(?<![\s\\])\$(?!\d)',
+    re.DOTALL
+)
+
+# 预处理时公式的占位符：\x02<序号>\x02
+PLACEHOLDER = '\x02{}\x02'
+PLACEHOLDER_RE = re.compile('\x02(\\d+)\x02')
+
+# 内容按原文显示的标签，其中的占位符还原为公式原文
+RAW_TEXT_TAGS = ('code', 'pre', 'script', 'style', 'textarea')
+
+Formula = Tuple[str, bool]
+
+
+def is_available() -> bool:
+    """是否可以渲染公式（已安装 matplotlib）"""
+    try:
+        import matplotlib.mathtext  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def find_formulas(text: str) -> List[Tuple[int, int, str, bool]]:
+    """
+    查找文本中的公式（跳过代码、链接地址和 HTML 标签）
+
+    Args:
+        text: Markdown 文本
+
+    Returns:
+        (起始, 结束, 公式, 是否为独立公式) 的列表
+    """
+    if '$' not in text:
+        return []
+    formulas = []
+    pos = 0
+    for skipped in _SKIP_RE.finditer(text):
+        formulas.extend(_scan(text, pos, skipped.start()))
+        pos = skipped.end()
+    formulas.extend(_scan(text, pos, len(text)))
+    return formulas
+
+
+def _scan(text: str, start: int, end: int):
+    for match in _FORMULA_RE.finditer(text, start, end):
+        if match.group('block') is not None:
+            latex = match.group('block').strip()
+            if latex:
+                yield match.start(), match.end(), latex, True
+        else:
+            yield match.start(), match.end(), match.group('inline'), False
+
+
+def render_svg(latex: str, display: bool = False) -> str:
+    """
+    将公式渲染为内联 SVG
+
+    Args:
+        latex: LaTeX 公式（不含 $）
+        display: 是否为独立公式
+
+    Returns:
+        SVG 元素
+
+    Raises:
+        ValueError: 公式有语法错误
+        ImportError: 未安装 matplotlib
+    """
+    from matplotlib.font_manager import FontProperties
+    from matplotlib.mathtext import MathTextParser
+    from matplotlib.path import Path
+    from matplotlib.textpath import TextPath
+
+    source = f'${latex}$'
+    prop = FontProperties(size=FONT_SIZE)
+    width, height, depth, _, _ = MathTextParser('path').parse(source, dpi=72, prop=prop)
+    path = TextPath((0, 0), source, prop=prop)
+
+    commands = {Path.MOVETO: 'M', Path.LINETO: 'L', Path.CURVE3: 'Q', Path.CURVE4: 'C'}
+    d = []
+    for vertices, code in path.iter_segments():
+        if code == Path.CLOSEPOLY:
+            d.append('Z')
+            continue
+        # SVG 的 y 轴向下，基线位于 y=0
+        d.append(commands[code] + ' '.join(
+            f'{x:.2f} {-y:.2f}' for x, y in zip(vertices[::2], vertices[1::2])
+        ))
+
+    width, height, depth = float(width), float(height), float(depth)
+    style = MATH_BLOCK_STYLE if display else MATH_INLINE_STYLE.format(depth=f'{depth:g}')
+    label = html.escape(latex, quote=True)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}pt" height="{height:g}pt" '
+        f'viewBox="0 {depth - height:g} {width:g} {height:g}" role="img" aria-label="{label}" '
+        f'style="{style}"><path fill="currentColor" d="{"".join(d)}"/></svg>'
+    )
+
+
+def fallback_html(latex: str, display: bool) -> str:
+    """无法渲染时按原文显示公式"""
+    source = f'$${latex}$$' if display else f'${latex}$'
+    return f'<span style="{MATH_ERROR_STYLE}">{html.escape(source, quote=False)}</span>'
+
+
+def _render_one(formula: Formula) -> Optional[str]:
+    try:
+        return render_svg(*formula)
+    except ValueError:
+        return None
+
+
+class FormulaCache:
+    """公式渲染结果的磁盘缓存（带内存层），可在多线程、多进程间共享同一目录"""
+
+    def __init__(self, directory: Optional[str] = None, memory_size: int = MEMORY_CACHE_SIZE):
+        """
+        Args:
+            directory: 缓存目录；为 None 时使用环境变量 WECHAT_FORMAT_MATH_CACHE 或
+                ~/.cache/wechat-format/formulas
+            memory_size: 内存中保留的公式数量
+        """
+        directory = directory or os.environ.get(CACHE_ENV) or DEFAULT_CACHE_DIR
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.memory_size = memory_size
+        self._memory: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(formula: Formula) -> str:
+        latex, display = formula
+        data = f'{RENDER_VERSION}\0{FONT_SIZE}\0{int(display)}\0{latex}'
+        return hashlib.sha256(data.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.svg')
+
+    def get(self, formula: Formula) -> Optional[str]:
+        """读取公式的 SVG；未命中时返回 None"""
+        key = self.key(formula)
+        with self._lock:
+            svg = self._memory.get(key)
+            if svg is not None:
+                self._memory.move_to_end(key)
+                return svg
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                svg = f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+        self._remember(key, svg)
+        return svg
+
+    def put(self, formula: Formula, svg: str):
+        """保存公式的 SVG（先写临时文件再改名，并发写入同一公式也不会读到不完整的文件）"""
+        key = self.key(formula)
+        self._remember(key, svg)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(svg)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _remember(self, key: str, svg: str):
+        with self._lock:
+            self._memory[key] = svg
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+
+class FormulaRenderer:
+    """渲染一篇文章中的所有公式，优先使用缓存，未命中的公式较多时并行渲染"""
+
+    def __init__(self, cache: Optional[FormulaCache] = None, workers: Optional[int] = None):
+        """
+        Args:
+            cache: 公式缓存；为 None 时使用默认目录
+            workers: 并行渲染的进程数，默认为 CPU 核数
+        """
+        self.cache = cache or FormulaCache()
+        self.workers = workers
+
+    def render_all(self, formulas: List[Formula]) -> Dict[Formula, str]:
+        """
+        渲染公式
+
+        Args:
+            formulas: (公式, 是否为独立公式) 的列表，可以有重复
+
+        Returns:
+            公式到 HTML 的映射；无法渲染的公式按原文显示
+        """
+        results: Dict[Formula, str] = {}
+        missing = []
+        for formula in dict.fromkeys(formulas):
+            svg = self.cache.get(formula)
+            if svg is None:
+                missing.append(formula)
+            else:
+                results[formula] = svg
+
+        if missing and is_available():
+            workers = min(self.workers or os.cpu_count() or 1, len(missing))
+            if workers > 1 and len(missing) >= MIN_PARALLEL_FORMULAS:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    rendered = list(pool.map(_render_one, missing, chunksize=8))
+            else:
+                rendered = [_render_one(formula) for formula in missing]
+            for formula, svg in zip(missing, rendered):
+                if svg is not None:
+                    self.cache.put(formula, svg)
+                    results[formula] = svg
+
+        for formula in missing:
+            if formula not in results:
+                results[formula] = fallback_html(*formula)
+        return results
+
+
+def restore_sources(text: str, formulas: List[Tuple[str, str]]) -> str:
+    """
+    将文本中的占位符还原为公式原文
+
+    Args:
+        text: 含占位符的文本（未转义）
+        formulas: 各占位符对应的 (公式原文, 渲染结果)
+    """
+    return PLACEHOLDER_RE.sub(lambda m: formulas[int(m.group(1))][0], text)
+
+
+def insert_formulas(html_text: str, formulas: Optional[List[Tuple[str, str]]],
+                    source: bool = False) -> str:
+    """
+    将序列化后的 HTML 中（正文里）的占位符替换为公式
+
+    Args:
+        html_text: HTML 片段
+        formulas: 各占位符对应的 (公式原文, 渲染结果)
+        source: 为 True 时替换为转义后的公式原文（用于生成纯文本）
+
+    Returns:
+        替换后的 HTML
+    """
+    if not formulas or '\x02' not in html_text:
+        return html_text
+    if source:
+        return PLACEHOLDER_RE.sub(
+            lambda m: html.escape(formulas[int(m.group(1))][0], quote=False), html_text
+        )
+    return PLACEHOLDER_RE.sub(lambda m: formulas[int(m.group(1))][1], html_text)
+
+
+def restore_soup(soup, formulas: List[Tuple[str, str]]):
+    """
+    将不属于正文的占位符（代码、<pre> 等标签的内容和所有属性值）还原为公式原文
+
+    Args:
+        soup: BeautifulSoup 文档，原地修改
+        formulas: 各占位符对应的 (公式原文, 渲染结果)
+    """
+    for string in soup.find_all(string=PLACEHOLDER_RE):
+        if string.find_parent(RAW_TEXT_TAGS) is not None:
+            string.replace_with(type(string)(restore_sources(string, formulas)))
+    for tag in soup.find_all(True):
+        for name, value in list(tag.attrs.items()):
+            if isinstance(value, str):
+                if '\x02' in value:
+                    tag[name] = restore_sources(value, formulas)
+            elif isinstance(value, list) and any('\x02' in item for item in value):
+                tag[name] = [restore_sources(item, formulas) for item in value]
+
+
+_RAW_TEXT_RE = re.compile(r'<({0})\b.*?</\1\s*>'.format('|'.join(RAW_TEXT_TAGS)), re.I | re.S)
+_RAW_TEXT_OPEN_RE = re.compile(r'<({0})\b'.format('|'.join(RAW_TEXT_TAGS)), re.I)
+
+
+def restore_nodes(nodes: List[Node], formulas: List[Tuple[str, str]]):
+    """
+    将不属于正文的占位符还原为公式原文
+
+    行内代码、代码块、图片说明（alt）、节点属性（链接地址、标题）以及原始 HTML 中
+    <code>、<pre> 等标签的内容按原文显示；其余文本节点中的占位符保留，渲染后替换为公式。
+
+    Args:
+        nodes: 文档节点，原地修改
+        formulas: 各占位符对应的 (公式原文, 渲染结果)
+    """
+    stack = [(nodes, False)]
+    while stack:
+        children, raw = stack.pop()
+        # 行内的原始 HTML 中，<code> 等标签和结束标签分属不同的节点
+        opened = None
+        for node in children:
+            for name, value in node.attrs.items():
+                if isinstance(value, str) and '\x02' in value:
+                    node.attrs[name] = restore_sources(value, formulas)
+            if node.raw and '\x02' in node.raw:
+                if raw or opened or node.type in ('codespan', 'block_code'):
+                    node.raw = restore_sources(node.raw, formulas)
+                elif node.type in ('block_html', 'inline_html'):
+                    node.raw = _RAW_TEXT_RE.sub(lambda m: restore_sources(m.group(0), formulas), node.raw)
+            if node.type == 'inline_html':
+                match = _RAW_TEXT_OPEN_RE.match(node.raw or '')
+                if match and not _RAW_TEXT_RE.match(node.raw):
+                    opened = match.group(1).lower()
+                elif opened and re.match(rf'</{opened}\s*>', node.raw or '', re.I):
+                    opened = None
+            if node.children:
+                stack.append((node.children, raw or node.type == 'image'))
@@ -0,0 +1,473 @@
+"""
+图片处理
+
+解析 Markdown 中引用的本地图片：相对 Markdown 文件定位图片，
+只读取文件头获取宽高（无需解码整张图片），并按路径和修改时间缓存结果；
+可选地将小图片内嵌为 base64 data URI。
+"""
+
+import base64
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+
+# 并行探测图片尺寸的默认线程数
+PROBE_WORKERS = 8
+
+# 内嵌图片的默认限制：单张图片原始大小上限、整篇文章 data URI 总量上限
+EMBED_MAX_SIZE = 200 * 1024
+EMBED_BUDGET = 2 * 1024 * 1024
+
+# 大于该值的图片使用 mmap 读取
+MMAP_THRESHOLD = 64 * 1024
+
+# data URI 缓存的总字符数上限
+EMBED_CACHE_SIZE = 32 * 1024 * 1024
+
+# Markdown 中可能引用本地图片的地址：内联链接和图片、引用式链接定义、原始 HTML 的 src 属性
+_MARKDOWN_SRC_RE = re.compile(
+    r'\]\(\s*<?([^)\s>]+)'
+    r'|^[ \t]{0,3}\[[^\]]+\]:[ \t]*<?([^\s>]+)'
+    r'|\bsrc\s*=\s*["\']?([^"\'\s>]+)',
+    re.MULTILINE | re.IGNORECASE,
+)
+
+# 文件头签名到 MIME 类型
+_IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'BM', 'image/bmp'),
+)
+
+# JPEG 中携带图片尺寸的 SOF 标记
+_JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+}
+
+
+class ImageRoot(str):
+    """
+    受限的图片目录，作为转换时的 base_dir 使用（如 Web 服务的 IMAGE_ROOT）
+
+    只解析目录内的相对地址：拒绝 file: 地址和绝对路径，
+    解析符号链接后位于目录之外的路径（如 ../../etc/passwd）也不读取。
+    """
+
+    def __new__(cls, root: str):
+        return super().__new__(cls, os.path.realpath(root))
+
+    def resolve(self, src: str) -> Optional[str]:
+        """
+        将 <img> 的 src 解析为目录内的本地文件路径
+
+        Returns:
+            文件的真实路径；不是相对地址、位于目录之外或文件不存在时返回 None
+        """
+        parts = urlsplit(src)
+        if parts.scheme or parts.netloc:
+            return None
+        path = unquote(parts.path)
+        if not path or os.path.isabs(path) or path.startswith(('/', '\\')):
+            return None
+        path = os.path.realpath(os.path.join(self, path))
+        if os.path.commonpath([str(self), path]) != str(self):
+            return None
+        return path if os.path.isfile(path) else None
+
+
+def resolve_local_image(src: str, base_dir: str) -> Optional[str]:
+    """
+    将 <img> 的 src 解析为本地文件路径
+
+    Args:
+        src: 图片地址
+        base_dir: 相对路径的基准目录（通常是 Markdown 文件所在目录）；
+            为 ImageRoot 时只解析目录内的相对地址
+
+    Returns:
+        本地文件的绝对路径；远程图片、data URI 或文件不存在时返回 None
+    """
+    if not src:
+        return None
+    if isinstance(base_dir, ImageRoot):
+        return base_dir.resolve(src)
+    parts = urlsplit(src)
+    if parts.scheme == 'file':
+        path = unquote(parts.path)
+    elif parts.scheme or parts.netloc:
+        # http(s)、data 以及 //host/path 形式的地址
+        return None
+    else:
+        path = unquote(parts.path)
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+    path = os.path.abspath(path)
+    return path if os.path.isfile(path) else None
+
+
+def local_image_state(markdown_text: str, base_dir: str) -> List[list]:
+    """
+    Markdown 引用的本地图片的状态，作为转换结果缓存键的一部分，图片修改后缓存随之失效
+
+    只用正则提取候选地址，不解析 Markdown；宁多勿少，无法解析为本地文件的地址直接忽略。
+
+    Args:
+        markdown_text: Markdown 文本
+        base_dir: 相对路径的基准目录；为 archive.ArchiveDir 时以归档文件本身的状态代替
+
+    Returns:
+        [路径, 修改时间（纳秒）, 大小] 的列表
+    """
+    from .archive import ArchiveDir
+
+    if isinstance(base_dir, ArchiveDir):
+        paths = [base_dir.archive]
+    else:
+        paths = []
+        for match in _MARKDOWN_SRC_RE.finditer(markdown_text):
+            path = resolve_local_image(next(filter(None, match.groups())), base_dir)
+            if path:
+                paths.append(path)
+    state = []
+    for path in dict.fromkeys(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        state.append([path, stat.st_mtime_ns, stat.st_size])
+    return state
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    根据文件头判断图片的 MIME 类型
+
+    Args:
+        head: 文件开头至少 12 个字节
+
+    Returns:
+        MIME 类型；不是支持的图片格式时返回 None
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mime in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    return None
+
+
+def probe_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """
+    读取图片文件头获取宽高
+
+    支持 PNG、GIF、JPEG、WebP 和 BMP。
+
+    Args:
+        path: 图片文件路径
+
+    Returns:
+        (宽, 高)；无法识别时返回 None
+    """
+    try:
+        with open(path, 'rb') as f:
+            return probe_image_stream(f)
+    except OSError:
+        return None
+
+
+def probe_image_stream(f) -> Optional[Tuple[int, int]]:
+    """
+    从可定位的二进制流（文件、归档成员）的开头读取图片宽高
+
+    Args:
+        f: 二进制流，位于图片开头
+
+    Returns:
+        (宽, 高)；无法识别时返回 None
+    """
+    try:
+        head = f.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head.startswith(b'BM') and len(head) >= 26:
+            width, height = struct.unpack('<ii', head[18:26])
+            return width, abs(height)
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return _probe_webp(head)
+        if head.startswith(b'\xff\xd8'):
+            f.seek(2)
+            return _probe_jpeg(f)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def _probe_webp(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and len(head) >= 30:
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(head) >= 25:
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(head) >= 30:
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        return width, height
+    return None
+
+
+def _probe_jpeg(f) -> Optional[Tuple[int, int]]:
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        # 无长度字段的独立标记
+        if code == 0x01 or 0xD0 <= code <= 0xD9:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if code in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+class ImageSizeCache:
+    """图片尺寸缓存，按路径和修改时间失效，可在多线程间共享"""
+
+    def __init__(self, workers: int = PROBE_WORKERS):
+        """
+        初始化缓存
+
+        Args:
+            workers: 并行探测的最大线程数
+        """
+        self.workers = workers
+        self._entries: Dict[str, Tuple[int, int, Optional[Tuple[int, int]]]] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, path: str, stat: os.stat_result):
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return True, entry[2]
+        return False, None
+
+    def get_sizes(self, paths: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """
+        批量获取图片尺寸，未命中缓存的图片在线程池中并行探测
+
+        Args:
+            paths: 图片的绝对路径
+
+        Returns:
+            路径到 (宽, 高) 的映射（无法识别的图片不包含在内）
+        """
+        sizes = {}
+        pending = []
+        for path in dict.fromkeys(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            with self._lock:
+                hit, size = self._lookup(path, stat)
+            if hit:
+                if size:
+                    sizes[path] = size
+            else:
+                pending.append((path, stat))
+
+        if len(pending) == 1 or self.workers <= 1:
+            results = [probe_image_size(path) for path, _ in pending]
+        elif pending:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                results = list(pool.map(probe_image_size, [path for path, _ in pending]))
+        else:
+            results = []
+
+        with self._lock:
+            for (path, stat), size in zip(pending, results):
+                self._entries[path] = (stat.st_mtime_ns, stat.st_size, size)
+                if size:
+                    sizes[path] = size
+        return sizes
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+
+def probe_local_images(srcs: Iterable[str], base_dir: str,
+                       cache: ImageSizeCache) -> Dict[str, Tuple[int, int]]:
+    """
+    解析并探测一组 <img> src 对应的本地图片尺寸
+
+    Args:
+        srcs: 图片地址
+        base_dir: 相对路径的基准目录；为 archive.ArchiveDir 时在归档内解析
+        cache: 尺寸缓存
+
+    Returns:
+        src 到 (宽, 高) 的映射
+    """
+    from .archive import ArchiveDir
+
+    if isinstance(base_dir, ArchiveDir):
+        # 归档内的图片直接从归档中读取
+        return base_dir.probe_images(srcs)
+    resolved = {}
+    for src in dict.fromkeys(srcs):
+        path = resolve_local_image(src, base_dir)
+        if path:
+            resolved[src] = path
+    sizes = cache.get_sizes(resolved.values())
+    return {src: sizes[path] for src, path in resolved.items() if path in sizes}
+
+
+class ImageEmbedder:
+    """将本地图片编码为 data URI，按内容哈希缓存编码结果，可在多线程间共享"""
+
+    def __init__(self, cache_size: int = EMBED_CACHE_SIZE):
+        """
+        初始化编码器
+
+        Args:
+            cache_size: data URI 缓存的总字符数上限
+        """
+        self.cache_size = cache_size
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._uris = OrderedDict()
+        self._cached_chars = 0
+        self._lock = threading.Lock()
+
+    def embed(self, paths: Iterable[str], max_size: int = EMBED_MAX_SIZE,
+              budget: int = EMBED_BUDGET) -> Dict[str, str]:
+        """
+        按顺序将图片编码为 data URI，直到用完总量预算
+
+        Args:
+            paths: 图片的绝对路径（按文档顺序）
+            max_size: 单张图片原始字节数上限，超过的图片保持原路径
+            budget: 所有 data URI 的总字符数上限，超出预算的图片保持原路径
+
+        Returns:
+            路径到 data URI 的映射
+        """
+        uris = {}
+        used = 0
+        for path in dict.fromkeys(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size > max_size:
+                continue
+            # base64 约为原始大小的 4/3，预先估算以免读取注定超预算的文件
+            if used + (stat.st_size + 2) // 3 * 4 > budget:
+                continue
+            uri = self._data_uri(path, stat)
+            if uri is None or used + len(uri) > budget:
+                continue
+            uris[path] = uri
+            used += len(uri)
+        return uris
+
+    def _data_uri(self, path: str, stat: os.stat_result) -> Optional[str]:
+        with self._lock:
+            entry = self._digests.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                uri = self._uris.get(entry[2])
+                if uri is not None:
+                    self._uris.move_to_end(entry[2])
+                    return uri
+
+        with open(path, 'rb') as f:
+            if stat.st_size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self._encode(path, stat, data)
+            return self._encode(path, stat, f.read())
+
+    def _encode(self, path: str, stat: os.stat_result, data) -> Optional[str]:
+        if sniff_image_type(bytes(data[:12])) is None:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            uri = self._uris.get(digest)
+        if uri is None:
+            uri = image_data_uri(data)
+        with self._lock:
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            if digest not in self._uris:
+                self._uris[digest] = uri
+                self._cached_chars += len(uri)
+                while self._cached_chars > self.cache_size and len(self._uris) > 1:
+                    _, evicted = self._uris.popitem(last=False)
+                    self._cached_chars -= len(evicted)
+        return uri
+
+
+def image_data_uri(data) -> Optional[str]:
+    """
+    将图片内容编码为 data URI
+
+    Args:
+        data: 图片内容（bytes 或 mmap 等支持缓冲区协议的对象）
+
+    Returns:
+        data URI；不是支持的图片格式时返回 None
+    """
+    mime = sniff_image_type(bytes(data[:12]))
+    if mime is None:
+        return None
+    return f'data:{mime};base64,' + base64.b64encode(data).decode('ascii')
+
+
+def embed_local_images(srcs: Iterable[str], base_dir: str, embedder: ImageEmbedder,
+                       max_size: int = EMBED_MAX_SIZE,
+                       budget: int = EMBED_BUDGET) -> Dict[str, str]:
+    """
+    解析一组 <img> src 并将其中的小图片编码为 data URI
+
+    Args:
+        srcs: 图片地址（按文档顺序）
+        base_dir: 相对路径的基准目录；为 archive.ArchiveDir 时在归档内解析
+        embedder: data URI 编码器
+        max_size: 单张图片原始字节数上限
+        budget: data URI 总字符数上限
+
+    Returns:
+        src 到 data URI 的映射
+    """
+    from .archive import ArchiveDir
+
+    if isinstance(base_dir, ArchiveDir):
+        return base_dir.embed_images(srcs, max_size, budget)
+    resolved: List[Tuple[str, str]] = []
+    for src in dict.fromkeys(srcs):
+        path = resolve_local_image(src, base_dir)
+        if path:
+            resolved.append((src, path))
+    uris = embedder.embed((path for _, path in resolved), max_size, budget)
+    return {src: uris[path] for src, path in resolved if path in uris}
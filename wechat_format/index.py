@@ -0,0 +1,460 @@
+"""
+文章索引
+
+批量转换目录时，同时在目录下维护一个 SQLite 索引（FTS5 全文检索），记录每篇文章的
+front-matter 字段、标题、各级标题、字数和内容哈希，供 `wechat-format search` 在毫秒级内检索，
+不必再用 grep 逐个扫描 Markdown 文件。
+
+- 增量更新：文件的修改时间和大小未变时直接跳过；变化时比较内容哈希，内容相同只更新文件信息，
+  内容变化才重新解析；已删除的文件从索引中移除。
+- 中文没有空格分词，全文检索使用 trigram 分词器（SQLite 3.34+），可以检索任意子串；
+  少于 3 个字的检索词改用 LIKE 在同一张表中匹配。SQLite 不支持 trigram 时退回 unicode61 分词器。
+- 索引与转换缓存一样使用 WAL 模式，检索时不会被正在进行的更新阻塞。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .ingest import InputEncodingError, decode
+from .renderer import get_parser, strip_front_matter
+
+
+# 索引文件名（位于被索引的目录下）
+INDEX_FILENAME = '.wechat-format-index.sqlite3'
+
+# 视为 Markdown 文章的文件扩展名
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+
+# 检索结果摘要的长度（字符，检索词前后各一半）
+SNIPPET_LENGTH = 80
+
+# 检索时各列的权重：标题、各级标题、front-matter、正文
+COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+# 等待其他进程释放写锁的时间（秒）
+BUSY_TIMEOUT = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    title TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    headings TEXT NOT NULL,
+    words INTEGER NOT NULL,
+    indexed REAL NOT NULL
+);
+"""
+
+# 全文检索表，rowid 与 documents.id 相同
+_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts "
+    "USING fts5(title, headings, metadata, body, tokenize='{tokenizer}')"
+)
+_FTS_COLUMNS = ('title', 'headings', 'metadata', 'body')
+
+# trigram 分词器能匹配的最短检索词
+_TRIGRAM_MIN = 3
+
+# 字数：每个汉字（及日文假名、韩文）算一个字，连续的字母数字算一个词
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_WORD_RE = re.compile(rf"[{_CJK}]|[^\W_{_CJK}]+(?:['’-][^\W_{_CJK}]+)*")
+_TAG_RE = re.compile(r'<[^>]*>')
+_QUOTED_RE = re.compile(r'^(["\'])(.*)\1$')
+
+# 提取纯文本时块内子节点之间的分隔符
+_SEPARATORS = {
+    'list': '\n', 'list_item': '\n', 'block_quote': '\n', 'table': '\n', 'table_body': '\n',
+    'table_head': ' ', 'table_row': ' ',
+}
+
+
+class CorpusIndexError(Exception):
+    """文章索引出错（索引文件损坏、无法写入等）"""
+
+
+def find_markdown_files(root: str) -> List[str]:
+    """
+    查找目录下的所有 Markdown 文件（跳过以 . 开头的目录和文件）
+
+    Args:
+        root: 目录
+
+    Returns:
+        文件路径列表，按路径排序
+    """
+    files = []
+    for directory, subdirs, names in os.walk(root):
+        subdirs[:] = sorted(name for name in subdirs if not name.startswith('.'))
+        for name in sorted(names):
+            if not name.startswith('.') and name.lower().endswith(MARKDOWN_SUFFIXES):
+                files.append(os.path.join(directory, name))
+    return files
+
+
+def parse_front_matter(text: str) -> Tuple[dict, str]:
+    """
+    解析开头的 YAML front-matter
+
+    支持与 markdown2 的 metadata 扩展相同的简单格式：`键: 值`、`键: [a, b]`，
+    以及键下方以 `- ` 开头的列表项。
+
+    Args:
+        text: Markdown 文本
+
+    Returns:
+        (字段, 去掉 front-matter 后的正文)
+    """
+    body = strip_front_matter(text)
+    if len(body) == len(text):
+        return {}, text
+    metadata = {}
+    key = None
+    for line in text[:len(text) - len(body)].splitlines()[1:-1]:
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if stripped.startswith('- ') and key is not None:
+            if not isinstance(metadata[key], list):
+                metadata[key] = []
+            metadata[key].append(_unquote(stripped[2:]))
+            continue
+        name, sep, value = stripped.partition(':')
+        if not sep or line[0].isspace():
+            continue
+        key = name.strip()
+        value = value.strip()
+        if value.startswith('[') and value.endswith(']'):
+            metadata[key] = [_unquote(item) for item in value[1:-1].split(',') if item.strip()]
+        else:
+            metadata[key] = _unquote(value)
+    return metadata, body
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    match = _QUOTED_RE.match(value)
+    return match.group(2) if match else value
+
+
+def extract(text: str) -> dict:
+    """
+    提取文章的索引信息
+
+    Args:
+        text: Markdown 文本
+
+    Returns:
+        包括 front-matter 字段 metadata、标题 title（front-matter 的 title 或第一个标题）、
+        各级标题 headings（[级别, 文字] 的列表）、纯文本正文 body 和字数 words
+    """
+    metadata, body = parse_front_matter(text)
+    headings = []
+    blocks = []
+    for token in get_parser()(body):
+        block = _token_text(token).strip()
+        if not block:
+            continue
+        if token['type'] == 'heading':
+            headings.append([token['attrs']['level'], block])
+        blocks.append(block)
+    body_text = '\n'.join(blocks)
+
+    title = metadata.get('title')
+    if not isinstance(title, str) or not title:
+        title = min(headings, key=lambda heading: heading[0])[1] if headings else ''
+    return {
+        'metadata': metadata,
+        'title': title,
+        'headings': headings,
+        'body': body_text,
+        'words': count_words(body_text),
+    }
+
+
+def _token_text(token: dict) -> str:
+    if token['type'] in ('block_html', 'inline_html'):
+        return _TAG_RE.sub(' ', token.get('raw', ''))
+    children = token.get('children')
+    if children is None:
+        return token.get('raw', '')
+    separator = _SEPARATORS.get(token['type'], '')
+    return separator.join(_token_text(child) for child in children)
+
+
+def count_words(text: str) -> int:
+    """字数：每个汉字算一个字，连续的字母数字（如英文单词、数字）算一个词"""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+
+class CorpusIndex:
+    """目录下 Markdown 文章的索引，可在多进程间共享同一个索引文件"""
+
+    def __init__(self, root: str, path: Optional[str] = None):
+        """
+        Args:
+            root: 被索引的目录；索引中的文件路径相对于该目录
+            path: 索引文件路径，默认为 root 下的 .wechat-format-index.sqlite3
+        """
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.path = os.path.abspath(path) if path else os.path.join(self.root, INDEX_FILENAME)
+        self._conn = None
+        self._trigram = False
+
+    def __repr__(self):
+        return f'CorpusIndex({self.root!r})'
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        try:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            try:
+                conn.execute(_FTS_SCHEMA.format(tokenizer='trigram'))
+            except sqlite3.OperationalError:
+                conn.execute(_FTS_SCHEMA.format(tokenizer='unicode61'))
+            sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'documents_fts'"
+            ).fetchone()[0]
+        except sqlite3.Error as e:
+            raise CorpusIndexError(f'无法打开索引 {self.path}: {e}') from e
+        self._trigram = 'trigram' in sql
+        self._conn = conn
+        return conn
+
+    def update(self, files: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        增量更新索引
+
+        Args:
+            files: 需要更新的文件；为 None 时扫描整个目录，并移除已删除的文件
+
+        Returns:
+            各类文件的数量：新增 added、更新 updated、移除 removed、未变化 unchanged
+
+        Raises:
+            CorpusIndexError: 无法读写索引
+        """
+        full_scan = files is None
+        if full_scan:
+            files = find_markdown_files(self.root)
+        counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                existing = {
+                    row[0]: row[1:] for row in
+                    conn.execute('SELECT path, id, mtime, size, hash FROM documents')
+                }
+                for file in files:
+                    path = self._relative(file)
+                    if path is None:
+                        continue
+                    row = existing.pop(path, None)
+                    counts[self._update_file(conn, file, path, row)] += 1
+                if full_scan:
+                    for path, (doc_id, _, _, _) in existing.items():
+                        self._delete(conn, doc_id)
+                        counts['removed'] += 1
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            raise CorpusIndexError(f'更新索引失败: {e}') from e
+        return counts
+
+    def _relative(self, file: str) -> Optional[str]:
+        path = os.path.relpath(os.path.abspath(file), self.root)
+        if path.startswith(os.pardir + os.sep) or path == os.pardir:
+            return None
+        return path.replace(os.sep, '/')
+
+    def _update_file(self, conn: sqlite3.Connection, file: str, path: str,
+                     row: Optional[tuple]) -> str:
+        try:
+            stat = os.stat(file)
+            if row is not None and row[1] == stat.st_mtime and row[2] == stat.st_size:
+                return 'unchanged'
+            with open(file, 'rb') as f:
+                data = f.read()
+        except OSError:
+            # 无法读取的文件视为已删除
+            if row is not None:
+                self._delete(conn, row[0])
+                return 'removed'
+            return 'unchanged'
+
+        digest = hashlib.sha256(data).hexdigest()
+        if row is not None and row[3] == digest:
+            conn.execute('UPDATE documents SET mtime = ?, size = ? WHERE id = ?',
+                         (stat.st_mtime, stat.st_size, row[0]))
+            return 'unchanged'
+
+        try:
+            text = decode(data, path=file)[0]
+        except InputEncodingError:
+            text = data.decode('utf-8', 'replace')
+        info = extract(text)
+        metadata = json.dumps(info['metadata'], ensure_ascii=False)
+        headings = json.dumps(info['headings'], ensure_ascii=False)
+        values = (stat.st_mtime, stat.st_size, digest, info['title'], metadata, headings,
+                  info['words'], time.time())
+        if row is None:
+            doc_id = conn.execute(
+                'INSERT INTO documents (mtime, size, hash, title, metadata, headings, words, indexed, path)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', values + (path,)
+            ).lastrowid
+        else:
+            doc_id = row[0]
+            conn.execute(
+                'UPDATE documents SET mtime = ?, size = ?, hash = ?, title = ?, metadata = ?,'
+                ' headings = ?, words = ?, indexed = ? WHERE id = ?', values + (doc_id,)
+            )
+            conn.execute('DELETE FROM documents_fts WHERE rowid = ?', (doc_id,))
+        conn.execute(
+            'INSERT INTO documents_fts (rowid, title, headings, metadata, body) VALUES (?, ?, ?, ?, ?)',
+            (doc_id, info['title'], '\n'.join(text for _, text in info['headings']),
+             _metadata_text(info['metadata']), info['body'])
+        )
+        return 'added' if row is None else 'updated'
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, doc_id: int):
+        conn.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+        conn.execute('DELETE FROM documents_fts WHERE rowid = ?', (doc_id,))
+
+    def search(self, query: str = '', filters: Optional[Dict[str, str]] = None,
+               limit: int = 20) -> List[dict]:
+        """
+        检索文章
+
+        Args:
+            query: 检索词，以空白分隔，文章需包含所有检索词（标题、各级标题、front-matter 或正文）；
+                带空格的短语用双引号括起
+            filters: front-matter 字段必须等于的值（列表字段包含该值即可），如 {'tags': 'Python'}
+            limit: 最多返回的文章数
+
+        Returns:
+            按相关度排序的文章列表，每篇包括路径 path、标题 title、字段 metadata、
+            各级标题 headings、字数 words、内容哈希 hash 和正文摘要 snippet
+
+        Raises:
+            CorpusIndexError: 无法读取索引
+        """
+        terms = split_query(query)
+        conditions = []
+        params: list = []
+        match = []
+        for term in terms:
+            if self._trigram_ready() and len(term) < _TRIGRAM_MIN:
+                conditions.append('(' + ' OR '.join(
+                    f'documents_fts.{column} LIKE ? ESCAPE \'\\\'' for column in _FTS_COLUMNS
+                ) + ')')
+                params.extend([_like_pattern(term)] * len(_FTS_COLUMNS))
+            else:
+                match.append('"' + term.replace('"', '""') + '"')
+        if match:
+            conditions.append('documents_fts MATCH ?')
+            params.append(' AND '.join(match))
+        for key, value in (filters or {}).items():
+            conditions.append(
+                'EXISTS (SELECT 1 FROM json_each(documents.metadata, ?) WHERE json_each.value = ?)'
+            )
+            params.extend(['$."' + key.replace('"', '""') + '"', value])
+
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+        order = f'bm25(documents_fts, {weights}), documents.path' if match else 'documents.path'
+        sql = (
+            'SELECT documents.path, documents.title, documents.metadata, documents.headings,'
+            ' documents.words, documents.hash, documents_fts.body'
+            ' FROM documents JOIN documents_fts ON documents_fts.rowid = documents.id'
+            + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+            + f' ORDER BY {order} LIMIT ?'
+        )
+        params.append(limit)
+        try:
+            rows = self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            raise CorpusIndexError(f'检索失败: {e}') from e
+        return [{
+            'path': path,
+            'title': title,
+            'metadata': json.loads(metadata),
+            'headings': json.loads(headings),
+            'words': words,
+            'hash': digest,
+            'snippet': make_snippet(body, terms),
+        } for path, title, metadata, headings, words, digest, body in rows]
+
+    def _trigram_ready(self) -> bool:
+        self._connection()
+        return self._trigram
+
+    def stats(self) -> dict:
+        """
+        索引统计
+
+        Returns:
+            包括文章数 documents、总字数 words、索引文件路径 path 和被索引的目录 root
+        """
+        try:
+            documents, words = self._connection().execute(
+                'SELECT COUNT(*), COALESCE(SUM(words), 0) FROM documents'
+            ).fetchone()
+        except sqlite3.Error as e:
+            raise CorpusIndexError(f'读取索引失败: {e}') from e
+        return {'root': self.root, 'path': self.path, 'documents': documents, 'words': words}
+
+    def close(self):
+        """关闭索引文件"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _metadata_text(metadata: dict) -> str:
+    lines = []
+    for key, value in metadata.items():
+        values = value if isinstance(value, list) else [value]
+        lines.append(f'{key}: ' + ' '.join(str(item) for item in values))
+    return '\n'.join(lines)
+
+
+def _like_pattern(term: str) -> str:
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def split_query(query: str) -> List[str]:
+    """将检索语句拆分为检索词（双引号括起的短语作为一个检索词）"""
+    return [
+        (phrase if phrase else word)
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query or '')
+        if phrase or word
+    ]
+
+
+def make_snippet(body: str, terms: List[str], length: int = SNIPPET_LENGTH) -> str:
+    """截取正文中第一个检索词附近的一段（没有检索词或正文不含检索词时取开头）"""
+    lowered = body.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [pos for pos in positions if pos >= 0]
+    start = max(0, min(positions) - length // 2) if positions else 0
+    snippet = ' '.join(body[start:start + length].split())
+    if start > 0:
+        snippet = '…' + snippet
+    if start + length < len(body):
+        snippet += '…'
+    return snippet
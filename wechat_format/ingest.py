@@ -0,0 +1,204 @@
+"""
+输入文件读取
+
+转换文件、批量转换目录、建立索引和检查链接时统一用这里的函数读取 Markdown 文件：
+
+- 较大的文件用 mmap 映射后直接解码，不先读入一份 bytes 副本；
+- 按 BOM 识别 UTF-8/UTF-16/UTF-32；没有 BOM 时先按 UTF-8 解码，失败后按 GB18030 解码
+  （兼容 GBK 和 GB2312）。GB18030 几乎能解码任意字节序列，Big5、Shift_JIS、EUC-KR 的文件
+  也会被它"成功"解码为乱码，无法靠解码是否成功区分，因此不自动识别，需要指定 encoding；
+- 换行统一为 \\n（与以文本模式读取一致）；
+- 读取失败时抛出带文件路径的 InputError 子类，而不是笼统的 Exception；
+- 批量读取时在线程池中预读后面的文件，转换当前文章的同时后续文件已在读取。
+"""
+
+import codecs
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+# 大于该值的文件使用 mmap 读取
+MMAP_THRESHOLD = 64 * 1024
+
+# 没有 BOM 且不是 UTF-8 时尝试的编码（其他编码的文件需要指定 encoding，见模块说明）
+FALLBACK_ENCODINGS = ('gb18030',)
+
+# BOM 到编码（UTF-32-LE 的 BOM 以 UTF-16-LE 的 BOM 开头，需先判断）
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# 批量读取时预读的文件数和读取线程数
+READAHEAD = 16
+READ_WORKERS = 4
+
+
+class InputError(Exception):
+    """无法读取输入文件"""
+
+    def __init__(self, message: str, path: str = ''):
+        super().__init__(message)
+        self.path = path
+
+
+class InputNotFoundError(InputError, FileNotFoundError):
+    """输入文件不存在"""
+    pass
+
+
+class InputEncodingError(InputError, ValueError):
+    """无法识别输入文件的编码"""
+    pass
+
+
+def detect_bom(data) -> Tuple[Optional[str], int]:
+    """
+    根据 BOM 判断编码
+
+    Args:
+        data: 文件开头（bytes、mmap 等支持切片的对象）
+
+    Returns:
+        (编码, BOM 长度)；没有 BOM 时为 (None, 0)
+    """
+    head = bytes(data[:4])
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return None, 0
+
+
+def _codec_name(encoding: str) -> Optional[str]:
+    try:
+        return codecs.lookup(encoding).name.replace('_', '-')
+    except LookupError:
+        return None
+
+
+def _where(path: str) -> str:
+    return f': {path}' if path else ''
+
+
+def decode(data, encoding: Optional[str] = None, path: str = '') -> Tuple[str, str]:
+    """
+    解码文件内容
+
+    Args:
+        data: 文件内容（bytes、mmap 等支持缓冲区协议的对象，直接解码不复制）
+        encoding: 指定编码；为 None 时按 BOM、UTF-8、FALLBACK_ENCODINGS 的顺序识别
+        path: 文件路径，用于错误信息
+
+    Returns:
+        (文本, 使用的编码)；文本中的换行统一为 \\n，不含 BOM
+
+    Raises:
+        InputEncodingError: 指定的编码或所有候选编码都无法解码
+    """
+    bom_encoding, offset = detect_bom(data)
+    if encoding is not None:
+        candidates = (encoding,)
+        # 指定的编码与 BOM 一致时才去掉 BOM
+        if bom_encoding is None or _codec_name(encoding) != bom_encoding:
+            offset = 0
+    elif bom_encoding is not None:
+        candidates = (bom_encoding,)
+    else:
+        candidates = ('utf-8',) + FALLBACK_ENCODINGS
+
+    with memoryview(data) as view:
+        body = view[offset:] if offset else view
+        try:
+            for candidate in candidates:
+                try:
+                    text = str(body, candidate)
+                except UnicodeDecodeError:
+                    continue
+                except LookupError:
+                    raise InputEncodingError(f'不支持的编码 {candidate}' + _where(path), path)
+                break
+            else:
+                hint = '' if encoding is not None else '，其他编码请指定 encoding'
+                raise InputEncodingError(
+                    f"无法识别文件编码（已尝试 {', '.join(candidates)}{hint}）" + _where(path), path
+                )
+        finally:
+            if body is not view:
+                body.release()
+
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text, candidate
+
+
+def read_text(path: str, encoding: Optional[str] = None) -> str:
+    """
+    读取 Markdown 文件
+
+    Args:
+        path: 文件路径
+        encoding: 指定编码；为 None 时自动识别（见 decode）
+
+    Returns:
+        文件内容
+
+    Raises:
+        InputNotFoundError: 文件不存在
+        InputEncodingError: 无法识别文件编码
+        InputError: 其他读取错误（如没有权限、是目录）
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < MMAP_THRESHOLD:
+                return decode(f.read(), encoding, path)[0]
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return decode(data, encoding, path)[0]
+    except FileNotFoundError:
+        raise InputNotFoundError(f'文件不存在: {path}', path)
+    except (OSError, ValueError) as e:
+        if isinstance(e, InputError):
+            raise
+        raise InputError(f'无法读取 {path}: {getattr(e, "strerror", None) or e}', path)
+
+
+def read_many(paths: Iterable[str], encoding: Optional[str] = None, readahead: int = READAHEAD,
+              workers: int = READ_WORKERS) -> Iterator[Tuple[str, Optional[str], Optional[InputError]]]:
+    """
+    按顺序读取多个文件，在线程池中预读后面的文件
+
+    Args:
+        paths: 文件路径（可以是生成器，按需读取）
+        encoding: 指定编码；为 None 时自动识别
+        readahead: 已开始读取但尚未产出的文件数量上限
+        workers: 读取线程数
+
+    Yields:
+        (路径, 文本, None)；读取失败时为 (路径, None, InputError)
+    """
+    def load(path: str):
+        try:
+            return read_text(path, encoding), None
+        except InputError as e:
+            return None, e
+
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append((path, pool.submit(load, path)))
+            if len(pending) >= max(1, readahead):
+                break
+        while pending:
+            path, future = pending.popleft()
+            text, error = future.result()
+            following = next(paths, None)
+            if following is not None:
+                pending.append((following, pool.submit(load, following)))
+            yield path, text, error
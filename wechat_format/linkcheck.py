@@ -0,0 +1,514 @@
+"""
+外部链接检查
+
+转换时外部链接会变成文末的脚注（见 WeChatFormatter._process_links），失效的链接会原样交给读者。
+`wechat-format links`（或 convert --check-links）在发布前检查一篇文章或一个目录中的所有外部链接：
+
+- 同一批文章中相同的链接只检查一次；所有链接用 asyncio 并发检查，同一主机复用 HTTP/1.1 长连接，
+  并限制总并发数和每个主机的并发数，避免被目标站点限流；
+- 先发送 HEAD 请求，服务器不支持 HEAD 或返回错误时改用 GET（只读取响应头）；跟随重定向；
+- 检查结果缓存在磁盘上（默认 ~/.cache/wechat-format/links.json，可用环境变量
+  WECHAT_FORMAT_LINK_CACHE 指定），有效期内再次检查同一链接时直接使用缓存；
+  超时、5xx 等暂时性错误的结果有效期较短；
+- 同一次检查中无法连接的主机，其余链接不再重复尝试连接；
+- 检查报告为 JSON，可直接用于 CI。
+
+只使用标准库（asyncio、ssl）；链接地址可以是 http://127.0.0.1:端口，便于用本地的 HTTP 服务检验。
+"""
+
+import asyncio
+import html
+import json
+import os
+import re
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, unquote, urljoin, urlsplit
+
+from .ingest import read_many
+from .renderer import get_parser, strip_front_matter
+
+
+# 通过环境变量指定链接检查缓存文件
+CACHE_ENV = 'WECHAT_FORMAT_LINK_CACHE'
+DEFAULT_CACHE_FILE = os.path.join('~', '.cache', 'wechat-format', 'links.json')
+
+# 检查结果的有效期（秒）：确定的结果（正常、失效）和暂时性错误（超时、5xx、429）
+CACHE_TTL = 24 * 3600
+ERROR_TTL = 3600
+
+# 单个请求（连接、发送、读取响应头）的超时（秒）
+DEFAULT_TIMEOUT = 10.0
+
+# 总并发请求数和每个主机的并发请求数（即每个主机的连接池大小）
+CONCURRENCY = 32
+HOST_CONCURRENCY = 4
+
+# 最多跟随的重定向次数
+MAX_REDIRECTS = 5
+
+# 请求头中的 User-Agent（部分站点拒绝没有 User-Agent 的请求）
+USER_AGENT = 'wechat-format-linkcheck/1.0'
+
+# 报告格式的版本
+REPORT_VERSION = 1
+
+# 重定向状态码
+REDIRECT_STATUSES = frozenset({301, 302, 303, 307, 308})
+
+# 检查结果的状态：正常、失效（4xx）、暂时无法确定（网络错误、超时、5xx、429）
+STATES = ('ok', 'broken', 'error')
+
+# 原始 HTML 中的链接地址
+_HREF_RE = re.compile(r'''<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+# 请求行中保留的字符（其余字符按 UTF-8 百分号编码，已编码的 %XX 保持不变）
+_TARGET_SAFE = "/%:@!$&'()*+,;=-._~?"
+
+
+class LinkCheckError(Exception):
+    """单个链接检查失败（原因写入检查结果的 error 字段）"""
+    pass
+
+
+class _HostUnreachable(LinkCheckError):
+    """无法连接到主机（同一次检查中该主机的其余链接直接使用此结果）"""
+    pass
+
+
+def is_external(url: str) -> bool:
+    """是否为需要检查的外部链接（与转换时转为脚注的链接一致：http 或 https）"""
+    return url.lower().startswith(('http://', 'https://'))
+
+
+def extract_links(markdown_text: str) -> List[str]:
+    """
+    提取 Markdown 中的外部链接
+
+    包括行内链接、引用式链接、自动链接和原始 HTML 中的 <a href>，不包括图片。
+
+    Args:
+        markdown_text: Markdown 文本（可以带 front-matter）
+
+    Returns:
+        链接地址列表，按首次出现的顺序去重
+    """
+    links: Dict[str, None] = {}
+    stack = list(reversed(get_parser()(strip_front_matter(markdown_text))))
+    while stack:
+        token = stack.pop()
+        kind = token['type']
+        if kind == 'link':
+            url = token['attrs'].get('url', '')
+            if is_external(url):
+                links[url] = None
+        elif kind in ('inline_html', 'block_html'):
+            for match in _HREF_RE.finditer(token.get('raw', '')):
+                url = html.unescape(next(group for group in match.groups() if group is not None)).strip()
+                if is_external(url):
+                    links[url] = None
+        children = token.get('children')
+        if children:
+            stack.extend(reversed(children))
+    return list(links)
+
+
+def collect_links(files: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    收集多篇文章中的外部链接
+
+    Args:
+        files: Markdown 文件路径
+
+    Returns:
+        链接地址到引用它的文件列表的映射；无法读取的文件会被跳过
+    """
+    sources: Dict[str, List[str]] = {}
+    for path, text, error in read_many(files):
+        if error is not None:
+            continue
+        for url in extract_links(text):
+            sources.setdefault(url, []).append(path)
+    return sources
+
+
+class LinkCache:
+    """链接检查结果的磁盘缓存（单个 JSON 文件），保存时与其他进程写入的结果合并"""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = CACHE_TTL, error_ttl: float = ERROR_TTL):
+        """
+        Args:
+            path: 缓存文件；为 None 时使用环境变量 WECHAT_FORMAT_LINK_CACHE 或
+                ~/.cache/wechat-format/links.json
+            ttl: 确定结果（正常、失效）的有效期（秒）
+            error_ttl: 暂时性错误的有效期（秒）
+        """
+        path = path or os.environ.get(CACHE_ENV) or DEFAULT_CACHE_FILE
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._entries: Optional[Dict[str, dict]] = None
+        self._dirty: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        entries = data.get('links') if isinstance(data, dict) else None
+        return entries if isinstance(entries, dict) else {}
+
+    def _fresh(self, entry, now: float) -> bool:
+        if not isinstance(entry, dict) or not isinstance(entry.get('checked_at'), (int, float)):
+            return False
+        ttl = self.error_ttl if entry.get('state') == 'error' else self.ttl
+        return now - entry['checked_at'] < ttl
+
+    def get(self, url: str) -> Optional[dict]:
+        """读取有效期内的检查结果；未命中或已过期时返回 None"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            entry = self._entries.get(url)
+        if entry is None or not self._fresh(entry, time.time()):
+            return None
+        return dict(entry)
+
+    def put(self, result: dict):
+        """记录检查结果（调用 save() 后写入磁盘）"""
+        entry = {key: value for key, value in result.items() if key not in ('cached', 'sources')}
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            self._entries[result['url']] = entry
+            self._dirty[result['url']] = entry
+
+    def save(self):
+        """写入磁盘：重新读取文件合并其他进程的结果，去掉过期条目，先写临时文件再改名"""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = self._load()
+            for url, entry in self._dirty.items():
+                current = entries.get(url)
+                if not isinstance(current, dict) or current.get('checked_at', 0) <= entry['checked_at']:
+                    entries[url] = entry
+            now = time.time()
+            entries = {url: entry for url, entry in entries.items() if self._fresh(entry, now)}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': REPORT_VERSION, 'links': entries}, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError:
+                return
+            self._entries = entries
+            self._dirty = {}
+
+    def clear(self):
+        """删除缓存文件"""
+        with self._lock:
+            self._entries = {}
+            self._dirty = {}
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class _Connection:
+    __slots__ = ('reader', 'writer')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+HostKey = Tuple[str, str, int]
+
+
+class LinkChecker:
+    """并发检查外部链接（asyncio，每个主机一个连接池）"""
+
+    def __init__(self, cache: Optional[LinkCache] = None, timeout: float = DEFAULT_TIMEOUT,
+                 concurrency: int = CONCURRENCY, host_concurrency: int = HOST_CONCURRENCY,
+                 max_redirects: int = MAX_REDIRECTS, verify: bool = True):
+        """
+        Args:
+            cache: 检查结果缓存；为 None 时不使用缓存
+            timeout: 单个请求的超时（秒）
+            concurrency: 总并发请求数
+            host_concurrency: 每个主机的并发请求数
+            max_redirects: 最多跟随的重定向次数
+            verify: 是否校验 HTTPS 证书
+        """
+        self.cache = cache
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.host_concurrency = max(1, host_concurrency)
+        self.max_redirects = max_redirects
+        self.verify = verify
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def check(self, urls: Iterable[str]) -> List[dict]:
+        """
+        检查链接（在新的事件循环中运行，不能在已运行的事件循环中调用，此时请使用 check_async）
+
+        Args:
+            urls: 链接地址，可以有重复
+
+        Returns:
+            每个链接（去重后）的检查结果，包括 url、state（ok、broken、error）、HTTP 状态码 status、
+            重定向后的地址 final_url、重定向次数 redirects、错误原因 error、耗时 elapsed、
+            检查时间 checked_at 和是否来自缓存 cached
+        """
+        return asyncio.run(self.check_async(urls))
+
+    async def check_async(self, urls: Iterable[str]) -> List[dict]:
+        """check() 的协程版本"""
+        urls = list(dict.fromkeys(urls))
+        results: Dict[str, dict] = {}
+        pending = []
+        for url in urls:
+            cached = self.cache.get(url) if self.cache is not None else None
+            if cached is not None:
+                cached['cached'] = True
+                results[url] = cached
+            else:
+                pending.append(url)
+
+        if pending:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._host_semaphores: Dict[HostKey, asyncio.Semaphore] = {}
+            self._idle: Dict[HostKey, List[_Connection]] = {}
+            self._unreachable: Dict[HostKey, str] = {}
+            try:
+                checked = await asyncio.gather(*(self._check_one(url) for url in pending))
+            finally:
+                for connections in self._idle.values():
+                    for connection in connections:
+                        connection.close()
+                self._idle = {}
+            for result in checked:
+                results[result['url']] = result
+                if self.cache is not None:
+                    self.cache.put(result)
+            if self.cache is not None:
+                self.cache.save()
+        return [results[url] for url in urls]
+
+    async def _check_one(self, url: str) -> dict:
+        started = time.perf_counter()
+        result = {
+            'url': url, 'state': 'error', 'status': None, 'final_url': url, 'redirects': 0,
+            'error': None, 'elapsed': 0.0, 'checked_at': time.time(), 'cached': False,
+        }
+        current = url
+        method = 'HEAD'
+        try:
+            while True:
+                status, headers = await self._fetch(current, method)
+                location = headers.get('location')
+                if status in REDIRECT_STATUSES and location:
+                    if result['redirects'] >= self.max_redirects:
+                        raise LinkCheckError(f'重定向次数超过 {self.max_redirects} 次')
+                    current = urljoin(current, location.strip())
+                    result['redirects'] += 1
+                    continue
+                if method == 'HEAD' and (status >= 400 or status in REDIRECT_STATUSES):
+                    # 不少服务器不支持 HEAD（405、501）或对 HEAD 返回错误，改用 GET 确认
+                    method = 'GET'
+                    continue
+                break
+            result['status'] = status
+            if 200 <= status < 400:
+                result['state'] = 'ok'
+            elif status == 429 or status >= 500:
+                result['error'] = f'HTTP {status}（暂时性错误）'
+            else:
+                result['state'] = 'broken'
+                result['error'] = f'HTTP {status}'
+        except LinkCheckError as e:
+            result['error'] = str(e)
+        result['final_url'] = current
+        result['elapsed'] = round(time.perf_counter() - started, 4)
+        return result
+
+    async def _fetch(self, url: str, method: str) -> Tuple[int, Dict[str, str]]:
+        """发送一个请求并读取响应头（GET 不读取响应体）"""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https') or not parts.hostname:
+            raise LinkCheckError('不是 http 或 https 链接')
+        try:
+            host = unquote(parts.hostname).encode('idna').decode('ascii')
+            port = parts.port or (443 if scheme == 'https' else 80)
+        except (UnicodeError, ValueError):
+            raise LinkCheckError('无效的主机名或端口')
+        key = (scheme, host, port)
+        if key in self._unreachable:
+            raise _HostUnreachable(self._unreachable[key])
+
+        target = quote(parts.path or '/', safe=_TARGET_SAFE)
+        if parts.query:
+            target += '?' + quote(parts.query, safe=_TARGET_SAFE)
+        default_port = (scheme == 'https' and port == 443) or (scheme == 'http' and port == 80)
+        host_header = host if default_port else f'{host}:{port}'
+        if ':' in host and not default_port:
+            host_header = f'[{host}]:{port}'
+        request = (
+            f'{method} {target} HTTP/1.1\r\n'
+            f'Host: {host_header}\r\n'
+            f'User-Agent: {USER_AGENT}\r\n'
+            'Accept: */*\r\n'
+            f'Connection: {"keep-alive" if method == "HEAD" else "close"}\r\n'
+            '\r\n'
+        ).encode('ascii', 'replace')
+
+        semaphore = self._host_semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._host_semaphores[key] = asyncio.Semaphore(self.host_concurrency)
+        async with semaphore, self._semaphore:
+            try:
+                return await asyncio.wait_for(self._exchange(key, request, method), self.timeout)
+            except asyncio.TimeoutError:
+                raise LinkCheckError(f'超时（{self.timeout:g} 秒）')
+
+    async def _exchange(self, key: HostKey, request: bytes, method: str) -> Tuple[int, Dict[str, str]]:
+        idle = self._idle.setdefault(key, [])
+        while idle:
+            connection = idle.pop()
+            if connection.reader.at_eof():
+                connection.close()
+                continue
+            try:
+                return await self._round_trip(key, connection, request, method)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                # 服务器已关闭空闲的长连接，换一个连接重试
+                continue
+
+        connection = await self._connect(key)
+        try:
+            return await self._round_trip(key, connection, request, method)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            raise LinkCheckError(f'读取响应失败: {e or type(e).__name__}')
+
+    async def _connect(self, key: HostKey) -> _Connection:
+        scheme, host, port = key
+        context = self._context() if scheme == 'https' else None
+        try:
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=context, server_hostname=host if context else None
+            )
+        except ssl.SSLError as e:
+            raise LinkCheckError(f'TLS 错误: {e.reason or e}')
+        except (socket.gaierror, ConnectionRefusedError) as e:
+            message = f'无法连接: {e.strerror or e}'
+            self._unreachable[key] = message
+            raise _HostUnreachable(message)
+        except OSError as e:
+            raise LinkCheckError(f'无法连接: {e.strerror or e}')
+        return _Connection(reader, writer)
+
+    def _context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            context = ssl.create_default_context()
+            if not self.verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self._ssl_context = context
+        return self._ssl_context
+
+    async def _round_trip(self, key: HostKey, connection: _Connection, request: bytes,
+                          method: str) -> Tuple[int, Dict[str, str]]:
+        try:
+            connection.writer.write(request)
+            await connection.writer.drain()
+            head = await connection.reader.readuntil(b'\r\n\r\n')
+        except BaseException:
+            connection.close()
+            raise
+        status, headers, keep_alive = _parse_head(head)
+        if method == 'HEAD' and keep_alive:
+            self._idle.setdefault(key, []).append(connection)
+        else:
+            connection.close()
+        return status, headers
+
+
+def _parse_head(head: bytes) -> Tuple[int, Dict[str, str], bool]:
+    """解析响应头，返回 (状态码, 小写名称的响应头, 连接能否复用)"""
+    lines = head.decode('latin-1').split('\r\n')
+    version, _, rest = lines[0].partition(' ')
+    if not version.startswith('HTTP/'):
+        raise ValueError('不是 HTTP 响应')
+    status = int(rest[:3])
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version != 'HTTP/1.0' else connection == 'keep-alive'
+    return status, headers, keep_alive
+
+
+def build_report(results: List[dict], sources: Optional[Dict[str, List[str]]] = None,
+                 elapsed: Optional[float] = None) -> dict:
+    """
+    生成机器可读的检查报告
+
+    Args:
+        results: LinkChecker.check() 的结果
+        sources: 链接地址到引用它的文件列表的映射
+        elapsed: 检查的总耗时（秒）
+
+    Returns:
+        报告，包括版本 version、生成时间 generated_at、总耗时 elapsed、各状态的数量 summary
+        和各链接的结果 links（失效的在前，每条附带引用它的文件 sources）
+    """
+    sources = sources or {}
+    summary = {'total': len(results), 'cached': sum(1 for result in results if result.get('cached'))}
+    for state in STATES:
+        summary[state] = sum(1 for result in results if result['state'] == state)
+    order = {state: index for index, state in enumerate(('broken', 'error', 'ok'))}
+    links = []
+    for result in sorted(results, key=lambda result: order.get(result['state'], len(order))):
+        link = dict(result)
+        link['sources'] = sources.get(result['url'], [])
+        links.append(link)
+    return {
+        'version': REPORT_VERSION,
+        'generated_at': time.time(),
+        'elapsed': None if elapsed is None else round(elapsed, 4),
+        'summary': summary,
+        'links': links,
+    }
+
+
+def audit_files(files: Iterable[str], checker: Optional[LinkChecker] = None) -> dict:
+    """
+    检查多篇文章中的所有外部链接（相同链接只检查一次）
+
+    Args:
+        files: Markdown 文件路径
+        checker: 链接检查器；为 None 时使用默认设置和默认缓存文件
+
+    Returns:
+        检查报告（见 build_report）
+    """
+    checker = checker or LinkChecker(cache=LinkCache())
+    sources = collect_links(files)
+    started = time.perf_counter()
+    results = checker.check(sources)
+    return build_report(results, sources, time.perf_counter() - started)
@@ -0,0 +1,267 @@
+"""
+实时预览会话
+
+Web 编辑器通过 Server-Sent Events（SSE）保持一条长连接接收渲染结果，通过 POST 发送编辑操作，
+无需为每次预览发起一个完整的请求。
+
+- 每个编辑会话在服务端保存当前文档和版本号，客户端只发送变更（替换区间），
+  版本不一致时回退为发送全文。
+- 推送端只渲染最新版本：客户端接收变慢时，写入阻塞，之后直接渲染最新文档，
+  中间的版本被丢弃，不会在服务端积压。
+- 连接断开后 EventSource 自动重连并带上 Last-Event-ID，会话在有效期内保留，
+  重连时恢复文档并推送最新的渲染结果。
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, Tuple
+
+
+# 会话空闲（没有编辑也没有连接）多久后过期（秒）
+SESSION_TTL = 600.0
+
+# 会话数量上限和单个文档的大小上限（UTF-16 码元）
+MAX_SESSIONS = 1000
+MAX_DOCUMENT_SIZE = 1024 * 1024
+
+# 推送端没有新版本时发送心跳的间隔（秒），用于发现已断开的连接
+HEARTBEAT_INTERVAL = 15.0
+
+# 客户端生成的会话 ID
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class LiveError(Exception):
+    """实时预览会话的错误"""
+
+    # 错误原因
+    CONFLICT = 'conflict'
+    INVALID = 'invalid'
+    TOO_LARGE = 'too_large'
+    TOO_MANY = 'too_many'
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class LiveSession:
+    """一个编辑会话：当前文档、版本号和最近一次渲染结果"""
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.text = ''
+        self.version = 0
+        self.touched = time.monotonic()
+        self.listeners = 0
+        self._cond = threading.Condition()
+        # 最近一次渲染：(文档摘要, 事件数据)，文档未变化时直接复用
+        self._rendered: Optional[Tuple[str, dict]] = None
+
+    def apply(self, base: Optional[int], ops: Optional[list] = None, text: Optional[str] = None,
+              length: Optional[int] = None) -> int:
+        """
+        应用一批编辑
+
+        Args:
+            base: 客户端所基于的版本号；给出 text 时可以为 None
+            ops: 替换操作 [起始, 结束, 插入文本] 的列表，位置按 UTF-16 码元计算（与浏览器一致）
+            text: 完整文档，给出时忽略 ops
+            length: 编辑后文档的长度（UTF-16 码元），用于校验
+
+        Returns:
+            新的版本号
+
+        Raises:
+            LiveError: 版本不一致、操作无效或文档过大
+        """
+        with self._cond:
+            if text is not None:
+                if not isinstance(text, str):
+                    raise LiveError(LiveError.INVALID, 'text 必须是字符串')
+                new_text = text
+            else:
+                if base != self.version:
+                    raise LiveError(LiveError.CONFLICT, f'版本不一致：当前版本 {self.version}')
+                new_text = apply_ops(self.text, ops)
+            if length is not None and utf16_length(new_text) != length:
+                raise LiveError(LiveError.CONFLICT, '编辑后的文档长度不一致')
+            if utf16_length(new_text) > MAX_DOCUMENT_SIZE:
+                raise LiveError(LiveError.TOO_LARGE, '文档过大')
+            if new_text != self.text:
+                self.text = new_text
+                self.version += 1
+                self._cond.notify_all()
+            self.touched = time.monotonic()
+            return self.version
+
+    def wait(self, seen: int, timeout: float) -> Optional[Tuple[int, str]]:
+        """
+        等待比 seen 更新的版本
+
+        Returns:
+            (版本号, 文档)；超时时返回 None
+        """
+        with self._cond:
+            if self.version == seen:
+                self._cond.wait(timeout)
+            if self.version == seen:
+                return None
+            return self.version, self.text
+
+    def render(self, text: str, render: Callable[[str], dict]) -> dict:
+        """渲染文档，文档与上次渲染相同时复用结果"""
+        digest = hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+        rendered = self._rendered
+        if rendered is not None and rendered[0] == digest:
+            return rendered[1]
+        data = render(text)
+        self._rendered = (digest, data)
+        return data
+
+    def listen(self, delta: int):
+        """登记（delta=1）或注销（delta=-1）一个推送连接"""
+        with self._cond:
+            self.listeners += delta
+            self.touched = time.monotonic()
+
+    def snapshot(self) -> Tuple[int, str]:
+        with self._cond:
+            return self.version, self.text
+
+
+class SessionStore:
+    """会话表，可在多线程间共享"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: 'OrderedDict[str, LiveSession]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> LiveSession:
+        """
+        获取会话，不存在时创建（服务重启后客户端用原 ID 重连，会得到一个空会话并重新发送全文）
+
+        Raises:
+            LiveError: 会话 ID 无效或会话数量已达上限
+        """
+        if not SESSION_ID_RE.match(session_id or ''):
+            raise LiveError(LiveError.INVALID, '会话 ID 无效')
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    raise LiveError(LiveError.TOO_MANY, '实时预览会话过多，请稍后重试')
+                session = self._sessions[session_id] = LiveSession(session_id)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touched = time.monotonic()
+            return session
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self):
+        now = time.monotonic()
+        # 按最近使用顺序排列，从最久未用的开始检查
+        for session_id, session in list(self._sessions.items()):
+            if now - session.touched < self.ttl:
+                break
+            if session.listeners == 0:
+                del self._sessions[session_id]
+
+
+def utf16_length(text: str) -> int:
+    """文本的 UTF-16 码元数（JavaScript 字符串的 length）"""
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+
+def apply_ops(text: str, ops: Optional[list]) -> str:
+    """
+    依次应用替换操作
+
+    Args:
+        text: 原文档
+        ops: [起始, 结束, 插入文本] 的列表，位置按 UTF-16 码元计算，每个操作基于上一个操作的结果
+
+    Returns:
+        编辑后的文档
+
+    Raises:
+        LiveError: 操作格式错误或位置越界
+    """
+    if not isinstance(ops, list):
+        raise LiveError(LiveError.INVALID, 'ops 必须是列表')
+    if not ops:
+        return text
+    units = text.encode('utf-16-le', 'surrogatepass')
+    for op in ops:
+        if (not isinstance(op, list) or len(op) != 3 or not isinstance(op[2], str)
+                or not all(isinstance(pos, int) and not isinstance(pos, bool) for pos in op[:2])):
+            raise LiveError(LiveError.INVALID, '编辑操作格式应为 [起始, 结束, 插入文本]')
+        start, end, insert = op
+        if not 0 <= start <= end <= len(units) // 2:
+            raise LiveError(LiveError.CONFLICT, '编辑位置超出文档范围')
+        units = units[:start * 2] + insert.encode('utf-16-le', 'surrogatepass') + units[end * 2:]
+    return units.decode('utf-16-le', 'surrogatepass')
+
+
+def format_event(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    """
+    生成一条 SSE 消息
+
+    Args:
+        event: 事件名
+        data: 事件数据（JSON）
+        event_id: 事件 ID（重连时浏览器通过 Last-Event-ID 带回）
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(session: LiveSession, render: Callable[[str], dict],
+           last_event_id: Optional[int] = None,
+           heartbeat: float = HEARTBEAT_INTERVAL) -> Iterator[str]:
+    """
+    生成会话的 SSE 事件流
+
+    首先发送 session 事件（版本号和文档，用于恢复编辑器内容），如果客户端尚未收到最新版本的渲染结果
+    则立即推送一次；之后每当文档更新，只渲染并推送最新版本。
+
+    Args:
+        session: 编辑会话
+        render: 渲染函数，参数为文档，返回 render 事件的数据
+        last_event_id: 客户端已收到的最后一个版本号（重连时）
+        heartbeat: 心跳间隔（秒）
+
+    Yields:
+        SSE 消息
+    """
+    session.listen(1)
+    try:
+        version, text = session.snapshot()
+        yield format_event('session', {'version': version, 'markdown': text})
+        seen = last_event_id if last_event_id is not None and last_event_id <= version else -1
+        if seen != version:
+            seen = version
+            yield format_event('render', session.render(text, render), version)
+        while True:
+            update = session.wait(seen, heartbeat)
+            if update is None:
+                yield ': ping\n\n'
+                continue
+            # 写入阻塞期间到达的版本都已合并，这里总是最新版本
+            seen, text = update
+            yield format_event('render', session.render(text, render), seen)
+    finally:
+        session.listen(-1)
@@ -0,0 +1,368 @@
+"""
+Web 服务压力测试
+
+模拟多位作者同时在编辑器中写作，或按时间回放记录下来的请求日志，
+向 Web 服务发送请求并统计各接口的吞吐量、延迟分位数和错误率，
+供 `wechat-format loadtest` 命令使用。
+
+编辑器模型与 index.html 一致：连续输入时不发请求，停止输入 500ms 后
+（防抖）发送一次预览请求；偶尔点击复制按钮。文档随输入逐渐变长，写完后换一篇新文档。
+请求按计划时间发出、不等待上一次响应（开环），服务过载时测得的延迟不会被低估。
+
+请求日志为 NDJSON，每行一条请求，由 Web 服务的 REQUEST_LOG 配置写入：
+    {"t": 1700000000.0, "path": "/api/convert", "chars": 1234, "options": {"inline": false}}
+日志只记录文章长度和请求选项，不含正文；回放时用基准语料生成同样长度的文章。
+"""
+
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from .bench import _article
+
+
+# index.html 中实时预览的防抖间隔（秒）
+DEBOUNCE = 0.5
+
+# 编辑器模型：每次连续输入的字符数、按键间隔（秒，小于防抖间隔）和输入停顿（秒）
+BURST_CHARS = (3, 40)
+KEY_INTERVAL = (0.05, 0.25)
+PAUSE = (0.2, 4.0)
+
+# 模拟作者写作的文章（字符数约 40K）
+SOURCE_SECTIONS = 60
+
+# 单个请求的超时时间（秒）
+REQUEST_TIMEOUT = 60.0
+
+
+class Sample:
+    """一次请求的测量结果"""
+
+    __slots__ = ('path', 'start', 'latency', 'error')
+
+    def __init__(self, path: str, start: float, latency: float, error: Optional[str] = None):
+        """
+        Args:
+            path: 请求的接口路径
+            start: 发出请求的时间（time.monotonic()）
+            latency: 从发出请求到读完响应的耗时（秒）
+            error: 失败原因；成功时为 None
+        """
+        self.path = path
+        self.start = start
+        self.latency = latency
+        self.error = error
+
+
+class LoadClient:
+    """向 Web 服务发送 JSON 请求并记录结果，可在多线程间共享"""
+
+    def __init__(self, url: str, timeout: float = REQUEST_TIMEOUT):
+        """
+        Args:
+            url: 服务地址，如 http://127.0.0.1:5000
+            timeout: 单个请求的超时时间（秒）
+        """
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.samples: List[Sample] = []
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        # 每个线程保持一个长连接，与浏览器行为一致
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def wait_ready(self, timeout: float = 120.0, path: str = '/api/ready') -> bool:
+        """
+        等待服务就绪（启动预热完成）
+
+        Args:
+            timeout: 最长等待时间（秒）
+            path: 就绪检查接口；返回 404 的旧版本服务视为已就绪
+
+        Returns:
+            是否在超时前就绪
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                conn = self._connection()
+                conn.request('GET', self.prefix + path)
+                response = conn.getresponse()
+                response.read()
+                if response.will_close:
+                    self._reset()
+                if response.status in (200, 404):
+                    return True
+            except (OSError, http.client.HTTPException):
+                self._reset()
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def post(self, path: str, payload: dict) -> Sample:
+        """
+        发送一个 POST 请求并记录结果
+
+        HTTP 状态码不小于 400、连接失败或响应中带有 error 字段时记为失败。
+
+        Args:
+            path: 接口路径，如 /api/convert
+            payload: 请求体（JSON）
+
+        Returns:
+            本次请求的测量结果
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        start = time.monotonic()
+        error = None
+        try:
+            conn = self._connection()
+            conn.request('POST', self.prefix + path, body, headers)
+            response = conn.getresponse()
+            data = response.read()
+            if response.status >= 400:
+                error = f'HTTP {response.status}'
+            else:
+                reply = json.loads(data)
+                if reply.get('error'):
+                    error = str(reply['error'])[:80]
+            if response.will_close:
+                self._reset()
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            error = type(e).__name__
+            self._reset()
+        sample = Sample(path, start, time.monotonic() - start, error)
+        self.samples.append(sample)
+        return sample
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def simulate_editors(client: LoadClient, editors: int = 10, duration: float = 30.0,
+                     copy_rate: float = 0.05, preview_path: str = '/api/convert',
+                     seed: int = 0) -> float:
+    """
+    模拟多位作者同时写作
+
+    Args:
+        client: 请求客户端
+        editors: 同时写作的作者数
+        duration: 持续时间（秒）
+        copy_rate: 每次预览后点击复制的概率
+        preview_path: 预览请求的接口（/api/convert 或 /api/render）
+        seed: 随机数种子，相同种子产生相同的输入节奏
+
+    Returns:
+        实际持续时间（秒）
+    """
+    source = _article(SOURCE_SECTIONS)
+    deadline = time.monotonic() + duration
+    # 作者在开始的一段时间内陆续加入，避免所有请求同时到达
+    ramp = min(5.0, duration / 4)
+    # 预览请求不等待响应，最多同时有 editors * 2 个请求在途
+    sender = ThreadPoolExecutor(max_workers=max(2, editors * 2), thread_name_prefix='loadtest')
+
+    def preview_payload(text: str) -> dict:
+        if preview_path == '/api/render':
+            return {'markdown': text, 'copy': False}
+        return {'markdown': text, 'inline': False}
+
+    def editor(index: int):
+        rng = random.Random(seed * 1000003 + index)
+        pos = rng.randrange(len(source) // 10)
+        sleep_until(time.monotonic() + rng.uniform(0, ramp), deadline)
+        while time.monotonic() < deadline:
+            burst = rng.randint(*BURST_CHARS)
+            if not sleep_until(time.monotonic() + burst * rng.uniform(*KEY_INTERVAL), deadline):
+                break
+            pos += burst
+            if pos >= len(source):
+                # 写完一篇，开始新文章
+                pos = burst
+            pause = rng.uniform(*PAUSE)
+            pause_end = time.monotonic() + pause
+            if pause < DEBOUNCE:
+                sleep_until(pause_end, deadline)
+                continue
+            if not sleep_until(time.monotonic() + DEBOUNCE, deadline):
+                break
+            text = source[:pos]
+            sender.submit(client.post, preview_path, preview_payload(text))
+            if rng.random() < copy_rate:
+                sender.submit(client.post, '/api/copy', {'markdown': text})
+            sleep_until(pause_end, deadline)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=editor, args=(index,), daemon=True) for index in range(editors)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sender.shutdown(wait=True)
+    return time.monotonic() - started
+
+
+def sleep_until(when: float, deadline: float) -> bool:
+    """睡眠到 when；到达 deadline 时提前返回 False"""
+    now = time.monotonic()
+    if when >= deadline:
+        time.sleep(max(0.0, deadline - now))
+        return False
+    time.sleep(max(0.0, when - now))
+    return True
+
+
+def read_log(path: str) -> Iterator[dict]:
+    """
+    读取请求日志
+
+    Args:
+        path: NDJSON 日志文件路径
+
+    Yields:
+        每条请求记录；空行和无法解析的行会被跳过
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 't' in record and 'path' in record:
+                yield record
+
+
+def replay(client: LoadClient, records: List[dict], speed: float = 1.0,
+           concurrency: int = 64) -> float:
+    """
+    按记录的时间间隔回放请求
+
+    Args:
+        client: 请求客户端
+        records: 请求记录（read_log() 的结果）
+        speed: 回放速度倍数，2 表示以两倍速度回放
+        concurrency: 同时在途的请求数上限
+
+    Returns:
+        实际持续时间（秒）
+    """
+    records = sorted(records, key=lambda record: record['t'])
+    if not records:
+        return 0.0
+    source = _article(SOURCE_SECTIONS)
+    origin = records[0]['t']
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='loadtest') as sender:
+        for record in records:
+            delay = started + (record['t'] - origin) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            payload = dict(record.get('options') or {})
+            payload['markdown'] = synthesize(source, int(record.get('chars', 0)))
+            sender.submit(client.post, record['path'], payload)
+    return time.monotonic() - started
+
+
+def synthesize(source: str, chars: int) -> str:
+    """用基准语料生成指定长度的文章"""
+    chars = max(1, chars)
+    repeats = chars // len(source) + 1
+    return (source * repeats)[:chars]
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    # 最近秩法，values 已排序
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> List[dict]:
+    """
+    按接口汇总测量结果
+
+    Args:
+        samples: 测量结果
+        elapsed: 压测持续时间（秒）
+
+    Returns:
+        每个接口一行（最后一行为全部请求的汇总），包括请求数、失败数、错误率、
+        每秒完成的请求数、平均延迟和 p50/p95/p99 延迟（秒），以及最常见的失败原因
+    """
+    groups: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        groups.setdefault(sample.path, []).append(sample)
+    rows = [_summary_row(path, groups[path], elapsed) for path in sorted(groups)]
+    if len(groups) > 1:
+        rows.append(_summary_row('total', samples, elapsed))
+    return rows
+
+
+def _summary_row(path: str, samples: List[Sample], elapsed: float) -> dict:
+    latencies = sorted(sample.latency for sample in samples)
+    errors = Counter(sample.error for sample in samples if sample.error)
+    count = len(samples)
+    return {
+        'path': path,
+        'requests': count,
+        'errors': sum(errors.values()),
+        'error_rate': sum(errors.values()) / count if count else 0.0,
+        'throughput': count / elapsed if elapsed > 0 else 0.0,
+        'mean': sum(latencies) / count if count else 0.0,
+        'p50': _percentile(latencies, 50),
+        'p95': _percentile(latencies, 95),
+        'p99': _percentile(latencies, 99),
+        'top_errors': errors.most_common(3),
+    }
+
+
+@contextmanager
+def serve_app(app, host: str = '127.0.0.1') -> Iterator[str]:
+    """
+    在后台线程中以多线程模式启动 Flask 应用
+
+    Args:
+        app: create_app() 创建的应用
+        host: 监听地址，端口自动分配
+
+    Yields:
+        服务地址
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server(host, 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://{host}:{server.server_port}'
+    finally:
+        server.shutdown()
+        thread.join()
@@ -0,0 +1,285 @@
+"""
+单篇文档的多进程渲染
+
+将 Markdown 在顶层标题处切成分片，在进程池中并行解析和渲染，再按顺序拼接。
+
+- 分片边界：空行之后、位于第 0 列的 ATX 标题。每个分片解析时会带上下一分片的第一行，
+  只有该行被 mistune 解析为顶层标题，才说明顺序解析到这里时处于顶层（不在代码块、
+  HTML 块或列表中），边界才算有效；无效的边界会合并相邻分片后重新处理。
+- 引用式链接定义和脚注定义是全局的：先并行收集各分片的定义，按文档顺序合并
+  （与 mistune 一致，先出现的定义生效），再随每个分片下发。
+- 脚注引用在分片内以占位符输出，拼接时按全局首次引用顺序重新编号，脚注列表在最后统一生成；
+  外部链接的脚注编号由 split.assemble_part 统一处理。
+
+输出与 direct 引擎的顺序渲染逐字节一致。
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+from mistune.plugins.footnotes import md_footnotes_hook
+
+from .document import build_nodes, iter_nodes
+from .formula import restore_nodes
+from .images import ImageSizeCache, probe_local_images
+from .renderer import WeChatRenderer, get_parser, strip_front_matter
+from .sanitize import sanitize_nodes
+from .split import Block, assemble_part
+from .typography import typeset_nodes
+
+
+# 小于该大小（字符数）的文档直接顺序渲染
+MIN_PARALLEL_SIZE = 256 * 1024
+
+# 每个分片的最小字符数，以及平均每个进程分到的分片数（分片越多负载越均衡）
+MIN_CHUNK_SIZE = 32 * 1024
+CHUNKS_PER_WORKER = 4
+
+# 候选边界：空行之后位于第 0 列的 ATX 标题
+_BOUNDARY_RE = re.compile(r'\n[ \t]*\n(?=#{1,6}(?:[ \t]|\n))')
+
+# 可能是引用式链接定义或脚注定义的文本；不存在时无需收集定义
+_DEFINITION_RE = re.compile(r'\[[^\]\n]*\]:')
+
+# 分片内脚注引用编号的占位符：\x01<分片内编号>\x01
+FOOTNOTE_PLACEHOLDER = '\x01{}\x01'
+_FOOTNOTE_PLACEHOLDER_RE = re.compile('\x01(\\d+)\x01')
+
+Definitions = Tuple[Dict[str, dict], Dict[str, str]]
+
+# 工作进程内的状态，由 _init_worker 初始化
+_worker: dict = {}
+
+
+def render_parallel(text: str, styles: Optional[Dict[str, str]] = None,
+                    workers: Optional[int] = None, base_dir: Optional[str] = None,
+                    typography: bool = False, sanitize: bool = False,
+                    formulas: Optional[List[Tuple[str, str]]] = None) -> Optional[str]:
+    """
+    多进程渲染单篇文档
+
+    Args:
+        text: 预处理后的 Markdown 文本
+        styles: 标签到内联样式的映射，为空时不写内联样式
+        workers: 进程数，默认为 CPU 核数
+        base_dir: 本地图片的基准目录；指定后会为本地图片补充宽高属性
+        typography: 是否按中文排版规范整理文本节点
+        sanitize: 是否按白名单过滤原始 HTML
+        formulas: 公式占位符对应的 (公式原文, 渲染结果)；结果中正文里的占位符由调用方替换
+
+    Returns:
+        HTML 片段；文档太小、只有一个分片或进程数不足 2 时返回 None，由调用方顺序渲染
+    """
+    # 与 parse_markdown 和 mistune 的处理顺序一致：先去掉 front-matter，再统一换行符
+    text = strip_front_matter(text).replace('\r\n', '\n').replace('\r', '\n')
+    if '\x00' in text or '\x01' in text:
+        # 与占位符冲突
+        return None
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(text) < MIN_PARALLEL_SIZE:
+        return None
+    bounds = partition(text, max(MIN_CHUNK_SIZE, len(text) // (workers * CHUNKS_PER_WORKER)))
+    if len(bounds) < 2:
+        return None
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(bounds)), initializer=_init_worker,
+                             initargs=(styles, base_dir, typography, sanitize, formulas)) as pool:
+        definitions: Definitions = ({}, {})
+        if _DEFINITION_RE.search(text):
+            bounds, scans = _run_chunks(pool, _scan_chunk, text, bounds)
+            definitions = _merge_definitions(scans)
+        bounds, results = _run_chunks(pool, _render_chunk, text, bounds, definitions)
+
+    return _stitch(results, definitions, styles, base_dir, typography, sanitize, formulas)
+
+
+def partition(text: str, target: int) -> List[Tuple[int, int]]:
+    """
+    在候选边界处将文本切成大约 target 大小的分片
+
+    Args:
+        text: Markdown 文本
+        target: 分片的目标字符数
+
+    Returns:
+        各分片的 (起始, 结束) 位置
+    """
+    bounds = []
+    start = 0
+    for match in _BOUNDARY_RE.finditer(text):
+        end = match.end()
+        if end - start >= target and len(text) - end >= target // 2:
+            bounds.append((start, end))
+            start = end
+    bounds.append((start, len(text)))
+    return bounds
+
+
+def _run_chunks(pool: ProcessPoolExecutor, func, text: str,
+                bounds: List[Tuple[int, int]], *args) -> Tuple[List[Tuple[int, int]], list]:
+    """在进程池中处理各分片，合并边界无效的分片后重试，直到所有边界有效"""
+    results = {}
+    while True:
+        pending = [bound for bound in bounds if bound not in results]
+        chunks = [text[start:end] for start, end in pending]
+        lookaheads = [_first_line(text, end) for _, end in pending]
+        extra = [repeat(arg) for arg in args]
+        for bound, result in zip(pending, pool.map(func, chunks, lookaheads, *extra)):
+            results[bound] = result
+
+        invalid = {index for index, bound in enumerate(bounds) if not results[bound][0]}
+        if not invalid:
+            return bounds, [results[bound] for bound in bounds]
+        merged = []
+        for index, bound in enumerate(bounds):
+            if index - 1 in invalid:
+                merged[-1] = (merged[-1][0], bound[1])
+            else:
+                merged.append(bound)
+        bounds = merged
+
+
+def _first_line(text: str, pos: int) -> str:
+    if pos >= len(text):
+        return ''
+    end = text.find('\n', pos)
+    return text[pos:] + '\n' if end < 0 else text[pos:end + 1]
+
+
+def _merge_definitions(scans: list) -> Definitions:
+    ref_links: Dict[str, dict] = {}
+    ref_footnotes: Dict[str, str] = {}
+    for _, links, notes in scans:
+        for key, value in links.items():
+            ref_links.setdefault(key, value)
+        for key, value in notes.items():
+            ref_footnotes.setdefault(key, value)
+    return ref_links, ref_footnotes
+
+
+def _stitch(results: list, definitions: Definitions, styles: Optional[Dict[str, str]],
+            base_dir: Optional[str], typography: bool = False, sanitize: bool = False,
+            formulas: Optional[List[Tuple[str, str]]] = None) -> str:
+    order: Dict[str, int] = {}
+    blocks: List[Block] = []
+    for _, chunk_blocks, keys in results:
+        mapping = {}
+        for local, key in enumerate(keys, 1):
+            if key not in order:
+                order[key] = len(order) + 1
+            mapping[str(local)] = str(order[key])
+        if mapping:
+            for block in chunk_blocks:
+                block.html = _FOOTNOTE_PLACEHOLDER_RE.sub(lambda m: mapping[m.group(1)], block.html)
+        blocks.extend(chunk_blocks)
+
+    if order:
+        # 脚注列表按全局编号统一生成，位于所有正文之后
+        parser = get_parser()
+        state = _new_state(definitions)
+        state.env['footnotes'] = list(order)
+        nodes = build_nodes(md_footnotes_hook(parser, [], state))
+        if formulas:
+            restore_nodes(nodes, formulas)
+        if sanitize:
+            sanitize_nodes(nodes)
+        if typography:
+            typeset_nodes(nodes)
+        blocks.extend(WeChatRenderer(styles).render_blocks(
+            nodes, image_sizes=_probe_images(nodes, base_dir, ImageSizeCache())
+        ))
+    return assemble_part(blocks)
+
+
+# ---- 工作进程 ----
+
+def _init_worker(styles: Optional[Dict[str, str]], base_dir: Optional[str],
+                 typography: bool = False, sanitize: bool = False,
+                 formulas: Optional[List[Tuple[str, str]]] = None):
+    _worker['renderer'] = WeChatRenderer(styles)
+    _worker['base_dir'] = base_dir
+    _worker['typography'] = typography
+    _worker['sanitize'] = sanitize
+    _worker['formulas'] = formulas
+    _worker['image_sizes'] = ImageSizeCache()
+
+
+def _new_state(definitions: Optional[Definitions] = None):
+    state = get_parser().block.state_cls()
+    if definitions:
+        ref_links, ref_footnotes = definitions
+        state.env['ref_links'].update(ref_links)
+        if ref_footnotes:
+            state.env['ref_footnotes'] = dict(ref_footnotes)
+    return state
+
+
+def _block_parse(text: str, definitions: Optional[Definitions] = None):
+    parser = get_parser()
+    state = _new_state(definitions)
+    if not text.endswith('\n'):
+        text += '\n'
+    state.process(text)
+    for hook in parser.before_parse_hooks:
+        hook(parser, state)
+    parser.block.parse(state)
+    return state
+
+
+def _last_block(tokens: List[dict]) -> int:
+    for index in range(len(tokens) - 1, -1, -1):
+        if tokens[index]['type'] != 'blank_line':
+            return index
+    return -1
+
+
+def _valid_boundary(tokens: List[dict], lookahead: str) -> bool:
+    """带上的下一分片首行是否被解析为顶层标题"""
+    if not lookahead:
+        return True
+    index = _last_block(tokens)
+    return index >= 0 and tokens[index]['type'] == 'heading'
+
+
+def _scan_chunk(text: str, lookahead: str):
+    """块级解析分片，收集其中的链接定义和脚注定义"""
+    state = _block_parse(text + lookahead)
+    if not _valid_boundary(state.tokens, lookahead):
+        return False, None, None
+    return True, state.env.get('ref_links', {}), state.env.get('ref_footnotes', {})
+
+
+def _render_chunk(text: str, lookahead: str, definitions: Definitions):
+    """解析并按顶层块渲染分片，脚注引用编号写为占位符"""
+    parser = get_parser()
+    state = _block_parse(text + lookahead, definitions)
+    if not _valid_boundary(state.tokens, lookahead):
+        return False, None, None
+    if lookahead:
+        del state.tokens[_last_block(state.tokens)]
+
+    for hook in parser.before_render_hooks:
+        hook(parser, state)
+    nodes = build_nodes(parser.render_state(state))
+    for node in iter_nodes(nodes, 'footnote_ref'):
+        node.attrs['index'] = FOOTNOTE_PLACEHOLDER.format(node.attrs['index'])
+    if _worker['formulas']:
+        restore_nodes(nodes, _worker['formulas'])
+    if _worker['sanitize']:
+        sanitize_nodes(nodes)
+    if _worker['typography']:
+        typeset_nodes(nodes)
+
+    image_sizes = _probe_images(nodes, _worker['base_dir'], _worker['image_sizes'])
+    blocks = _worker['renderer'].render_blocks(nodes, image_sizes=image_sizes)
+    return True, blocks, list(state.env.get('footnotes') or [])
+
+
+def _probe_images(nodes, base_dir: Optional[str], cache: ImageSizeCache):
+    if base_dir is None:
+        return None
+    srcs = [node.attrs['url'] for node in iter_nodes(nodes, 'image')]
+    return probe_local_images(srcs, base_dir, cache) if srcs else None
@@ -0,0 +1,334 @@
+"""
+微信公众号 HTML 直出渲染器
+
+直接遍历文档节点树（见 document.py），在渲染时写入内联样式、链接脚注、表格斑马纹和代码块样式，
+一次遍历即可得到最终的微信公众号 HTML，无需再用 BeautifulSoup 二次解析。
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+import mistune
+from mistune.util import escape as escape_html, safe_entity
+
+from .document import Node, build_nodes
+from .split import LINK_PLACEHOLDER, Block
+from .styles import (
+    CODE_BLOCK_CODE_STYLE,
+    CODE_BLOCK_PRE_STYLE,
+    FOOTNOTE_SECTION_STYLE,
+    TABLE_STRIPE_STYLE,
+)
+
+
+# 与 WeChatFormatter.markdown_extras 对应的 mistune 插件
+MISTUNE_PLUGINS = ['strikethrough', 'table', 'task_lists', 'footnotes']
+
+# YAML front-matter（markdown2 的 metadata 扩展会将其剥离）
+_FRONT_MATTER_RE = re.compile(r'\A---[ \t]*\n.*?\n---[ \t]*(?:\n|\Z)', re.DOTALL)
+
+_parser = None
+
+
+def get_parser() -> mistune.Markdown:
+    """获取（并缓存）输出 AST 的 mistune 解析器"""
+    global _parser
+    if _parser is None:
+        _parser = mistune.create_markdown(renderer=None, plugins=MISTUNE_PLUGINS)
+    return _parser
+
+
+def strip_front_matter(text: str) -> str:
+    """去掉开头的 YAML front-matter"""
+    return _FRONT_MATTER_RE.sub('', text, count=1)
+
+
+def parse_markdown(text: str) -> List[Node]:
+    """
+    将 Markdown 文本解析为文档节点
+
+    Args:
+        text: 预处理后的 Markdown 文本
+
+    Returns:
+        顶层节点列表
+    """
+    return build_nodes(get_parser()(strip_front_matter(text)))
+
+
+class _RenderContext:
+    """单次渲染的可变状态，保证同一个渲染器可在多线程间共享"""
+
+    __slots__ = ('out', 'links', 'image_sizes', 'image_srcs', 'defer_links')
+
+    def __init__(self, image_sizes: Optional[Dict[str, Tuple[int, int]]] = None,
+                 image_srcs: Optional[Dict[str, str]] = None, defer_links: bool = False):
+        self.out: List[str] = []
+        self.links: list = []
+        self.image_sizes = image_sizes or {}
+        self.image_srcs = image_srcs or {}
+        # 为 True 时外部链接编号写为占位符，links 记录 (链接文字, 地址)，由 split 模块编号
+        self.defer_links = defer_links
+
+
+class WeChatRenderer:
+    """微信公众号 AST 渲染器"""
+
+    def __init__(self, styles: Optional[Dict[str, str]] = None):
+        """
+        初始化渲染器
+
+        Args:
+            styles: 标签到内联样式的映射（如 WECHAT_INLINE_STYLE），为空时不写内联样式
+        """
+        self.styles = dict(styles or {})
+        self._style_attrs = {
+            tag: f' style="{escape_html(style)}"' for tag, style in self.styles.items()
+        }
+        self._handlers = {
+            name[len('_render_'):]: getattr(self, name)
+            for name in dir(self) if name.startswith('_render_')
+        }
+
+    def render(self, tokens: List[Node],
+               image_sizes: Optional[Dict[str, Tuple[int, int]]] = None,
+               image_srcs: Optional[Dict[str, str]] = None) -> str:
+        """
+        渲染节点为 HTML
+
+        Args:
+            tokens: parse_markdown 返回的节点
+            image_sizes: 图片 src 到 (宽, 高) 的映射，用于写入宽高属性
+            image_srcs: 图片 src 的替换地址（如内嵌的 data URI）
+
+        Returns:
+            最终 HTML 文本
+        """
+        ctx = _RenderContext(image_sizes, image_srcs)
+        self._render_tokens(tokens, ctx)
+        self._render_link_footnotes(ctx)
+        return ''.join(ctx.out)
+
+    def render_blocks(self, tokens: List[Node],
+                      image_sizes: Optional[Dict[str, Tuple[int, int]]] = None,
+                      image_srcs: Optional[Dict[str, str]] = None) -> List[Block]:
+        """
+        按顶层块渲染节点，供按大小拆分文章使用
+
+        Args:
+            tokens: parse_markdown 返回的节点
+            image_sizes: 图片 src 到 (宽, 高) 的映射
+            image_srcs: 图片 src 的替换地址
+
+        Returns:
+            各顶层块的渲染结果，外部链接编号为占位符
+        """
+        blocks = []
+        for token in tokens:
+            if token.type == 'blank_line':
+                continue
+            ctx = _RenderContext(image_sizes, image_srcs, defer_links=True)
+            self._render_tokens([token], ctx)
+            blocks.append(Block(''.join(ctx.out), ctx.links, token.type == 'heading'))
+        return blocks
+
+    # ---- 工具方法 ----
+
+    def _attr(self, tag: str) -> str:
+        return self._style_attrs.get(tag, '')
+
+    def _merged_attr(self, tag: str, extra: str) -> str:
+        style = self.styles.get(tag)
+        if style:
+            extra = f'{style} {extra}'
+        return f' style="{escape_html(extra)}"'
+
+    def _render_tokens(self, tokens: List[Node], ctx: _RenderContext):
+        handlers = self._handlers
+        for token in tokens:
+            handler = handlers.get(token.type)
+            if handler is not None:
+                handler(token, ctx)
+            elif token.children is not None:
+                self._render_tokens(token.children, ctx)
+            elif token.raw is not None:
+                ctx.out.append(safe_entity(token.raw))
+
+    def _wrap(self, tag: str, token: Node, ctx: _RenderContext, newline: str = ''):
+        out = ctx.out
+        out.append(f'<{tag}{self._attr(tag)}>')
+        self._render_tokens(token.children, ctx)
+        out.append(f'</{tag}>{newline}')
+
+    @staticmethod
+    def _plain_text(tokens: List[Node]) -> str:
+        parts = []
+        stack = list(reversed(tokens))
+        while stack:
+            token = stack.pop()
+            if token.children is not None:
+                stack.extend(reversed(token.children))
+            elif token.type in ('text', 'codespan'):
+                parts.append(token.raw)
+            elif token.type == 'softbreak':
+                parts.append('\n')
+        return ''.join(parts)
+
+    # ---- 块级元素 ----
+
+    def _render_blank_line(self, token, ctx):
+        pass
+
+    def _render_paragraph(self, token, ctx):
+        self._wrap('p', token, ctx, '\n')
+
+    def _render_block_text(self, token, ctx):
+        self._render_tokens(token.children, ctx)
+
+    def _render_heading(self, token, ctx):
+        self._wrap(f"h{token.attrs['level']}", token, ctx, '\n')
+
+    def _render_thematic_break(self, token, ctx):
+        ctx.out.append(f"<hr{self._attr('hr')}/>\n")
+
+    def _render_block_quote(self, token, ctx):
+        self._wrap('blockquote', token, ctx, '\n')
+
+    def _render_block_html(self, token, ctx):
+        ctx.out.append(token.raw)
+
+    def _render_block_code(self, token, ctx):
+        ctx.out.append(
+            f'<pre style="{escape_html(CODE_BLOCK_PRE_STYLE)}">'
+            f'<code style="{escape_html(CODE_BLOCK_CODE_STYLE)}">'
+            f"{escape_html(token.raw)}</code></pre>\n"
+        )
+
+    def _render_list(self, token, ctx):
+        attrs = token.attrs
+        tag = 'ol' if attrs.get('ordered') else 'ul'
+        start = attrs.get('start')
+        start_attr = f' start="{start}"' if tag == 'ol' and start not in (None, 1) else ''
+        ctx.out.append(f'<{tag}{start_attr}{self._attr(tag)}>\n')
+        self._render_tokens(token.children, ctx)
+        ctx.out.append(f'</{tag}>\n')
+
+    def _render_list_item(self, token, ctx):
+        self._wrap('li', token, ctx, '\n')
+
+    def _render_task_list_item(self, token, ctx):
+        out = ctx.out
+        out.append(f"<li{self._attr('li')}>")
+        out.append('☑ ' if token.attrs.get('checked') else '☐ ')
+        self._render_tokens(token.children, ctx)
+        out.append('</li>\n')
+
+    def _render_table(self, token, ctx):
+        ctx.out.append(f"<table{self._attr('table')}>\n")
+        self._render_tokens(token.children, ctx)
+        ctx.out.append('</table>\n')
+
+    def _render_table_head(self, token, ctx):
+        out = ctx.out
+        out.append('<thead>\n<tr>\n')
+        self._render_tokens(token.children, ctx)
+        out.append('</tr>\n</thead>\n')
+
+    def _render_table_body(self, token, ctx):
+        out = ctx.out
+        out.append('<tbody>\n')
+        # 表头算第 0 行，正文中的偶数行加背景色
+        for index, row in enumerate(token.children, 1):
+            if index % 2 == 0:
+                out.append(f'<tr style="{TABLE_STRIPE_STYLE}">\n')
+            else:
+                out.append('<tr>\n')
+            self._render_tokens(row.children, ctx)
+            out.append('</tr>\n')
+        out.append('</tbody>\n')
+
+    def _render_table_cell(self, token, ctx):
+        attrs = token.attrs
+        tag = 'th' if attrs.get('head') else 'td'
+        align = attrs.get('align')
+        style_attr = self._merged_attr(tag, f'text-align: {align};') if align else self._attr(tag)
+        ctx.out.append(f'<{tag}{style_attr}>')
+        self._render_tokens(token.children, ctx)
+        ctx.out.append(f'</{tag}>\n')
+
+    def _render_footnotes(self, token, ctx):
+        out = ctx.out
+        out.append(f"<hr{self._attr('hr')}/>\n<ol{self._attr('ol')}>\n")
+        self._render_tokens(token.children, ctx)
+        out.append('</ol>\n')
+
+    def _render_footnote_item(self, token, ctx):
+        self._wrap('li', token, ctx, '\n')
+
+    # ---- 行内元素 ----
+
+    def _render_text(self, token, ctx):
+        ctx.out.append(safe_entity(token.raw))
+
+    def _render_emphasis(self, token, ctx):
+        self._wrap('em', token, ctx)
+
+    def _render_strong(self, token, ctx):
+        self._wrap('strong', token, ctx)
+
+    def _render_strikethrough(self, token, ctx):
+        self._wrap('del', token, ctx)
+
+    def _render_codespan(self, token, ctx):
+        ctx.out.append(f"<code{self._attr('code')}>{escape_html(token.raw)}</code>")
+
+    def _render_linebreak(self, token, ctx):
+        ctx.out.append('<br/>\n')
+
+    def _render_softbreak(self, token, ctx):
+        ctx.out.append('\n')
+
+    def _render_inline_html(self, token, ctx):
+        ctx.out.append(token.raw)
+
+    def _render_footnote_ref(self, token, ctx):
+        ctx.out.append(f"<sup>[{token.attrs['index']}]</sup>")
+
+    def _render_link(self, token, ctx):
+        attrs = token.attrs
+        url = attrs['url']
+        if url.startswith('http'):
+            # 外部链接转为脚注
+            text = self._plain_text(token.children)
+            if ctx.defer_links:
+                ctx.links.append((text, url))
+                ctx.out.append(escape_html(text) + LINK_PLACEHOLDER.format(len(ctx.links)))
+            else:
+                ctx.links.append(f'[{len(ctx.links) + 1}] {text}: {url}')
+                ctx.out.append(f'{escape_html(text)}[{len(ctx.links)}]')
+            return
+        out = ctx.out
+        out.append(f'<a href="{escape_html(url)}"')
+        if attrs.get('title'):
+            out.append(f' title="{safe_entity(attrs["title"])}"')
+        out.append(f"{self._attr('a')}>")
+        self._render_tokens(token.children, ctx)
+        out.append('</a>')
+
+    def _render_image(self, token, ctx):
+        attrs = token.attrs
+        alt = escape_html(self._plain_text(token.children))
+        title = attrs.get('title')
+        title_attr = f' title="{safe_entity(title)}"' if title else ''
+        url = attrs['url']
+        size = ctx.image_sizes.get(url)
+        size_attr = f' width="{size[0]}" height="{size[1]}"' if size else ''
+        src = escape_html(ctx.image_srcs.get(url, url))
+        ctx.out.append(f'<img src="{src}" alt="{alt}"{title_attr}{size_attr}{self._attr("img")}/>')
+
+    def _render_link_footnotes(self, ctx):
+        if ctx.links:
+            ctx.out.append(
+                f'<div style="{FOOTNOTE_SECTION_STYLE}">'
+                f"{escape_html(chr(10).join(ctx.links), quote=False)}</div>"
+            )
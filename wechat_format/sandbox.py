@@ -0,0 +1,372 @@
+"""
+转换沙箱
+
+在独立的工作进程中执行转换，为每次请求限制墙钟时间、CPU 时间和常驻内存（RSS），
+用于 Web 服务处理不受信任的输入：超限的工作进程会被终止并替换为新进程，
+调用方收到 SandboxError，不会因为一篇恶意构造的文章长时间占住服务。
+"""
+
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# 默认限制
+WALL_TIME = 10.0
+CPU_TIME = 10
+MAX_RSS = 512 * 1024 * 1024
+
+# 等待结果时检查工作进程 RSS 的间隔（秒）
+RSS_POLL_INTERVAL = 0.05
+
+# 允许在沙箱中调用的 WeChatFormatter 方法
+ALLOWED_METHODS = {'convert', 'convert_outputs', 'convert_parts'}
+
+
+class SandboxError(Exception):
+    """沙箱中的转换失败"""
+
+    # 超出限制的原因
+    TIMEOUT = 'timeout'
+    CPU = 'cpu'
+    MEMORY = 'memory'
+    CRASHED = 'crashed'
+    BUSY = 'busy'
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _rss(pid: int) -> Optional[int]:
+    """读取进程当前的 RSS（字节）；不支持时返回 None"""
+    try:
+        with open(f'/proc/{pid}/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _self_rss() -> Optional[int]:
+    rss = _rss(os.getpid())
+    if rss is None and resource is not None:
+        # 退而使用峰值 RSS（Linux 为 KB，macOS 为字节）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss = peak if peak > 1 << 32 else peak * 1024
+    return rss
+
+
+def _limit_cpu(cpu_time: int):
+    """将 CPU 时间软限制设为已用时间加上本次请求的额度，超出时内核发送 SIGXCPU 终止进程"""
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_time
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, engine: str, cpu_time: int, max_rss: int):
+    """工作进程主循环：保持一个热格式化器，逐个处理请求"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from .converter import WeChatFormatter
+    from .warmup import warm_up
+
+    formatter = WeChatFormatter(engine=engine)
+    warm_up(formatter)
+    conn.send(('ready', os.getpid()))
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        method, args, kwargs = request
+        _limit_cpu(cpu_time)
+        try:
+            result = getattr(formatter, method)(*args, **kwargs)
+        except MemoryError:
+            conn.send(('error', SandboxError.MEMORY, '内存不足'))
+            return
+        except Exception as e:
+            conn.send(('error', None, str(e)))
+        else:
+            rss = _self_rss()
+            # 调用方传入的计时字典在工作进程中被修改，随结果一起带回
+            conn.send(('ok', result, rss, kwargs.get('timings')))
+            if rss is not None and rss > max_rss:
+                # 结果已返回，但进程内存已超限，退出以便替换
+                return
+
+
+class _Worker:
+    """一个沙箱工作进程"""
+
+    def __init__(self, context, engine: str, cpu_time: int, max_rss: int, startup_timeout: float):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child, engine, cpu_time, max_rss), daemon=True
+        )
+        self.process.start()
+        child.close()
+        try:
+            ready = self.conn.poll(startup_timeout) and self.conn.recv()
+        except (EOFError, OSError):
+            ready = None
+        if not ready:
+            self.kill()
+            raise SandboxError(SandboxError.CRASHED, '沙箱进程启动失败')
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+
+class SandboxPool:
+    """沙箱进程池，可在多线程间共享"""
+
+    def __init__(self, workers: int = 2, engine: str = 'markdown2', wall_time: float = WALL_TIME,
+                 cpu_time: int = CPU_TIME, max_rss: int = MAX_RSS, acquire_timeout: float = None,
+                 start_method: str = 'spawn'):
+        """
+        初始化进程池（工作进程在首次使用时启动）
+
+        Args:
+            workers: 工作进程数
+            engine: 渲染引擎
+            wall_time: 单次请求的墙钟时间上限（秒）
+            cpu_time: 单次请求的 CPU 时间上限（秒，仅 Unix）
+            max_rss: 工作进程的 RSS 上限（字节）
+            acquire_timeout: 等待空闲工作进程的最长时间（秒），默认与 wall_time 相同
+            start_method: multiprocessing 启动方式；默认 spawn，避免在多线程的 Web 服务中 fork
+        """
+        self.size = workers
+        self.engine = engine
+        self.wall_time = wall_time
+        self.cpu_time = max(1, int(cpu_time))
+        self.max_rss = max_rss
+        self.acquire_timeout = wall_time if acquire_timeout is None else acquire_timeout
+        self.startup_timeout = max(30.0, wall_time)
+        self._context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.recycled = 0
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._context, self.engine, self.cpu_time, self.max_rss, self.startup_timeout)
+
+    def start(self):
+        """启动所有工作进程并等待其预热完成（否则在首次使用时启动）"""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _replace(self, worker: _Worker):
+        """终止工作进程，并在后台启动新进程补位"""
+        worker.kill()
+        self.recycled += 1
+
+        def spawn():
+            try:
+                self._idle.put(self._spawn())
+            except SandboxError:
+                # 启动失败时放回一个空位，下次使用时重试
+                self._idle.put(None)
+
+        threading.Thread(target=spawn, daemon=True).start()
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        在沙箱中调用 WeChatFormatter 的方法
+
+        Args:
+            method: 方法名（convert / convert_outputs / convert_parts）
+            *args, **kwargs: 方法参数；关键字参数 timings（字典）在工作进程中记录的耗时会复制回来
+
+        Returns:
+            方法的返回值
+
+        Raises:
+            SandboxError: 超出限制、工作进程崩溃或没有空闲的工作进程
+            Exception: 转换本身抛出的错误（以原始错误信息重新抛出）
+        """
+        if method not in ALLOWED_METHODS:
+            raise ValueError(f'不允许在沙箱中调用: {method}')
+        if self._closed:
+            raise SandboxError(SandboxError.CRASHED, '沙箱已关闭')
+        self._ensure_started()
+
+        try:
+            worker = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise SandboxError(SandboxError.BUSY, '服务繁忙，请稍后重试')
+        if worker is None or not worker.alive:
+            if worker is not None:
+                worker.kill()
+            try:
+                worker = self._spawn()
+            except BaseException:
+                # 启动失败时放回空位，否则进程池会永久少一个工作进程
+                self._idle.put(None)
+                raise
+
+        try:
+            worker.conn.send((method, args, kwargs))
+            reply = self._wait(worker)
+        except BaseException:
+            self._replace(worker)
+            raise
+
+        status = reply[0]
+        if status == 'ok':
+            _, result, rss, timings = reply
+            if timings is not None and isinstance(kwargs.get('timings'), dict):
+                kwargs['timings'].update(timings)
+            if rss is not None and rss > self.max_rss:
+                self._replace(worker)
+            else:
+                self._idle.put(worker)
+            return result
+
+        _, reason, message = reply
+        if reason is not None:
+            self._replace(worker)
+            raise SandboxError(reason, self._describe(reason))
+        self._idle.put(worker)
+        raise Exception(message)
+
+    def convert_many(self, texts: Iterable[str], ordered: bool = True,
+                     max_pending: Optional[int] = None, **options) -> Iterator:
+        """
+        在沙箱中批量转换多篇文章，产出与 batch.convert_many() 相同
+
+        同时进行的转换不超过工作进程数；单篇超限或失败只记录错误，不影响其余文章。
+
+        Args:
+            texts: Markdown 文本的可迭代对象（可以是生成器，按需读取），元素也可以是 (文本, 参数)
+            ordered: 为 True 时按输入顺序产出结果，否则按完成顺序产出
+            max_pending: 已读取但尚未产出的文章数量上限，默认为工作进程数的 2 倍
+            **options: 传给 WeChatFormatter.convert() 的参数
+
+        Yields:
+            每篇文章的 batch.BatchResult
+        """
+        from .batch import BatchResult
+
+        def convert_one(index, text):
+            kwargs = options
+            if isinstance(text, tuple):
+                text, extra = text
+                kwargs = dict(options, **extra)
+            try:
+                return BatchResult(index, self.call('convert', text, **kwargs))
+            except Exception as e:
+                return BatchResult(index, error=str(e))
+
+        max_pending = max(1, max_pending or self.size * 2)
+        items = enumerate(texts)
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=max(1, self.size))
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    pending.append(executor.submit(convert_one, *item))
+                if not pending:
+                    break
+                if ordered:
+                    yield pending.popleft().result()
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda future: future.result().index):
+                    pending.remove(future)
+                    yield future.result()
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的转换
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _wait(self, worker: _Worker):
+        deadline = time.monotonic() + self.wall_time
+        pid = worker.process.pid
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SandboxError(SandboxError.TIMEOUT, self._describe(SandboxError.TIMEOUT))
+            try:
+                if worker.conn.poll(min(remaining, RSS_POLL_INTERVAL)):
+                    return worker.conn.recv()
+            except (EOFError, OSError):
+                worker.process.join(1)
+                raise self._crash_error(worker.process.exitcode)
+            rss = _rss(pid)
+            if rss is not None and rss > self.max_rss:
+                raise SandboxError(SandboxError.MEMORY, self._describe(SandboxError.MEMORY))
+
+    def _crash_error(self, exitcode: Optional[int]) -> SandboxError:
+        if exitcode is not None and exitcode < 0 and -exitcode == getattr(signal, 'SIGXCPU', None):
+            return SandboxError(SandboxError.CPU, self._describe(SandboxError.CPU))
+        return SandboxError(SandboxError.CRASHED, f'转换进程异常退出（退出码 {exitcode}）')
+
+    def _describe(self, reason: str) -> str:
+        if reason == SandboxError.TIMEOUT:
+            return f'转换超时（超过 {self.wall_time:g} 秒），内容可能过于复杂'
+        if reason == SandboxError.CPU:
+            return f'转换 CPU 时间超过 {self.cpu_time} 秒，内容可能过于复杂'
+        if reason == SandboxError.MEMORY:
+            return f'转换内存占用超过 {self.max_rss // (1024 * 1024)}MB，内容可能过大'
+        return '转换进程异常退出'
+
+    def close(self):
+        """停止所有工作进程"""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.stop()
@@ -0,0 +1,347 @@
+"""
+HTML 白名单过滤
+
+Markdown 中的原始 HTML（以及注音、高亮等预处理生成的标签）会原样进入输出，在共享的 Web 服务上
+有 XSS 风险。这里只保留微信公众号接受、样式需要的标签和属性，其余一律去掉：
+
+- SCRIPT_TAGS 中的元素连同内容一起删除（<script>、<iframe> 等）；
+- 其他不在 ALLOWED_TAGS 中的标签只去掉标签本身，保留其中的文字；
+- 属性只保留 GLOBAL_ATTRIBUTES 和 TAG_ATTRIBUTES 中列出的，事件属性（onclick 等）全部去掉；
+- 链接和图片地址只允许 http、https、mailto、tel 和相对地址，图片另外允许 data:image/ 位图；
+- 含 expression()、url()、CSS 转义等的 style 属性整个去掉。
+
+过滤不增加解析和序列化：markdown2 引擎在后处理已有的 BeautifulSoup 文档树上遍历一次（sanitize_soup），
+direct 引擎在文档节点树上遍历一次，只对原始 HTML 节点做流式过滤（sanitize_nodes），
+Markdown 生成的部分本来就由渲染器转义。
+"""
+
+import html
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup, Tag
+from bs4.element import PreformattedString
+
+from .document import Node
+
+
+# 允许的标签
+ALLOWED_TAGS = frozenset({
+    'a', 'abbr', 'b', 'bdi', 'bdo', 'blockquote', 'br', 'caption', 'center', 'cite', 'code', 'col',
+    'colgroup', 'dd', 'del', 'dfn', 'div', 'dl', 'dt', 'em', 'figcaption', 'figure', 'font',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'input', 'ins', 'kbd', 'li', 'mark',
+    'ol', 'p', 'pre', 'q', 'rp', 'rt', 'ruby', 's', 'samp', 'section', 'small', 'span', 'strike',
+    'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul', 'var',
+    'wbr',
+    # 数学公式（formula.py 生成的内联 SVG）
+    'svg', 'path',
+})
+
+# 连同内容一起删除的标签
+SCRIPT_TAGS = frozenset({
+    'script', 'style', 'iframe', 'frame', 'frameset', 'object', 'embed', 'applet', 'noscript',
+    'noembed', 'noframes', 'template', 'textarea', 'select', 'option', 'button', 'form', 'title',
+    'head', 'meta', 'link', 'base', 'xmp', 'plaintext', 'math',
+})
+
+# 没有结束标签的元素
+VOID_TAGS = frozenset({'br', 'col', 'hr', 'img', 'input', 'wbr', 'path'})
+
+# 所有允许的标签都可以带的属性
+GLOBAL_ATTRIBUTES = frozenset({'style', 'class', 'id', 'title', 'lang', 'dir', 'align'})
+
+# 各标签另外允许的属性（html.parser 会把属性名转为小写）
+TAG_ATTRIBUTES: Dict[str, frozenset] = {
+    'a': frozenset({'href', 'name'}),
+    'img': frozenset({'src', 'alt', 'width', 'height'}),
+    'blockquote': frozenset({'cite'}),
+    'q': frozenset({'cite'}),
+    'del': frozenset({'cite', 'datetime'}),
+    'ins': frozenset({'cite', 'datetime'}),
+    'ol': frozenset({'start', 'type', 'reversed'}),
+    'ul': frozenset({'type'}),
+    'li': frozenset({'value'}),
+    'table': frozenset({'width', 'border', 'cellpadding', 'cellspacing'}),
+    'col': frozenset({'span', 'width'}),
+    'colgroup': frozenset({'span', 'width'}),
+    'td': frozenset({'colspan', 'rowspan', 'width', 'valign'}),
+    'th': frozenset({'colspan', 'rowspan', 'width', 'valign', 'scope'}),
+    'font': frozenset({'color', 'size', 'face'}),
+    # 任务列表的复选框（只允许 type="checkbox"，见 clean_attributes）
+    'input': frozenset({'type', 'checked', 'disabled'}),
+    'svg': frozenset({'xmlns', 'width', 'height', 'viewbox', 'role', 'aria-label'}),
+    'path': frozenset({'d', 'fill'}),
+}
+
+# 需要检查地址的属性
+URL_ATTRIBUTES = frozenset({'href', 'src', 'cite'})
+
+# 允许的地址协议（不带协议的相对地址和 #锚点 也允许）
+SAFE_SCHEMES = frozenset({'http', 'https', 'mailto', 'tel'})
+
+_SCHEME_RE = re.compile(r'([a-zA-Z][a-zA-Z0-9+.-]*):')
+# 浏览器解析地址时会忽略其中的空白和控制字符（java\tscript:）
+_URL_IGNORED_RE = re.compile(r'[\x00-\x20\x7f]+')
+_DATA_IMAGE_RE = re.compile(r'data:image/(?:png|jpe?g|gif|webp|bmp);base64,', re.IGNORECASE)
+_UNSAFE_CSS_RE = re.compile(
+    r'expression|url\s*\(|image-set|javascript:|vbscript:|behavior|binding|@import|\\|/\*',
+    re.IGNORECASE
+)
+_ID_RE = re.compile(r'[A-Za-z][\w:.-]*\Z')
+
+# html.parser 转为小写的 SVG 属性，输出时恢复原来的大小写
+_SVG_ATTRIBUTE_CASE = {'viewbox': 'viewBox'}
+
+
+def is_safe_url(url: str, image: bool = False) -> bool:
+    """
+    检查链接或图片地址
+
+    Args:
+        url: 地址（已解码 HTML 实体）
+        image: 是否为图片地址（允许 data:image/ 位图）
+
+    Returns:
+        地址是否安全
+    """
+    url = _URL_IGNORED_RE.sub('', url)
+    match = _SCHEME_RE.match(url)
+    if match is None:
+        return True
+    if match.group(1).lower() in SAFE_SCHEMES:
+        return True
+    return image and _DATA_IMAGE_RE.match(url) is not None
+
+
+def clean_attributes(tag: str, attrs: Dict[str, Optional[str]]) -> Optional[Dict[str, Optional[str]]]:
+    """
+    过滤允许标签的属性
+
+    Args:
+        tag: 标签名（小写）
+        attrs: 属性名到属性值的映射，无值属性（如 checked）的值为 None
+
+    Returns:
+        过滤后的属性；整个元素都不应保留时（如非复选框的 <input>）返回 None
+    """
+    allowed = TAG_ATTRIBUTES.get(tag, ())
+    cleaned = {}
+    for name, value in attrs.items():
+        name = name.lower()
+        if name not in allowed and name not in GLOBAL_ATTRIBUTES:
+            continue
+        if isinstance(value, list):
+            # BeautifulSoup 将 class 解析为列表
+            value = ' '.join(value)
+        if name in URL_ATTRIBUTES:
+            if value is None or not is_safe_url(value, image=tag == 'img'):
+                continue
+        elif name == 'style':
+            if value is None or _UNSAFE_CSS_RE.search(value):
+                continue
+        elif name == 'id':
+            if value is None or not _ID_RE.match(value):
+                continue
+        cleaned[name] = value
+    if tag == 'input' and (cleaned.get('type') or '').lower() != 'checkbox':
+        return None
+    return cleaned
+
+
+def sanitize_soup(soup: BeautifulSoup):
+    """
+    过滤 HTML 文档树（markdown2 引擎，就地修改）
+
+    只遍历一次文档树：删除的元素不再访问其后代，去掉标签的元素其子节点原地保留并照常检查。
+    """
+    node = soup.contents[0] if soup.contents else None
+    while node is not None:
+        if isinstance(node, Tag):
+            name = node.name.lower()
+            if name in SCRIPT_TAGS:
+                following = _skip_subtree(node)
+                node.decompose()
+                node = following
+                continue
+            if name not in ALLOWED_TAGS:
+                following = node.next_element
+                node.unwrap()
+                node = following
+                continue
+            attrs = clean_attributes(name, node.attrs)
+            if attrs is None:
+                following = _skip_subtree(node)
+                node.decompose()
+                node = following
+                continue
+            node.attrs = attrs
+        elif isinstance(node, PreformattedString):
+            # 注释、<!DOCTYPE>、CDATA、处理指令
+            following = node.next_element
+            node.extract()
+            node = following
+            continue
+        node = node.next_element
+
+
+def _skip_subtree(tag: Tag):
+    """元素之后（不含其后代）的第一个节点"""
+    last = tag
+    while isinstance(last, Tag) and last.contents:
+        last = last.contents[-1]
+    return last.next_element
+
+
+class HTMLSanitizer(HTMLParser):
+    """
+    原始 HTML 片段的流式过滤器（direct 引擎）
+
+    依次过滤同一个块中的各个片段，跨片段保持状态：<script> 和 </script> 分属两个行内 HTML 节点时，
+    其间的 Markdown 节点也会被删除（见 dropping）。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._out: List[str] = []
+        # 正在删除的元素及其嵌套层数
+        self._dropping: Optional[str] = None
+        self._depth = 0
+        # 不改变过滤状态的片段（如注音、高亮生成的 <ruby>、</rt>）的过滤结果
+        self._memo: Dict[str, str] = {}
+
+    @property
+    def dropping(self) -> bool:
+        """当前是否位于被删除的元素（如 <script>）中"""
+        return self._dropping is not None
+
+    def reset(self):
+        super().reset()
+        self._out = []
+        self._dropping = None
+        self._depth = 0
+
+    def sanitize(self, fragment: str) -> str:
+        """
+        过滤一个 HTML 片段
+
+        Args:
+            fragment: 原始 HTML（完整或不完整的标签序列）
+
+        Returns:
+            过滤后的 HTML
+        """
+        neutral = self._dropping is None and self.cdata_elem is None
+        if neutral:
+            out = self._memo.get(fragment)
+            if out is not None:
+                return out
+
+        self.feed(fragment)
+        # 处理缓冲的文本；未闭合的标签按文本输出（已转义）
+        self.goahead(True)
+        if self.rawdata:
+            self.handle_data(self.rawdata)
+            self.rawdata = ''
+        out = ''.join(self._out)
+        self._out = []
+        if neutral and self._dropping is None and self.cdata_elem is None:
+            self._memo[fragment] = out
+        return out
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, True)
+
+    def _start(self, tag: str, attrs: list, closed: bool):
+        if self._dropping is not None:
+            if tag == self._dropping and not closed:
+                self._depth += 1
+            return
+        if tag in SCRIPT_TAGS:
+            if not closed and tag not in VOID_TAGS and tag not in ('meta', 'link', 'base'):
+                self._dropping = tag
+                self._depth = 1
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        cleaned = clean_attributes(tag, dict(attrs))
+        if cleaned is None:
+            return
+        out = self._out
+        out.append('<' + tag)
+        for name, value in cleaned.items():
+            name = _SVG_ATTRIBUTE_CASE.get(name, name)
+            if value is None:
+                out.append(' ' + name)
+            else:
+                out.append(f' {name}="{html.escape(value)}"')
+        out.append('/>' if closed else '>')
+
+    def handle_endtag(self, tag):
+        if self._dropping is not None:
+            if tag == self._dropping:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._dropping = None
+            return
+        if tag in ALLOWED_TAGS and tag not in VOID_TAGS:
+            self._out.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        if self._dropping is None:
+            self._out.append(html.escape(data, quote=False))
+
+    # 注释、<!DOCTYPE> 和处理指令直接丢弃
+    def handle_comment(self, data):
+        pass
+
+    def handle_decl(self, decl):
+        pass
+
+    def handle_pi(self, data):
+        pass
+
+    def unknown_decl(self, data):
+        pass
+
+
+def sanitize_nodes(nodes: List[Node]):
+    """
+    过滤文档节点树（direct 引擎，就地修改）
+
+    原始 HTML 节点逐个流式过滤，位于被删除元素中的其他节点一并删除；
+    地址不安全的链接只保留文字，地址不安全的图片删除。每个顶层块单独计算状态，
+    未闭合的 <script> 不会影响后面的块。
+    """
+    sanitizer = HTMLSanitizer()
+    for node in nodes:
+        if node.type == 'block_html':
+            node.raw = sanitizer.sanitize(node.raw or '')
+        elif node.children is not None:
+            _sanitize_children(node.children, sanitizer)
+        sanitizer.reset()
+
+
+def _sanitize_children(children: List[Node], sanitizer: HTMLSanitizer):
+    index = 0
+    while index < len(children):
+        node = children[index]
+        kind = node.type
+        if kind in ('inline_html', 'block_html'):
+            node.raw = sanitizer.sanitize(node.raw or '')
+        elif sanitizer.dropping:
+            del children[index]
+            continue
+        elif kind == 'link' and not is_safe_url(node.attrs.get('url', '')):
+            # 去掉链接，文字原地保留并照常检查
+            children[index:index + 1] = node.children or []
+            continue
+        elif kind == 'image' and not is_safe_url(node.attrs.get('url', ''), image=True):
+            del children[index]
+            continue
+        elif node.children is not None:
+            _sanitize_children(node.children, sanitizer)
+        index += 1
@@ -0,0 +1,149 @@
+"""
+按大小拆分文章
+
+渲染时按顶层块记录 HTML 片段和其中的外部链接，再按字符数或字节数预算
+将块分配到多个部分，优先在标题处拆分。每个部分单独编号链接脚注，
+块只渲染一次，拆分和重新编号都只是字符串拼接。
+"""
+
+import re
+from typing import Callable, Dict, List, Tuple
+
+from mistune.util import escape as escape_html
+
+from .styles import FOOTNOTE_SECTION_STYLE
+
+
+# 块内外部链接的占位符：\x00<块内序号>\x00，组装时替换为 [脚注编号]
+LINK_PLACEHOLDER = '\x00{}\x00'
+_PLACEHOLDER_RE = re.compile('\x00(\\d+)\x00')
+
+_FOOTNOTE_OPEN = f'<div style="{FOOTNOTE_SECTION_STYLE}">'
+_FOOTNOTE_CLOSE = '</div>'
+
+UNITS: Dict[str, Callable[[str], int]] = {
+    'chars': len,
+    'bytes': lambda text: len(text.encode('utf-8')),
+}
+
+
+class Block:
+    """一个顶层块的渲染结果"""
+
+    __slots__ = ('html', 'links', 'is_heading')
+
+    def __init__(self, html: str, links: List[Tuple[str, str]], is_heading: bool = False):
+        """
+        Args:
+            html: 块的 HTML，外部链接编号处为 LINK_PLACEHOLDER
+            links: 块内外部链接的 (链接文字, 地址)，按出现顺序
+            is_heading: 是否为标题块（优先的拆分位置）
+        """
+        self.html = html
+        self.links = links
+        self.is_heading = is_heading
+
+
+class _PartSize:
+    """增量计算一个部分最终 HTML 的大小"""
+
+    def __init__(self, measure: Callable[[str], int]):
+        self.measure = measure
+        self.size = 0
+        self.links = 0
+
+    def cost(self, block: Block) -> int:
+        """加入 block 后该部分增加的大小"""
+        measure = self.measure
+        cost = measure(_PLACEHOLDER_RE.sub('', block.html))
+        number = self.links
+        for text, url in block.links:
+            number += 1
+            cost += measure(f'[{number}]')
+            line = escape_html(f'[{number}] {text}: {url}', quote=False)
+            cost += measure(line) + (1 if number > 1 else 0)
+        if block.links and not self.links:
+            cost += measure(_FOOTNOTE_OPEN) + measure(_FOOTNOTE_CLOSE)
+        return cost
+
+    def add(self, block: Block):
+        self.size += self.cost(block)
+        self.links += len(block.links)
+
+
+def split_blocks(blocks: List[Block], budget: int, unit: str = 'chars') -> List[List[Block]]:
+    """
+    按预算将块分配到多个部分
+
+    超出预算时优先在当前部分中最后一个标题处拆分（该标题之前的内容需至少占预算的一半），
+    否则在当前块之前拆分。单个块超过预算时独占一个部分。
+
+    Args:
+        blocks: 按文档顺序排列的块
+        budget: 每个部分的大小上限
+        unit: 'chars'（字符数）或 'bytes'（UTF-8 字节数）
+
+    Returns:
+        各部分的块列表
+    """
+    if unit not in UNITS:
+        raise ValueError(f"不支持的计量单位: {unit}，可选: {', '.join(UNITS)}")
+    measure = UNITS[unit]
+
+    parts: List[List[Block]] = []
+    current: List[Block] = []
+    size = _PartSize(measure)
+    for block in blocks:
+        if current and size.size + size.cost(block) > budget:
+            cut = _heading_cut(current, budget, measure)
+            parts.append(current[:cut])
+            current = current[cut:]
+            size = _PartSize(measure)
+            for carried in current:
+                size.add(carried)
+            if current and size.size + size.cost(block) > budget:
+                parts.append(current)
+                current = []
+                size = _PartSize(measure)
+        current.append(block)
+        size.add(block)
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _heading_cut(blocks: List[Block], budget: int, measure: Callable[[str], int]) -> int:
+    size = _PartSize(measure)
+    cut = len(blocks)
+    for index, block in enumerate(blocks):
+        if index and block.is_heading and size.size >= budget // 2:
+            cut = index
+        size.add(block)
+    return cut
+
+
+def assemble_part(blocks: List[Block]) -> str:
+    """
+    拼接一个部分的 HTML，并从 1 开始重新编号链接脚注
+
+    Args:
+        blocks: 该部分的块
+
+    Returns:
+        该部分的最终 HTML
+    """
+    out = []
+    footnotes = []
+    for block in blocks:
+        offset = len(footnotes)
+        if block.links:
+            out.append(_PLACEHOLDER_RE.sub(
+                lambda m: f'[{offset + int(m.group(1))}]', block.html
+            ))
+            for text, url in block.links:
+                footnotes.append(f'[{len(footnotes) + 1}] {text}: {url}')
+        else:
+            out.append(block.html)
+    if footnotes:
+        out.append(_FOOTNOTE_OPEN + escape_html('\n'.join(footnotes), quote=False) + _FOOTNOTE_CLOSE)
+    return ''.join(out)
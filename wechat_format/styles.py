@@ -230,4 +230,15 @@ WECHAT_INLINE_STYLE = {
     'td': 'border: 1px solid #ddd; padding: 8px 12px;',
     'img': 'max-width: 100%; height: auto; border-radius: 5px; margin: 1em 0;',
     'hr': 'border: none; height: 2px; background: linear-gradient(to right, transparent, #3498db, transparent); margin: 2em 0;'
-}
\ No newline at end of file
+}
+
+# 后处理阶段使用的固定样式（内联与非内联模式共用）
+CODE_BLOCK_PRE_STYLE = 'background-color: #2c3e50; color: #ecf0f1; padding: 1em; border-radius: 5px; overflow-x: auto; margin: 1em 0;'
+CODE_BLOCK_CODE_STYLE = 'background-color: transparent; color: inherit; font-family: "SFMono-Regular", Consolas, monospace;'
+TABLE_STRIPE_STYLE = 'background-color: #f8f9fa;'
+FOOTNOTE_SECTION_STYLE = 'margin-top: 2em; padding-top: 1em; border-top: 1px solid #ddd; font-size: 14px; color: #666;'
+
+# 数学公式（SVG）的样式：行内公式按基线以下的深度（pt）下移，与正文基线对齐
+MATH_INLINE_STYLE = 'display: inline-block; vertical-align: -{depth}pt; max-width: 100%;'
+MATH_BLOCK_STYLE = 'display: block; margin: 1em auto; max-width: 100%;'
+MATH_ERROR_STYLE = 'color: #c0392b; font-family: monospace;'
@@ -0,0 +1,224 @@
+"""
+请求追踪
+
+Web 服务为每个转换请求记录各阶段的耗时：
+- 写入 Server-Timing 响应头，在浏览器开发者工具的 Network 面板中即可看到耗时分布；
+- 总耗时超过阈值的请求写入慢请求记录（NDJSON，按大小轮转），记录输入的哈希、
+  转换参数和各阶段耗时，可选保存输入本身。
+
+保存了输入的慢请求可以用 `wechat-format slow replay` 在 cProfile 下重新执行，
+复现编辑器反馈的偶发慢预览。
+
+慢请求记录每行一条：
+    {"t": 1700000000.0, "path": "/api/convert", "status": 200, "duration": 1.8,
+     "timings": {"preprocess": 0.01, "markdown": 1.5, ...}, "sha256": "...", "chars": 52000,
+     "engine": "markdown2", "outputs": ["page"], "options": {}, "markdown": "..."}
+"""
+
+import cProfile
+import hashlib
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# 默认的慢请求阈值（秒）
+SLOW_THRESHOLD = 1.0
+
+# 慢请求记录文件的大小上限（字节）和保留的轮转文件数（file.1 ~ file.N）
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 3
+
+# Server-Timing 中各阶段的顺序；其余阶段按名称排在后面
+STAGES = ('cache', 'sandbox', 'preprocess', 'markdown', 'postprocess', 'serialise')
+
+
+def format_server_timing(timings: Dict[str, float], total: Optional[float] = None,
+                         descriptions: Optional[Dict[str, str]] = None) -> str:
+    """
+    生成 Server-Timing 响应头
+
+    Args:
+        timings: 阶段名到耗时（秒）的映射
+        total: 请求总耗时（秒），作为 total 阶段附在最后
+        descriptions: 阶段的说明（如缓存 hit / miss）
+
+    Returns:
+        响应头的值，如 `preprocess;dur=1.20, markdown;dur=35.00, total;dur=40.10`
+    """
+    descriptions = descriptions or {}
+    names = [name for name in STAGES if name in timings or name in descriptions]
+    names += sorted(name for name in timings if name not in STAGES)
+    metrics = []
+    for name in names:
+        metric = name
+        if name in descriptions:
+            metric += f';desc="{descriptions[name]}"'
+        if name in timings:
+            metric += f';dur={timings[name] * 1000:.2f}'
+        metrics.append(metric)
+    if total is not None:
+        metrics.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+def input_hash(markdown_text: str) -> str:
+    """输入的 SHA-256（十六进制）"""
+    return hashlib.sha256(markdown_text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class SlowRequestLog:
+    """慢请求记录文件（NDJSON，超过大小上限时轮转），可在多线程间共享"""
+
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT,
+                 capture_input: bool = False):
+        """
+        Args:
+            path: 记录文件路径
+            max_bytes: 单个文件的大小上限（字节）
+            backup_count: 保留的轮转文件数
+            capture_input: 是否保存输入本身（否则只保存哈希和长度）
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.capture_input = capture_input
+        self._lock = threading.Lock()
+
+    def write(self, record: dict, markdown_text: Optional[str] = None):
+        """
+        写入一条记录
+
+        Args:
+            record: 请求信息和耗时
+            markdown_text: 请求的输入；记录其哈希和长度，capture_input 为 True 时同时保存原文
+        """
+        record = dict(record)
+        if markdown_text is not None:
+            record['sha256'] = input_hash(markdown_text)
+            record['chars'] = len(markdown_text)
+            if self.capture_input:
+                record['markdown'] = markdown_text
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            try:
+                if os.path.getsize(self.path) + len(line.encode('utf-8')) > self.max_bytes:
+                    self._rotate()
+            except OSError:
+                pass
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def _rotate(self):
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f'{self.path}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.path}.{index + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+
+def read_captures(path: str, rotated: bool = True) -> Iterator[dict]:
+    """
+    读取慢请求记录（从最早的轮转文件开始）
+
+    Args:
+        path: 记录文件路径
+        rotated: 是否同时读取轮转出的 path.1、path.2 ……
+
+    Yields:
+        每条记录；无法解析的行会被跳过
+    """
+    paths = []
+    if rotated:
+        index = 1
+        while os.path.exists(f'{path}.{index}'):
+            paths.insert(0, f'{path}.{index}')
+            index += 1
+    if os.path.exists(path):
+        paths.append(path)
+    for file in paths:
+        with open(file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    yield record
+
+
+def replay(records: List[dict], engine: Optional[str] = None, repeat: int = 1,
+           sort: str = 'cumulative', limit: int = 30) -> Tuple[List[dict], str]:
+    """
+    在 cProfile 下重新执行保存了输入的慢请求
+
+    转换不使用任何缓存，与服务端当时的参数（输出、选项、渲染引擎）一致。
+
+    Args:
+        records: 慢请求记录（read_captures() 的结果）；没有保存输入的记录会被跳过
+        engine: 覆盖记录中的渲染引擎
+        repeat: 每条记录重复执行的次数
+        sort: pstats 的排序方式，如 cumulative、tottime
+        limit: 性能分析报告显示的函数数量
+
+    Returns:
+        (每条记录的对比结果, 性能分析报告)。对比结果包括 sha256、path、记录的耗时 recorded、
+        重新执行的平均耗时 replayed 和各阶段耗时 timings；输入与哈希不一致时 error 说明原因
+    """
+    from .converter import WeChatFormatter
+
+    formatters = {}
+    profiler = cProfile.Profile()
+    rows = []
+    for record in records:
+        markdown_text = record.get('markdown')
+        if not isinstance(markdown_text, str):
+            continue
+        row = {
+            'sha256': record.get('sha256', ''),
+            'path': record.get('path', ''),
+            'recorded': record.get('duration'),
+            'replayed': None,
+            'timings': {},
+        }
+        rows.append(row)
+        if row['sha256'] and input_hash(markdown_text) != row['sha256']:
+            row['error'] = '输入与记录的哈希不一致'
+            continue
+
+        name = engine or record.get('engine') or 'markdown2'
+        formatter = formatters.get(name)
+        if formatter is None:
+            formatter = formatters[name] = WeChatFormatter(engine=name)
+        outputs = tuple(record.get('outputs') or ('page',))
+        options = dict(record.get('options') or {})
+        base_dir = options.get('base_dir')
+        if base_dir is not None and not os.path.isdir(base_dir):
+            # 服务端的图片目录在本机不存在时，不探测本地图片
+            options['base_dir'] = None
+
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        try:
+            for _ in range(max(1, repeat)):
+                profiler.runcall(formatter.convert_outputs, markdown_text, outputs,
+                                 timings=timings, **options)
+        except Exception as e:
+            row['error'] = f'{type(e).__name__}: {e}'
+            continue
+        count = max(1, repeat)
+        row['replayed'] = (time.perf_counter() - started) / count
+        row['timings'] = {stage: seconds / count for stage, seconds in timings.items()}
+
+    report = io.StringIO()
+    if any(row['replayed'] is not None for row in rows):
+        stats = pstats.Stats(profiler, stream=report)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return rows, report.getvalue()
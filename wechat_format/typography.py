@@ -0,0 +1,214 @@
+"""
+中文排版规范化
+
+按中文排版习惯整理正文中的文本节点（转换时的可选步骤，只处理文本节点，
+不处理代码、链接地址、原始 HTML 和注音）：
+
+- 中文与西文、数字之间加空格：使用Python3 → 使用 Python3
+- 中文语境中的半角标点改为全角：你好,世界! → 你好，世界！；含中文的括号改为全角括号
+- 行首不出现句末标点：换行后紧跟的，。！？等移到上一行末尾
+
+所有规则合并为一个预编译的正则表达式（字符类即预先计算好的字符表），每个文本节点只扫描一次；
+跨越加粗、链接等行内元素的边界时，由遍历函数带上前一个节点的最后一个字符。
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+from .document import Node
+
+
+# 中日韩文字（不含日文中点 ・，注音中用作音节分隔）
+CJK = (
+    r'\u2e80-\u2eff\u2f00-\u2fdf\u3040-\u309f\u30a0-\u30fa\u30fc-\u30ff\u3100-\u312f'
+    r'\u3200-\u32ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+)
+
+# 西文字母和数字
+LATIN = r'A-Za-z0-9\u00c0-\u024f'
+
+# 不应出现在行首的标点
+CLOSING = '，。、；：！？）》」』】〉”’…'
+
+# 半角标点到全角标点
+FULL_WIDTH = {',': '，', '.': '。', ';': '；', ':': '：', '!': '！', '?': '？'}
+
+# 链接地址中的字符（RFC 3986）
+_URL_CHARS = r"A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%"
+
+_TYPESET_RE = re.compile(
+    # 网址和邮箱地址原样保留
+    rf'(?P<url>(?:[A-Za-z][A-Za-z0-9+.-]*://|www\.)[{_URL_CHARS}]+'
+    rf'|[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)+)'
+    # 中文后紧跟西文
+    rf'|(?P<cjk>[{CJK}])(?=[{LATIN}])'
+    # 西文后紧跟中文
+    rf'|(?P<latin>[{LATIN}%])(?=[{CJK}])'
+    # 中文后的半角标点（句点只在其后是中文、空白或结尾时替换，避免 文件.txt）
+    rf'|(?<=[{CJK}])(?:(?P<punct>[,;:!?]+)|(?P<period>\.)(?=[{CJK}\s]|$))(?P<space>[ \t]*)'
+    # 含中文的半角括号
+    rf'|\((?P<paren>(?=[^()\n]*[{CJK}])[^()\n]*)\)'
+    # 行首的句末标点
+    rf'|(?P<newline>\n[ \t]*)(?P<closing>[{CLOSING}]+)'
+)
+
+_CJK_RE = re.compile(rf'[{CJK}]')
+_LEADING_CLOSING_RE = re.compile(rf'\s*([{CLOSING}]+)')
+
+# 相邻文本节点之间的空格只需要看这两类字符
+_BOUNDARY_RE = re.compile(rf'[{CJK}{LATIN}%]')
+
+# 不处理其中文本的 HTML 元素
+SKIP_TAGS = frozenset({
+    'code', 'pre', 'kbd', 'samp', 'var', 'script', 'style', 'rt', 'rp', 'svg', 'math', 'textarea',
+})
+
+# 行内 HTML 元素：跨越其边界时仍按相邻文字处理
+INLINE_TAGS = frozenset({
+    'a', 'abbr', 'b', 'del', 'em', 'i', 'ins', 'mark', 'ruby', 's', 'small', 'span', 'strike',
+    'strong', 'sub', 'sup', 'u',
+})
+
+# 行内节点（direct 引擎）：其子节点与相邻文字连续
+INLINE_NODES = frozenset({'emphasis', 'strong', 'link', 'strikethrough'})
+
+
+def _replace(match: re.Match) -> str:
+    kind = match.lastgroup
+    if kind == 'url':
+        url = match.group('url')
+        following = match.string[match.end():match.end() + 1]
+        return url + ' ' if following and _CJK_RE.match(following) else url
+    if kind in ('cjk', 'latin'):
+        return match.group(kind) + ' '
+    if kind == 'space':
+        marks = match.group('punct') or match.group('period')
+        return ''.join(FULL_WIDTH[mark] for mark in marks)
+    if kind == 'paren':
+        return '（' + typeset(match.group('paren')) + '）'
+    if kind == 'closing':
+        return match.group('closing') + match.group('newline')
+    return match.group(0)
+
+
+def typeset(text: str, prev: str = '') -> str:
+    """
+    规范化一段文本
+
+    Args:
+        text: 文本节点的内容
+        prev: 同一段落中前一个文本节点的最后一个字符，用于在节点边界加空格
+
+    Returns:
+        规范化后的文本
+    """
+    if prev and _BOUNDARY_RE.match(prev):
+        return _TYPESET_RE.sub(_replace, prev + text)[1:]
+    return _TYPESET_RE.sub(_replace, text)
+
+
+def split_leading_closing(text: str) -> Tuple[str, str]:
+    """拆出文本开头（换行之后）的句末标点，返回 (标点, 其余文本)"""
+    match = _LEADING_CLOSING_RE.match(text)
+    if not match:
+        return '', text
+    return match.group(1), text[:match.start(1)] + text[match.end():]
+
+
+class _NodeState:
+    __slots__ = ('prev', 'last', 'line_start', 'annotation')
+
+    def __init__(self):
+        # 前一个文本节点的最后一个字符、前一个文本节点、是否位于换行之后、是否位于注音中
+        self.prev = ''
+        self.last: Optional[Node] = None
+        self.line_start = False
+        self.annotation = False
+
+
+def typeset_nodes(nodes: List[Node]):
+    """
+    规范化文档节点树中的文本节点（direct 引擎，就地修改）
+
+    代码（codespan、block_code）和原始 HTML 不是文本节点，不受影响；注音 <rt> 中的文字跳过。
+    """
+    for node in nodes:
+        if node.children is not None:
+            _typeset_children(node.children, _NodeState())
+
+
+def _typeset_children(children: List[Node], state: _NodeState):
+    for node in children:
+        kind = node.type
+        if kind == 'text':
+            if state.annotation or not node.raw:
+                continue
+            raw = node.raw
+            if state.line_start and state.last is not None:
+                closing, raw = split_leading_closing(raw)
+                state.last.raw += closing
+            node.raw = typeset(raw, state.prev)
+            state.prev = node.raw[-1:]
+            state.last = node
+            state.line_start = False
+        elif kind in ('softbreak', 'linebreak'):
+            state.prev = ''
+            state.line_start = True
+        elif kind == 'inline_html':
+            tag = (node.raw or '').lower()
+            if tag.startswith(('<rt', '<rp')):
+                state.annotation = True
+            elif tag.startswith(('</rt', '</rp')):
+                state.annotation = False
+            state.prev = ''
+        elif node.children is not None:
+            if kind in INLINE_NODES:
+                _typeset_children(node.children, state)
+            else:
+                _typeset_children(node.children, _NodeState())
+        else:
+            # 行内代码、图片等：不与两侧文字相邻
+            state.prev = ''
+            state.last = None
+            state.line_start = False
+
+
+def typeset_soup(soup: BeautifulSoup):
+    """
+    规范化 HTML 中的文本节点（markdown2 引擎，就地修改）
+
+    跳过 SKIP_TAGS 中的元素（代码、注音等）；同一块级元素中被行内元素隔开的文字按相邻处理。
+    """
+    prev = ''
+    last: Optional[NavigableString] = None
+    for string in list(soup.find_all(string=True)):
+        # 块级元素之间的空白不需要处理
+        if type(string) is not NavigableString or not string or string.isspace():
+            continue
+        if any(parent.name in SKIP_TAGS for parent in string.parents):
+            continue
+
+        # 与上一个文本节点之间只隔着行内元素的开始标签时才视为相邻
+        element = string.previous_element
+        while isinstance(element, Tag) and element.name in INLINE_TAGS:
+            element = element.previous_element
+        adjacent = last is not None and element is last
+        text = str(string)
+
+        sibling = string.previous_sibling
+        if (last is not None and isinstance(sibling, Tag) and sibling.name == 'br'
+                and sibling.previous_element is last):
+            closing, text = split_leading_closing(text)
+            if closing:
+                replaced = NavigableString(str(last) + closing)
+                last.replace_with(replaced)
+
+        result = typeset(text, prev if adjacent else '')
+        if result != str(string):
+            replaced = NavigableString(result)
+            string.replace_with(replaced)
+            string = replaced
+        prev = result[-1:]
+        last = string
@@ -0,0 +1,110 @@
+"""
+启动预热
+
+部署后工作进程的各种缓存和延迟加载的组件都是冷的（mistune 解析器及其插件、markdown2 的正则、
+两种样式的渲染器、样式指纹、公式渲染用的 matplotlib 字体等），最常编辑的文章的第一次预览会明显变慢。
+Web 服务启动时（见 web.create_app）在后台依次：
+
+1. 用一篇覆盖所有语法的示例文章做一次完整转换，加载上述组件；
+2. 启动沙箱工作进程（各工作进程启动时同样转换一次示例文章）；
+3. 可选：从快照文件恢复共享转换缓存（ConversionCache.snapshot() 保存）；
+4. 可选：转换目录中最近修改的文章，预先写入共享转换缓存。
+
+预热完成前 /api/ready 返回 503，负载均衡器不会把请求发给冷的工作进程。
+"""
+
+import os
+import time
+from typing import Dict, List
+
+from .index import find_markdown_files
+
+
+# 预热时转换的示例文章，覆盖所有语法和预处理（注音、高亮、提示框、公式）
+WARMUP_DOCUMENT = """---
+title: 预热
+---
+
+# 标题
+
+## 二级标题
+
+正文包含**加粗**、*斜体*、~~删除线~~、`行内代码`、==高亮==、世界【せかい】、
+[外部链接](https://example.com)、[站内链接](/posts/1)和脚注[^1]，以及公式 $E = mc^2$。
+
+- 列表项
+- [x] 任务
+
+1. 第一步
+2. 第二步
+
+| 功能 | 支持 |
+|:-----|-----:|
+| 表格 | ✅ |
+| 斑马纹 | ✅ |
+
+```python
+print("hello")
+```
+
+> 引用块
+
+:::tip
+提示框
+:::
+
+$$\\int_0^1 x\\,dx$$
+
+---
+
+![图片](image.png "标题")
+
+<span style="color: red;">原始 HTML</span>
+
+[^1]: 脚注内容
+"""
+
+# 默认预先转换的最近文章数量
+DEFAULT_LIMIT = 50
+
+
+def warm_up(formatter) -> float:
+    """
+    用示例文章做一次完整转换，加载所有延迟加载的组件
+
+    Args:
+        formatter: WeChatFormatter
+
+    Returns:
+        耗时（秒）
+    """
+    from .converter import OUTPUTS
+
+    started = time.perf_counter()
+    # 示例文章不写入缓存，也不探测本地图片
+    cache, formatter.cache = formatter.cache, None
+    try:
+        formatter.convert_outputs(WARMUP_DOCUMENT, OUTPUTS, typography=True, sanitize=True, math=True)
+    finally:
+        formatter.cache = cache
+    return time.perf_counter() - started
+
+
+def recent_articles(directory: str, limit: int = DEFAULT_LIMIT) -> List[str]:
+    """
+    目录中最近修改的 Markdown 文章
+
+    Args:
+        directory: 文章目录（递归查找，跳过以 . 开头的目录和文件）
+        limit: 文章数量上限
+
+    Returns:
+        文件路径列表，最近修改的在前
+    """
+    mtimes: Dict[str, float] = {}
+    for path in find_markdown_files(directory):
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except OSError:
+            continue
+    return sorted(mtimes, key=mtimes.get, reverse=True)[:max(0, limit)]
@@ -4,20 +4,341 @@
 提供实时预览和转换功能的 Web 界面。
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from .converter import WeChatFormatter
+from .cache import CACHE_ENV, ConversionCache
+from .compact import compact_html, size_report
+from .images import EMBED_BUDGET, EMBED_MAX_SIZE, ImageRoot
+from .ingest import read_text
+from .live import LiveError, SessionStore, stream as live_stream
+from .sandbox import SandboxError, SandboxPool
+from .tracing import SLOW_THRESHOLD, SlowRequestLog, format_server_timing
+from .warmup import DEFAULT_LIMIT as WARMUP_LIMIT, recent_articles, warm_up
+import json
 import os
+import threading
+import time
 
 
-def create_app():
-    """创建 Flask 应用"""
+def create_app(config: dict = None):
+    """
+    创建 Flask 应用
+    
+    Args:
+        config: 覆盖默认配置的选项；在启动预热之前生效（如 SANDBOX、WARMUP_DIR）
+    """
     app = Flask(__name__)
     
     # 配置
     app.config['SECRET_KEY'] = 'wechat-format-secret-key'
+    # 内嵌图片时，Markdown 中本地图片路径的基准目录；只读取目录内的图片（不接受绝对路径和 file: 地址）
+    app.config['IMAGE_ROOT'] = os.getcwd()
+    # 内嵌图片：请求可指定的单张图片大小（字节）和 data URI 总量（字符）的上限
+    app.config['EMBED_MAX_SIZE'] = EMBED_MAX_SIZE
+    app.config['EMBED_BUDGET'] = EMBED_BUDGET
+    # 批量转换：单次请求的文章数量和请求体大小上限、同时处理的批量请求数（超出时返回 503）；
+    # 启用沙箱时文章在沙箱进程池中转换（与单篇转换共用 SANDBOX_WORKERS 个进程），否则在当前进程内依次转换
+    app.config['BATCH_MAX_ITEMS'] = 1000
+    app.config['BATCH_MAX_BYTES'] = 32 * 1024 * 1024
+    app.config['BATCH_CONCURRENCY'] = 2
+    # 转换沙箱：单篇转换在独立进程中执行，限制墙钟时间（秒）、CPU 时间（秒）和 RSS（字节）
+    app.config['SANDBOX'] = True
+    app.config['SANDBOX_WORKERS'] = 2
+    app.config['SANDBOX_WALL_TIME'] = 10.0
+    app.config['SANDBOX_CPU_TIME'] = 10
+    app.config['SANDBOX_MAX_RSS'] = 512 * 1024 * 1024
+    # 共享转换缓存：SQLite 文件路径，多进程部署时各进程共用；为 None 时不缓存
+    app.config['CACHE_PATH'] = os.environ.get(CACHE_ENV)
+    app.config['CACHE_MAX_BYTES'] = 256 * 1024 * 1024
+    # 实时预览：会话数量上限和空闲会话的过期时间（秒）
+    app.config['LIVE_MAX_SESSIONS'] = 1000
+    app.config['LIVE_SESSION_TTL'] = 600.0
+    # 请求日志：设置为文件路径后，每个转换请求追加一行 NDJSON（只记录文章长度和选项，不含正文），
+    # 可用 `wechat-format loadtest --replay` 回放
+    app.config['REQUEST_LOG'] = None
+    # 请求追踪：转换请求的响应带 Server-Timing 头（各阶段耗时）；
+    # 设置 SLOW_REQUEST_LOG 后，总耗时超过阈值（秒）的请求写入慢请求记录（按大小轮转），
+    # SLOW_REQUEST_CAPTURE_INPUT 为 True 时同时保存输入，可用 `wechat-format slow replay` 重新执行
+    app.config['SERVER_TIMING'] = True
+    app.config['SLOW_REQUEST_LOG'] = None
+    app.config['SLOW_REQUEST_THRESHOLD'] = SLOW_THRESHOLD
+    app.config['SLOW_REQUEST_CAPTURE_INPUT'] = False
+    app.config['SLOW_REQUEST_LOG_MAX_BYTES'] = 10 * 1024 * 1024
+    app.config['SLOW_REQUEST_LOG_BACKUPS'] = 3
+    # 中文排版规范化（中西文间加空格、全角标点、行首标点）的默认值，请求可用 typography 字段覆盖
+    app.config['TYPOGRAPHY'] = False
+    # 将 $...$ 和 $$...$$ 渲染为公式 SVG（需要 matplotlib）的默认值，请求可用 math 字段覆盖
+    app.config['MATH'] = False
+    # 按白名单过滤 Markdown 中的原始 HTML（去掉脚本、事件属性和危险地址），由服务端决定，请求不能关闭
+    app.config['SANITIZE'] = True
+    # 启动预热：创建应用后在后台加载各组件、启动沙箱进程，完成前 /api/ready 返回 503；
+    # 可选从快照恢复共享缓存（CACHE_SNAPSHOT），并预先转换目录中最近修改的 WARMUP_LIMIT 篇文章
+    # （WARMUP_DIR，写入共享缓存，需要设置 CACHE_PATH）
+    app.config['WARMUP'] = True
+    app.config['WARMUP_DIR'] = None
+    app.config['WARMUP_LIMIT'] = WARMUP_LIMIT
+    app.config['CACHE_SNAPSHOT'] = None
+    app.config.update(config or {})
     
     # 初始化格式化器
     formatter = WeChatFormatter()
+    resources = {}
+    sandbox_lock = threading.Lock()
+    
+    def get_cache():
+        path = app.config['CACHE_PATH']
+        if not path:
+            return None
+        cache = resources.get('cache')
+        if cache is None or cache.path != os.path.abspath(os.path.expanduser(path)):
+            cache = resources['cache'] = ConversionCache(path, app.config['CACHE_MAX_BYTES'])
+        return cache
+    
+    def image_root():
+        """本地图片的基准目录（受限于 IMAGE_ROOT）"""
+        return ImageRoot(app.config['IMAGE_ROOT'])
+    
+    def typography_enabled(data):
+        """请求是否启用中文排版规范化（未指定时使用 TYPOGRAPHY 配置）"""
+        return _flag(data.get('typography', app.config['TYPOGRAPHY']))
+    
+    def math_enabled(data):
+        """请求是否渲染数学公式（未指定时使用 MATH 配置）"""
+        return _flag(data.get('math', app.config['MATH']))
+    
+    def get_batch_slots():
+        with sandbox_lock:
+            slots = resources.get('batch_slots')
+            if slots is None:
+                slots = resources['batch_slots'] = threading.BoundedSemaphore(
+                    max(1, app.config['BATCH_CONCURRENCY'])
+                )
+        return slots
+    
+    def get_pool():
+        with sandbox_lock:
+            pool = resources.get('pool')
+            if pool is None:
+                pool = resources['pool'] = SandboxPool(
+                    workers=app.config['SANDBOX_WORKERS'],
+                    engine=formatter.engine,
+                    wall_time=app.config['SANDBOX_WALL_TIME'],
+                    cpu_time=app.config['SANDBOX_CPU_TIME'],
+                    max_rss=app.config['SANDBOX_MAX_RSS'],
+                )
+        return pool
+    
+    def run_conversion(markdown_text, outputs, **options):
+        """
+        执行转换，返回 convert_outputs() 的结果：先查共享缓存，未命中时启用沙箱则在
+        沙箱进程中转换，否则在当前进程内转换
+        """
+        options['sanitize'] = app.config['SANITIZE']
+        trace = g.get('trace')
+        timings = None
+        if trace is not None:
+            trace['conversion'] = {
+                'engine': formatter.engine, 'outputs': list(outputs), 'options': options
+            }
+            timings = trace['timings']
+        
+        cache = get_cache()
+        key = None
+        if cache is not None:
+            started = time.perf_counter()
+            key = formatter.cache_key(markdown_text, outputs, **options)
+            results = cache.get(key)
+            if timings is not None:
+                timings['cache'] = time.perf_counter() - started
+                trace['descriptions']['cache'] = 'miss' if results is None else 'hit'
+            if results is not None:
+                return results
+        
+        if app.config['SANDBOX']:
+            pool = get_pool()
+            stages = {} if timings is not None else None
+            started = time.perf_counter()
+            results = pool.call('convert_outputs', markdown_text, outputs, timings=stages, **options)
+            if timings is not None:
+                # 沙箱阶段为进程间传递输入和结果的开销
+                elapsed = time.perf_counter() - started
+                timings['sandbox'] = max(0.0, elapsed - sum(stages.values()))
+                timings.update(stages)
+        else:
+            results = formatter.convert_outputs(markdown_text, outputs, timings=timings, **options)
+        
+        if key is not None:
+            cache.put(key, results)
+        return results
+    
+    def get_sessions():
+        with sandbox_lock:
+            sessions = resources.get('sessions')
+            if sessions is None:
+                sessions = resources['sessions'] = SessionStore(
+                    app.config['LIVE_MAX_SESSIONS'], app.config['LIVE_SESSION_TTL']
+                )
+        return sessions
+    
+    def render_live(markdown_text):
+        """实时预览的渲染结果（render 事件的数据）"""
+        if not markdown_text.strip():
+            return {'success': True, 'preview': None}
+        try:
+            outputs = run_conversion(
+                markdown_text, ('page',), base_dir=image_root(),
+                typography=app.config['TYPOGRAPHY'], math=app.config['MATH']
+            )
+            return {'success': True, 'preview': outputs['page']}
+        except SandboxError as e:
+            return {'success': False, 'error': str(e), 'reason': e.reason}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def traced_json(result):
+        """生成 JSON 响应，并计入 serialise 阶段"""
+        started = time.perf_counter()
+        response = jsonify(result)
+        trace = g.get('trace')
+        if trace is not None:
+            timings = trace['timings']
+            timings['serialise'] = timings.get('serialise', 0.0) + time.perf_counter() - started
+        return response
+    
+    def get_slow_log():
+        path = app.config['SLOW_REQUEST_LOG']
+        if not path:
+            return None
+        slow_log = resources.get('slow_log')
+        if slow_log is None or slow_log.path != os.path.abspath(os.path.expanduser(path)):
+            slow_log = resources['slow_log'] = SlowRequestLog(
+                path, app.config['SLOW_REQUEST_LOG_MAX_BYTES'], app.config['SLOW_REQUEST_LOG_BACKUPS']
+            )
+        slow_log.capture_input = app.config['SLOW_REQUEST_CAPTURE_INPUT']
+        return slow_log
+    
+    @app.before_request
+    def start_trace():
+        """开始记录转换请求的各阶段耗时"""
+        if request.path in LOGGED_PATHS:
+            g.trace = {
+                'started': time.perf_counter(),
+                'timings': {},
+                'descriptions': {},
+                'conversion': None,
+            }
+    
+    @app.after_request
+    def finish_trace(response):
+        """写入 Server-Timing 头，记录慢请求"""
+        trace = g.pop('trace', None)
+        if trace is None:
+            return response
+        total = time.perf_counter() - trace['started']
+        if app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = format_server_timing(
+                trace['timings'], total, trace['descriptions']
+            )
+        slow_log = get_slow_log()
+        if slow_log is not None and total >= app.config['SLOW_REQUEST_THRESHOLD']:
+            data = request.get_json(silent=True)
+            markdown_text = data.get('markdown') if isinstance(data, dict) else None
+            record = {
+                't': time.time(),
+                'path': request.path,
+                'status': response.status_code,
+                'duration': total,
+                'timings': trace['timings'],
+            }
+            if trace['descriptions']:
+                record['descriptions'] = trace['descriptions']
+            if trace['conversion'] is not None:
+                record.update(trace['conversion'])
+            try:
+                slow_log.write(record, markdown_text if isinstance(markdown_text, str) else None)
+            except OSError:
+                # 记录失败不影响响应
+                pass
+        return response
+    
+    log_lock = threading.Lock()
+    
+    @app.after_request
+    def log_request(response):
+        """记录转换请求（匿名）"""
+        log_path = app.config['REQUEST_LOG']
+        if log_path and request.path in LOGGED_PATHS:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                record = {
+                    't': time.time(),
+                    'path': request.path,
+                    'chars': len(str(data.get('markdown', ''))),
+                    'options': {key: value for key, value in data.items()
+                                if key != 'markdown' and isinstance(value, (bool, int, float))},
+                    'status': response.status_code,
+                }
+                with log_lock:
+                    with open(log_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record) + '\n')
+        return response
+    
+    warmup = {'ready': not app.config['WARMUP'], 'stages': {}, 'articles': 0, 'errors': []}
+    
+    def run_warmup():
+        """启动预热（后台线程）：加载组件、启动沙箱、恢复缓存快照、预先转换最近的文章"""
+        stages = warmup['stages']
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                stages['components'] = warm_up(formatter)
+                if app.config['SANDBOX']:
+                    stage_started = time.perf_counter()
+                    get_pool().start()
+                    stages['sandbox'] = time.perf_counter() - stage_started
+                
+                cache = get_cache()
+                if cache is not None and app.config['CACHE_SNAPSHOT']:
+                    stage_started = time.perf_counter()
+                    try:
+                        warmup['restored'] = cache.restore(app.config['CACHE_SNAPSHOT'])
+                    except Exception as e:
+                        warmup['errors'].append(f'恢复缓存快照失败: {e}')
+                    stages['snapshot'] = time.perf_counter() - stage_started
+                
+                directory = app.config['WARMUP_DIR']
+                if cache is not None and directory:
+                    stage_started = time.perf_counter()
+                    for path in recent_articles(directory, app.config['WARMUP_LIMIT']):
+                        try:
+                            markdown_text = read_text(path)
+                            # 与实时预览和 /api/render 的默认参数一致，缓存键相同
+                            options = {
+                                'base_dir': image_root(),
+                                'typography': app.config['TYPOGRAPHY'],
+                                'math': app.config['MATH'],
+                            }
+                            run_conversion(markdown_text, ('page',), **options)
+                            run_conversion(
+                                markdown_text, ('inline', 'page', 'text'), compact=False, **options
+                            )
+                            warmup['articles'] += 1
+                        except Exception as e:
+                            warmup['errors'].append(f'{path}: {e}')
+                    stages['articles'] = time.perf_counter() - stage_started
+            except Exception as e:
+                # 预热失败不影响服务，只是首批请求较慢
+                warmup['errors'].append(str(e))
+        warmup['seconds'] = time.perf_counter() - started
+        warmup['ready'] = True
+    
+    if app.config['WARMUP']:
+        threading.Thread(target=run_warmup, name='wechat-format-warmup', daemon=True).start()
+    
+    @app.route('/api/ready')
+    def api_ready():
+        """就绪检查：启动预热完成前返回 503"""
+        return jsonify(warmup), 200 if warmup['ready'] else 503
     
     @app.route('/')
     def index():
@@ -39,13 +360,61 @@ def create_app():
                 })
             
             # 转换
-            html = formatter.convert(markdown_text, inline_style=inline_style)
+            output = 'inline' if inline_style else 'page'
+            html = run_conversion(
+                markdown_text, (output,), typography=typography_enabled(data),
+                math=math_enabled(data)
+            )[output]
             
-            return jsonify({
+            result = {
                 'success': True,
                 'html': html
+            }
+            if data.get('compact', False):
+                result['html'] = compact_html(html)
+                result['stats'] = size_report(html, result['html'])
+            
+            return traced_json(result)
+            
+        except SandboxError as e:
+            return _sandbox_error(e)
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
             })
+    
+    @app.route('/api/render', methods=['POST'])
+    def api_render():
+        """渲染 API：解析一次，同时返回预览页面、剪切板 HTML 和纯文本，可选复制到剪切板"""
+        try:
+            data = request.get_json()
+            markdown_text = data.get('markdown', '')
+            
+            if not markdown_text.strip():
+                return jsonify({
+                    'success': False,
+                    'error': 'Markdown 内容不能为空'
+                })
             
+            outputs = run_conversion(
+                markdown_text, ('inline', 'page', 'text'), base_dir=image_root(),
+                compact=data.get('compact', False), typography=typography_enabled(data),
+                math=math_enabled(data)
+            )
+            result = {
+                'success': True,
+                'preview': outputs['page'],
+                'clipboard': outputs['inline'],
+                'text': outputs['text']
+            }
+            if data.get('copy', False):
+                result['copied'] = formatter.copy_to_clipboard(outputs['inline'])
+            
+            return traced_json(result)
+            
+        except SandboxError as e:
+            return _sandbox_error(e)
         except Exception as e:
             return jsonify({
                 'success': False,
@@ -66,23 +435,258 @@ def create_app():
                 })
             
             # 转换并复制
-            html, success = formatter.convert_and_copy(markdown_text)
+            embed_kwargs = {}
+            if data.get('embed_images', False):
+                embed_kwargs['embed_images'] = True
+                for name in ('embed_max_size', 'embed_budget'):
+                    # 请求可以调低，但不能超过服务端配置的上限
+                    limit = app.config[name.upper()]
+                    embed_kwargs[name] = min(max(int(data.get(name, limit)), 0), limit)
+            html = run_conversion(
+                markdown_text, ('inline',), base_dir=image_root(),
+                typography=typography_enabled(data), math=math_enabled(data), **embed_kwargs
+            )['inline']
+            stats = None
+            if data.get('compact', False):
+                compacted = compact_html(html)
+                stats = size_report(html, compacted)
+                html = compacted
+            success = formatter.copy_to_clipboard(html)
             
-            return jsonify({
+            result = {
                 'success': success,
                 'html': html,
                 'message': '已复制到剪切板，可直接粘贴到微信公众号编辑器' if success else '复制失败，请手动复制'
-            })
+            }
+            if stats:
+                result['stats'] = stats
             
+            return traced_json(result)
+            
+        except SandboxError as e:
+            return _sandbox_error(e)
         except Exception as e:
             return jsonify({
                 'success': False,
                 'error': str(e)
             })
     
+    @app.route('/api/live/<session_id>', methods=['POST'])
+    def api_live_edit(session_id):
+        """实时预览：提交一批编辑（{base, ops} 或 {text}），渲染结果通过事件流推送"""
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': '请求体必须是 JSON 对象'}), 400
+        try:
+            version = get_sessions().get(session_id).apply(
+                data.get('base'), data.get('ops'), data.get('text'), data.get('length')
+            )
+        except LiveError as e:
+            return _live_error(e)
+        return jsonify({'success': True, 'version': version})
+    
+    @app.route('/api/live/<session_id>/events')
+    def api_live_events(session_id):
+        """实时预览：SSE 事件流（session 事件恢复文档，render 事件推送最新的渲染结果）"""
+        try:
+            session = get_sessions().get(session_id)
+        except LiveError as e:
+            return _live_error(e)
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        events = live_stream(
+            session, render_live, int(last_event_id) if last_event_id.isdigit() else None
+        )
+        return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # 禁止反向代理缓冲事件流
+            'X-Accel-Buffering': 'no',
+        })
+    
+    @app.route('/api/batch', methods=['POST'])
+    def api_batch():
+        """批量转换 API
+        
+        请求体为 JSON 数组，或 {"documents": [...], "inline": ..., "compact": ...}，
+        或每行一篇的 NDJSON（Content-Type: application/x-ndjson，选项通过查询参数传递）。
+        每篇文章可以是 Markdown 字符串，或 {"id": ..., "markdown": ...}。
+        
+        响应为 NDJSON：每篇文章转换完成后立即输出一行 {"index", "id", "success", "html" / "error"}，
+        最后一行为 {"done": true, "count", "failed"}。
+        """
+        max_items = app.config['BATCH_MAX_ITEMS']
+        max_bytes = app.config['BATCH_MAX_BYTES']
+        if request.content_length is not None and request.content_length > max_bytes:
+            return jsonify({
+                'success': False,
+                'error': f'请求体超过上限 {max_bytes} 字节'
+            }), 413
+        
+        options = request.args.to_dict()
+        if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+            items = _iter_ndjson(request.stream, max_bytes)
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                options.update(data)
+                data = data.get('documents')
+            if not isinstance(data, list):
+                return jsonify({
+                    'success': False,
+                    'error': '请求体应为文章数组、{"documents": [...]} 或 NDJSON'
+                }), 400
+            if len(data) > max_items:
+                return jsonify({
+                    'success': False,
+                    'error': f'文章数量超过上限 {max_items}'
+                }), 413
+            items = iter(data)
+        
+        inline_style = _flag(options.get('inline', False))
+        compact = _flag(options.get('compact', False))
+        typography = _flag(options.get('typography', app.config['TYPOGRAPHY']))
+        math = math_enabled(options)
+        
+        slots = get_batch_slots()
+        if not slots.acquire(blocking=False):
+            return jsonify({
+                'success': False,
+                'error': '同时进行的批量转换过多，请稍后重试'
+            }), 503
+        released = []
+        
+        def release():
+            # 响应结束（或客户端断开）时释放名额，只释放一次
+            if not released:
+                released.append(True)
+                slots.release()
+        
+        def convert_items(texts):
+            convert_options = dict(
+                inline_style=inline_style, compact=compact, typography=typography, math=math,
+                sanitize=app.config['SANITIZE']
+            )
+            if app.config['SANDBOX']:
+                return get_pool().convert_many(texts, ordered=False, **convert_options)
+            return formatter.convert_many(texts, workers=1, **convert_options)
+        
+        def generate():
+            ids = {}
+            invalid = {}
+            truncated = []
+            
+            def texts():
+                for index, item in enumerate(items):
+                    if index >= max_items:
+                        truncated.append(f'文章数量超过上限 {max_items}，其余文章未处理')
+                        return
+                    text, ids[index], error = _batch_item(item)
+                    if error:
+                        invalid[index] = error
+                    yield text
+            
+            count = failed = 0
+            try:
+                for result in convert_items(texts()):
+                    line = {'index': result.index, 'id': ids.pop(result.index, None)}
+                    error = invalid.pop(result.index, None) or result.error
+                    if error:
+                        line.update(success=False, error=error)
+                        failed += 1
+                    else:
+                        line.update(success=True, html=result.html)
+                    count += 1
+                    yield json.dumps(line, ensure_ascii=False) + '\n'
+            except ValueError as e:
+                # 请求体超限等读取错误
+                truncated.append(str(e))
+            except Exception as e:
+                # 其他错误也要输出汇总行，客户端据此判断响应是否完整
+                truncated.append(f'{type(e).__name__}: {e}')
+            finally:
+                release()
+            
+            summary = {'done': True, 'count': count, 'failed': failed}
+            if truncated:
+                summary['error'] = truncated[0]
+            yield json.dumps(summary, ensure_ascii=False) + '\n'
+        
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.call_on_close(release)
+        return response
+    
     return app
 
 
+# 写入请求日志的接口
+LOGGED_PATHS = ('/api/convert', '/api/render', '/api/copy')
+
+
+def _sandbox_error(error: SandboxError):
+    """沙箱转换失败的响应：繁忙时 503，超出限制时 422"""
+    status = 503 if error.reason == SandboxError.BUSY else 422
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'reason': error.reason
+    }), status
+
+
+def _live_error(error: LiveError):
+    """实时预览错误的响应：版本冲突时客户端应重新发送全文"""
+    status = {LiveError.CONFLICT: 409, LiveError.TOO_LARGE: 413, LiveError.TOO_MANY: 503}.get(error.reason, 400)
+    result = {'success': False, 'error': str(error), 'reason': error.reason}
+    if error.reason == LiveError.CONFLICT:
+        result['conflict'] = True
+    return jsonify(result), status
+
+
+def _flag(value) -> bool:
+    """解析布尔选项（JSON 布尔值或查询参数字符串）"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def _iter_ndjson(stream, max_bytes: int):
+    """逐行读取 NDJSON 请求体，读取量超过 max_bytes 时抛出 ValueError"""
+    total = 0
+    for raw in stream:
+        total += len(raw)
+        if total > max_bytes:
+            raise ValueError(f'请求体超过上限 {max_bytes} 字节，其余文章未处理')
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            yield json.loads(raw)
+        except ValueError as e:
+            yield _InvalidItem(f'无法解析的 JSON 行: {e}')
+
+
+class _InvalidItem:
+    """NDJSON 中无法解析的行"""
+    
+    def __init__(self, error: str):
+        self.error = error
+
+
+def _batch_item(item) -> tuple:
+    """
+    解析批量请求中的一篇文章
+    
+    Returns:
+        (Markdown 文本, id, 错误信息)；无效的文章以空文本占位
+    """
+    if isinstance(item, _InvalidItem):
+        return '', None, item.error
+    if isinstance(item, str):
+        return item, None, None
+    if isinstance(item, dict) and isinstance(item.get('markdown'), str):
+        return item['markdown'], item.get('id'), None
+    item_id = item.get('id') if isinstance(item, dict) else None
+    return '', item_id, '文章应为 Markdown 字符串或包含 markdown 字段的对象'
+
+
 # 模板文件内容
 TEMPLATE_INDEX = """<!DOCTYPE html>
 <html lang="zh-CN">
@@ -353,10 +957,18 @@ print('Hello, WeChat!')
         const demoBtn = document.getElementById('demo-btn');
         const status = document.getElementById('status');
         
+        const placeholder = '<div class="demo-content">在左侧输入 Markdown 内容，这里会实时显示转换后的效果。</div>';
+        
+        // 实时预览：通过 SSE 长连接接收渲染结果，编辑以增量方式发送；浏览器不支持时退回防抖请求
+        const live = window.EventSource ? startLivePreview() : null;
         let convertTimeout;
         
         // 实时转换（防抖）
         markdownInput.addEventListener('input', function() {
+            if (live) {
+                live.schedule();
+                return;
+            }
             clearTimeout(convertTimeout);
             convertTimeout = setTimeout(convertMarkdown, 500);
         });
@@ -370,29 +982,137 @@ print('Hello, WeChat!')
         // 示例按钮
         demoBtn.addEventListener('click', loadDemo);
         
-        function convertMarkdown() {
-            const markdown = markdownInput.value;
-            
-            if (!markdown.trim()) {
-                previewContent.innerHTML = '<div class="demo-content">在左侧输入 Markdown 内容，这里会实时显示转换后的效果。</div>';
-                return;
-            }
-            
-            fetch('/api/convert', {
+        function renderMarkdown(markdown, copy) {
+            return fetch('/api/render', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
                     markdown: markdown,
-                    inline: false
+                    copy: copy
                 })
             })
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    previewContent.innerHTML = data.html;
+                    previewContent.innerHTML = data.preview;
+                }
+                return data;
+            });
+        }
+        
+        function startLivePreview() {
+            let sessionId = sessionStorage.getItem('wechat-format-live');
+            if (!sessionId) {
+                sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2)
+                    + Math.random().toString(36).slice(2);
+                sessionStorage.setItem('wechat-format-live', sessionId);
+            }
+            const url = '/api/live/' + sessionId;
+            let version = 0;
+            let sentText = null;  // 服务端已确认的文档；为 null 时发送全文
+            let sending = false;
+            let timer = null;
+            
+            function schedule() {
+                if (!timer) {
+                    timer = setTimeout(send, 100);
+                }
+            }
+            
+            function send() {
+                timer = null;
+                const text = markdownInput.value;
+                if (sending || text === sentText) {
+                    return;
+                }
+                let body;
+                if (sentText === null) {
+                    body = {text: text};
                 } else {
+                    // 只发送变化的区间
+                    const max = Math.min(sentText.length, text.length);
+                    let start = 0;
+                    while (start < max && sentText.charCodeAt(start) === text.charCodeAt(start)) {
+                        start++;
+                    }
+                    let end = 0;
+                    while (end < max - start && sentText.charCodeAt(sentText.length - 1 - end) === text.charCodeAt(text.length - 1 - end)) {
+                        end++;
+                    }
+                    body = {base: version, ops: [[start, sentText.length - end, text.slice(start, text.length - end)]]};
+                }
+                body.length = text.length;
+                
+                sending = true;
+                let retry = false;
+                fetch(url, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify(body)
+                })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.success) {
+                        version = data.version;
+                        sentText = text;
+                        retry = true;
+                    } else if (data.conflict) {
+                        sentText = null;
+                        retry = true;
+                    } else {
+                        showStatus('转换失败: ' + data.error, 'error');
+                    }
+                })
+                .catch(error => {
+                    sentText = null;
+                    showStatus('网络错误: ' + error.message, 'error');
+                })
+                .finally(() => {
+                    sending = false;
+                    if (retry && markdownInput.value !== sentText) {
+                        schedule();
+                    }
+                });
+            }
+            
+            const source = new EventSource(url + '/events');
+            source.addEventListener('session', event => {
+                const data = JSON.parse(event.data);
+                if (!markdownInput.value.trim() && data.markdown) {
+                    // 刷新页面后恢复会话中的文档
+                    markdownInput.value = data.markdown;
+                }
+                version = data.version;
+                sentText = data.markdown;
+                schedule();
+            });
+            source.addEventListener('render', event => {
+                const data = JSON.parse(event.data);
+                if (data.success) {
+                    previewContent.innerHTML = data.preview || placeholder;
+                } else {
+                    showStatus('转换失败: ' + data.error, 'error');
+                }
+            });
+            
+            return {schedule: schedule};
+        }
+        
+        function convertMarkdown() {
+            const markdown = markdownInput.value;
+            
+            if (!markdown.trim()) {
+                previewContent.innerHTML = placeholder;
+                return;
+            }
+            
+            renderMarkdown(markdown, false)
+            .then(data => {
+                if (!data.success) {
                     showStatus('转换失败: ' + data.error, 'error');
                 }
             })
@@ -409,21 +1129,13 @@ print('Hello, WeChat!')
                 return;
             }
             
-            fetch('/api/copy', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    markdown: markdown
-                })
-            })
-            .then(response => response.json())
+            // 预览和复制共用一次渲染
+            renderMarkdown(markdown, true)
             .then(data => {
-                if (data.success) {
+                if (data.success && data.copied) {
                     showStatus('✅ 已复制到剪切板，可直接粘贴到微信公众号后台', 'success');
                 } else {
-                    showStatus('复制失败: ' + (data.error || data.message), 'error');
+                    showStatus('复制失败: ' + (data.error || '请手动复制'), 'error');
                 }
             })
             .catch(error => {
@@ -471,7 +1183,11 @@ formatter.copy_to_clipboard(html)
 *现在点击"复制到剪切板"按钮试试吧！*`;
             
             markdownInput.value = demoContent;
-            convertMarkdown();
+            if (live) {
+                live.schedule();
+            } else {
+                convertMarkdown();
+            }
             showStatus('示例内容已加载', 'success');
         }
         
@@ -485,8 +1201,10 @@ formatter.copy_to_clipboard(html)
             }, 3000);
         }
         
-        // 初始转换
-        convertMarkdown();
+        // 初始转换（实时预览连接建立后由服务端推送）
+        if (!live) {
+            convertMarkdown();
+        }
     </script>
 </body>
 </html>"""